@@ -0,0 +1,84 @@
+"""
+Demand-aware distribution of the BE CPU quota across containers
+
+Current assumptions:
+ - Usage and throttling are deltas over the last quota cycle, from cgroup accounting
+ - A throttled container wants more than its quota, by an unknown amount
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+def Fill(alloc, amount, limits):
+  """ Water-fills amount into alloc, raising the lowest allocations first, none above its limit
+      returns the amount left over once every allocation reached its limit
+  """
+  keys = sorted([k for k in alloc if limits[k] > alloc[k]], key=lambda k: limits[k] - alloc[k])
+  while keys and amount > 0:
+    share = amount / float(len(keys))
+    k = keys[0]
+    room = limits[k] - alloc[k]
+    if room > share:
+      # everyone left can take an equal share
+      for k in keys:
+        alloc[k] += share
+      return 0.0
+    # the smallest room is filled, spread the rest over the others
+    for k in keys:
+      alloc[k] += room
+    amount -= room * len(keys)
+    keys = [k for k in keys[1:] if limits[k] > alloc[k]]
+    keys.sort(key=lambda k: limits[k] - alloc[k])
+  return max(amount, 0.0)
+
+
+def WaterFill(budget, demands, floor, cap):
+  """ Distributes budget over containers: each gets at least floor, then demands are met
+      smallest first, and what is left is spread evenly, none above cap
+      returns {key: quota}
+  """
+  if not demands:
+    return {}
+  n = len(demands)
+  if budget <= floor * n:
+    return dict([(k, budget / float(n)) for k in demands])
+  alloc = dict([(k, float(floor)) for k in demands])
+  wanted = dict([(k, min(max(d, floor), cap)) for k, d in demands.items()])
+  left = Fill(alloc, budget - floor * n, wanted)
+  Fill(alloc, left, dict([(k, cap) for k in demands]))
+  return alloc
+
+
+class Allocator(object):
+  """This class estimates the CPU demand of BE containers and splits the BE budget by water-filling.
+
+     Demand is the usage of the last cycle plus a headroom. A container that
+     was throttled used all of its quota, so its demand is its quota scaled
+     up by the share of periods it was throttled in. Idle containers keep
+     only what they use, and the rest of the budget goes to those that were
+     throttled, instead of every container growing by the same factor.
+  """
+  def __init__(self, ncpu, headroom=0.1, throttle_boost=1.0):
+    self.ncpu = ncpu
+    self.headroom = headroom
+    self.throttle_boost = throttle_boost
+
+
+  def demand(self, cont):
+    """ Estimated CPU demand of a container, in quota units (us per 100ms period)
+    """
+    used = cont.cpu_percent / 100.0 * self.ncpu * 100000
+    demand = used * (1 + self.headroom)
+    if cont.nr_throttled > 0 and cont.nr_periods > 0:
+      ratio = min(float(cont.nr_throttled) / cont.nr_periods, 1.0)
+      demand = max(demand, max(cont.quota, used) * (1 + self.throttle_boost * ratio))
+    return demand
+
+
+  def allocate(self, budget, conts, floor, cap):
+    """ Splits budget over {key: cont}, returns {key: quota}
+    """
+    demands = dict([(k, self.demand(c)) for k, c in conts.items()])
+    return dict([(k, int(q)) for k, q in WaterFill(budget, demands, floor, cap).items()])
@@ -0,0 +1,40 @@
+import unittest
+import allocator as al
+
+class Cont(object):
+    def __init__(self, cpu_percent, quota, nr_throttled=0, nr_periods=20):
+        self.cpu_percent = cpu_percent
+        self.quota = quota
+        self.nr_throttled = nr_throttled
+        self.nr_periods = nr_periods
+
+class TestAllocatorMethods(unittest.TestCase):
+    def test_waterfill(self):
+        alloc = al.WaterFill(100, {'a': 10, 'b': 30, 'c': 200}, 5, 80)
+        self.assertAlmostEqual(alloc['a'], 10)
+        self.assertAlmostEqual(alloc['b'], 30)
+        self.assertAlmostEqual(alloc['c'], 60)
+        # demands met, the rest is spread evenly up to the cap
+        alloc = al.WaterFill(150, {'a': 10, 'b': 30}, 5, 80)
+        self.assertAlmostEqual(alloc['a'], 70)
+        self.assertAlmostEqual(alloc['b'], 80)
+        # budget below the floors
+        self.assertEqual(al.WaterFill(9, {'a': 10, 'b': 30, 'c': 0}, 5, 80),
+                         {'a': 3.0, 'b': 3.0, 'c': 3.0})
+
+    def test_throughput(self):
+        # 4 cores; one busy container throttled at its quota, two idle ones
+        ncpu = 4
+        conts = {'busy': Cont(25.0, 100000, 20), 'idle1': Cont(1.0, 100000), 'idle2': Cont(1.0, 100000)}
+        true_demand = {'busy': 250000, 'idle1': 4000, 'idle2': 4000}
+        budget = 300000
+        a = al.Allocator(ncpu)
+        alloc = a.allocate(budget, conts, 5000, 380000)
+        self.assertLessEqual(sum(alloc.values()), budget)
+        self.assertGreater(alloc['busy'], 200000)
+        uniform = sum([min(budget / 3, d) for d in true_demand.values()])
+        waterfill = sum([min(alloc[k], d) for k, d in true_demand.items()])
+        self.assertGreater(waterfill, uniform)
+
+if __name__ == '__main__':
+    unittest.main()
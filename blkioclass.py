@@ -2,7 +2,7 @@
 Blkio utilies class
 
 Current assumptions:
- - Blkio is enabled in cgroups
+ - Blkio (v1) or io (v2) is enabled in cgroups
  - Single block device throttld for now
  - Symmetric read/write throttling for now
 
@@ -12,8 +12,6 @@ __author__ = "Christos Kozyrakis"
 __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
-import os
-
 class BlkioClass(object):
   """This class performs IO bandwidth isolation using blkio I/O throttling.
 
@@ -24,14 +22,17 @@ class BlkioClass(object):
         https://fritshoogland.wordpress.com/2012/12/15/throttling-io-with-linux/
 
   """
-  def __init__(self, block_dev, max_rd_iops, max_wr_iops):
+  def __init__(self, block_dev, max_rd_iops, max_wr_iops, cgroup):
     self.block_dev = block_dev
     self.max_rd_iops = max_rd_iops
     self.max_wr_iops = max_wr_iops
+    self.cgroup = cgroup
     self.keys = set()
+    # (read, write) IOPS limit per container last set, None if not limited
+    self.limit = None
 
     # check if blockio is active
-    if not os.path.isdir('/sys/fs/cgroup/blkio/kubepods'):
+    if not cgroup.exists('kubepods', 'blkio'):
       raise Exception('Blkio not configured for K8S')
 
 
@@ -41,10 +42,15 @@ class BlkioClass(object):
     if cont_key in self.keys:
       raise Exception('Duplicate blkio throttling request %s' % cont_key)
     # check if blockio is active
-    directory = '/sys/fs/cgroup/blkio/' + cont_key
-    if not os.path.isdir(directory):
+    if not self.cgroup.exists(cont_key, 'blkio'):
       print 'Blkio:WARNING: Blkio not setup correctly for container (add): '+ cont_key
     self.keys.add(cont_key)
+    # throttle it right away with the last limit, until the next setIopsLimit
+    if self.limit is not None:
+      try:
+        self.cgroup.setIoLimit(cont_key, self.block_dev, self.limit[0], self.limit[1])
+      except EnvironmentError as e:
+        print 'Blkio:WARNING: Blkio not setup correctly for container (limit) %s: %s' % (cont_key, e)
 
 
   def removeBeCont(self, cont_key):
@@ -56,6 +62,16 @@ class BlkioClass(object):
       self.keys.remove(cont_key)
 
 
+  @staticmethod
+  def beIopsLimit(max_iops, hp_iops):
+    """ BE IOPS limit: what HP leaves of the max IOPS, minus a margin
+    """
+    limit = max_iops - hp_iops - max(0.05*max_iops, 0.10*hp_iops)
+    if limit < 0.0:
+      limit = 0.0
+    return limit
+
+
   def setIopsLimit(self, riops, wiops):
     """ Sets rad/write IOPS limit for BE containers
     """
@@ -72,80 +88,38 @@ class BlkioClass(object):
     rlimit = (int)(riops/len(self.keys))
     wlimit = (int)(wiops/len(self.keys))
 
-    # set the limit for every container
+    # set the limit for every container, 0 would remove it
+    rlimit = max(rlimit, 1)
+    wlimit = max(wlimit, 1)
+    self.limit = (rlimit, wlimit)
     for cont in self.keys:
-      directory = '/sys/fs/cgroup/blkio/' + cont
-      rfile = directory + '/blkio.throttle.read_iops_device'
-      wfile = directory + '/blkio.throttle.write_iops_device'
-      if not os.path.isdir(directory) or \
-         not os.path.isfile(rfile) or \
-         not os.path.isfile(wfile):
-        print 'Blkio:WARNING: Blkio not setup correctly for container (limit): '+ cont
-        continue
-      # throttle string
-      rcmd = self.block_dev + ' ' + str(rlimit)
-      wcmd = self.block_dev + ' ' + str(wlimit)
-      # read limit
       try:
-        with open(rfile, "w") as _:
-          _.write(rcmd)
-        with open(wfile, "w") as _:
-          _.write(wcmd)
+        self.cgroup.setIoLimit(cont, self.block_dev, rlimit, wlimit)
       except EnvironmentError as e:
-        print 'Blkio:WARNING: cannot not setup correctly for container (limit): '+ e
+        print 'Blkio:WARNING: Blkio not setup correctly for container (limit) %s: %s' % (cont, e)
         continue
 
 
   def getIopUsed(self, cont_key):
     """ Find IOPS used for an active container
     """
-    rpattern = self.block_dev + ' Read'
-    wpattern = self.block_dev + ' Write'
-
-    # check if directory and stats file exists
-    directory = '/sys/fs/cgroup/blkio/' + cont_key
-    if not os.path.isdir(directory):
+    # one read of the IO stats of all devices
+    try:
+      stats = self.cgroup.ioStat(cont_key)
+    except (EnvironmentError, ValueError):
       print 'Blkio:WARNING: Blkio not configured for container %s' %(cont_key)
       return 0, 0
-    stats_file = directory + '/blkio.throttle.io_serviced'
-    if not os.path.isfile(stats_file):
-      print 'Blkio:WARNING: Blkio not configured for container %s' %(cont_key)
-      return 0, 0
-    # read and parse iops
-    with open(stats_file) as _:
-      lines = _.readlines()
-    riop = 0
-    wiop = 0
-    for _ in lines:
-      if _.startswith(rpattern):
-        riop = int(_.split()[2])
-      if _.startswith(wpattern):
-        wiop = int(_.split()[2])
-      if riop and wiop:
-        break
-
-    return riop, wiop
+    dev = stats.get(self.block_dev, {})
+    return dev.get('rios', 0), dev.get('wios', 0)
 
   def clearIopsLimit(self):
     """ Clears rad/write IOPS limit for BE containers
     """
-    # set the limit for every container
+    # clear the limit for every container
+    self.limit = None
     for cont in self.keys:
-      directory = '/sys/fs/cgroup/blkio/' + cont
-      rfile = directory + '/blkio.throttle.read_iops_device'
-      wfile = directory + '/blkio.throttle.write_iops_device'
-      if not os.path.isdir(directory) or \
-         not os.path.isfile(rfile) or \
-         not os.path.isfile(wfile):
-        print 'Blkio:WARNING: Blkio not setup correctly for container (limit): '+ cont
-        continue
-      # throttle string
-      cmd = ''
       try:
-        with open(rfile, "w") as _:
-          _.write(cmd)
-        with open(wfile, "w") as _:
-          _.write(cmd)
+        self.cgroup.setIoLimit(cont, self.block_dev, 0, 0)
       except EnvironmentError as e:
-        print 'Blkio:WARNING: cannot not clear correctly for container (limit): '+ e
+        print 'Blkio:WARNING: cannot not clear correctly for container (limit) %s: %s' % (cont, e)
         continue
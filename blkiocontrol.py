@@ -13,7 +13,6 @@ __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
 # standard
-import time
 import datetime as dt
 
 # hyperpilot imports
@@ -28,12 +27,23 @@ def BlkioControll():
   if st.verbose:
     print "Blkio: Starting BlkioControl (%s, %d, %s)" \
            % (netst['block_dev'], netst['max_rd_iops'], netst['max_wr_iops'])
-  blkio = blkioclass.BlkioClass(netst['block_dev'], netst['max_rd_iops'], netst['max_wr_iops'])
+  blkio = blkioclass.BlkioClass(netst['block_dev'], netst['max_rd_iops'], netst['max_wr_iops'], \
+                                st.node.cgroup)
   period = netst['blkio_period']
   cycle = 0
   start_iop_stats = {}
   start_time = dt.datetime.now()
   was_enabled = False
+  deltas = st.active.subscribe()
+
+  def throttleDeltas(added, removed):
+    # BE containers are throttled as soon as they are seen
+    for key, pod, _ in added:
+      if pod.wclass == 'BE' and key not in blkio.keys:
+        blkio.addBeCont(key)
+    for key, _, _ in removed:
+      if key in blkio.keys:
+        blkio.removeBeCont(key)
 
   # control loop
   while 1:
@@ -44,34 +54,24 @@ def BlkioControll():
 
     if not st.enabled:
       print "Blkio:WARNING: BE Controller is disabled, skipping blkio control"
-      time.sleep(period)
+      st.SleepOnDeltas(deltas, period)
       continue
 
     if st.get_param('disabled', 'blkio_controller', False) is True:
       print "Blkio:WARNING: Blkio Controller is disabled"
-      time.sleep(period)
+      st.SleepOnDeltas(deltas, period)
       continue
 
     was_enabled = True
 
     #Get IDS of all active containers
-    active_ids = set()
-    active_be_ids = set()
-    st.active.lock.acquire_read()
-    for _, pod in st.active.pods.items():
-      if pod.qosclass == 'guaranteed':
-        root = 'kubepods/' + 'pod' + pod.uid + '/'
-      else:
-        root = 'kubepods/' + pod.qosclass.lower() + '/pod' + pod.uid + '/'
-      for cont in pod.container_ids:
-        key = root + cont
-        active_ids.add(key)
-        if pod.wclass == 'BE':
-          active_be_ids.add(key)
-    st.active.lock.release_read()
+    snapshot = st.active.snapshot
+    active_ids = snapshot.containers.keys()
+    active_be_ids = snapshot.be_keys
 
     # get IOPS usage statistics
     end_iop_stats = {}
+    cont_iop = {}
     be_riop = 0
     be_wiop = 0
     hp_riop = 0
@@ -86,6 +86,7 @@ def BlkioControll():
         wstart = 0
       riop = rend - rstart
       wiop = wend - wstart
+      cont_iop[key] = riop + wiop
       if key in active_be_ids:
         be_riop += riop
         be_wiop += wiop
@@ -101,6 +102,9 @@ def BlkioControll():
     be_wiops = int(be_wiop/elapsed_time)
     total_riops = hp_riops + be_riops
     total_wiops = hp_wiops + be_wiops
+    # per container usage, used for BE victim selection
+    for key, iop in cont_iop.items():
+      snapshot.containers[key][1].iops = int(iop/elapsed_time)
 
     # reset stats for next cycle
     start_time = end_time
@@ -115,12 +119,8 @@ def BlkioControll():
       blkio.removeBeCont(_)
 
     # actual controller
-    be_rlimit = blkio.max_rd_iops - hp_riops - max(0.05*blkio.max_rd_iops, 0.10*hp_riops)
-    be_wlimit = blkio.max_wr_iops - hp_wiops - max(0.05*blkio.max_wr_iops, 0.10*hp_wiops)
-    if be_rlimit < 0.0:
-      be_rlimit = 0.0
-    if be_wlimit < 0.0:
-      be_wlimit = 0.0
+    be_rlimit = blkio.beIopsLimit(blkio.max_rd_iops, hp_riops)
+    be_wlimit = blkio.beIopsLimit(blkio.max_wr_iops, hp_wiops)
     blkio.setIopsLimit(be_rlimit, be_wlimit)
 
     blkio_cycle_data = {
@@ -151,4 +151,4 @@ def BlkioControll():
       st.stats_writer.write(at, st.node.name, "blkio", blkio_cycle_data)
 
     cycle += 1
-    time.sleep(period)
+    st.SleepOnDeltas(deltas, period, throttleDeltas)
@@ -0,0 +1,280 @@
+"""
+Cgroup access layer, for cgroup v1 and v2 hierarchies
+
+Current assumptions:
+ - cgroupfs driver, container cgroups follow the kubelet layout kubepods/<qos>/pod<uid>/<cid>
+ - v1 controllers are mounted at <root>/<controller>, v2 is mounted at <root>
+ - Hybrid hierarchies are used as v1
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+
+def ReadKeyed(path):
+  """ Reads a flat keyed file (e.g. cpu.stat) into {key: int}
+  """
+  values = {}
+  with open(path) as _:
+    for line in _:
+      fields = line.split()
+      if len(fields) == 2:
+        values[fields[0]] = int(fields[1])
+  return values
+
+
+class CgroupV1(object):
+  """This class reads and writes the cgroup v1 knobs of the controller.
+
+     Each controller is a separate hierarchy, so CPU usage and throttling take
+     two files (cpuacct.usage, cpu.stat), and each IO limit is a file per
+     direction.
+
+     Useful documents and examples:
+      - cgroup v1
+        https://www.kernel.org/doc/Documentation/cgroup-v1/
+  """
+  version = 1
+
+  def __init__(self, root='/sys/fs/cgroup'):
+    self.root = root
+
+
+  def path(self, key, controller):
+    return self.root + '/' + controller + '/' + key
+
+
+  def exists(self, key, controller='cpu'):
+    """ Checks if a cgroup exists in the hierarchy of a controller
+    """
+    return os.path.isdir(self.path(key, controller))
+
+
+  def write(self, key, controller, knob, value):
+    with open(self.path(key, controller) + '/' + knob, 'w') as _:
+      _.write(str(value))
+
+
+  def descendants(self, key, controller='cpu'):
+    """ Returns the keys of all cgroups below a cgroup, parents first
+    """
+    top = self.path(key, controller)
+    keys = []
+    for path, dirs, _ in os.walk(top):
+      keys.extend([key + path[len(top):] + '/' + d for d in dirs])
+    return keys
+
+
+  def setCpuQuota(self, key, quota, period=None):
+    """ Sets the CFS quota (us per period, -1 for no limit) and optionally the period
+    """
+    if period:
+      self.write(key, 'cpu', 'cpu.cfs_period_us', period)
+    self.write(key, 'cpu', 'cpu.cfs_quota_us', quota)
+
+
+  def cpuQuota(self, key):
+    """ Returns the CFS (quota, period) of a cgroup, quota is -1 for no limit
+    """
+    with open(self.path(key, 'cpu') + '/cpu.cfs_quota_us') as _:
+      quota = int(_.read())
+    with open(self.path(key, 'cpu') + '/cpu.cfs_period_us') as _:
+      period = int(_.read())
+    return quota, period
+
+
+  def cpuStat(self, key):
+    """ Returns the cumulative CPU counters of a cgroup
+        {usage (ns), nr_periods, nr_throttled, throttled_time (ns)}
+    """
+    counters = ReadKeyed(self.path(key, 'cpu') + '/cpu.stat')
+    with open(self.path(key, 'cpuacct') + '/cpuacct.usage') as _:
+      counters['usage'] = int(_.read())
+    return counters
+
+
+  def setIoLimit(self, key, dev, riops, wiops):
+    """ Sets the read/write IOPS limits of a cgroup on a device, 0 for no limit
+    """
+    self.write(key, 'blkio', 'blkio.throttle.read_iops_device', '%s %d' % (dev, riops))
+    self.write(key, 'blkio', 'blkio.throttle.write_iops_device', '%s %d' % (dev, wiops))
+
+
+  def setCpus(self, key, cpus):
+    """ Sets the CPUs a cgroup may run on, as a cpu list (e.g. "0-3,8-11")
+    """
+    self.write(key, 'cpuset', 'cpuset.cpus', cpus)
+
+
+  def memStat(self, key):
+    """ Returns the memory usage (bytes) and cumulative reclaim counters of a cgroup
+        {usage, anon, file, inactive_file, pgscan, refault, pgmajfault}
+        v1 does not count scans per cgroup, and refaults only on recent kernels
+    """
+    stat = ReadKeyed(self.path(key, 'memory') + '/memory.stat')
+    with open(self.path(key, 'memory') + '/memory.usage_in_bytes') as _:
+      usage = int(_.read())
+    return {
+        'usage': usage,
+        'anon': stat.get('total_rss', 0),
+        'file': stat.get('total_cache', 0),
+        'inactive_file': stat.get('total_inactive_file', 0),
+        'pgscan': 0,
+        'refault': stat.get('total_workingset_refault', 0),
+        'pgmajfault': stat.get('total_pgmajfault', 0)
+    }
+
+
+  def setMemLimit(self, key, limit):
+    """ Limits the memory of a cgroup (bytes, -1 for no limit)
+        v1 has no memory.high, this is the hard limit
+    """
+    self.write(key, 'memory', 'memory.limit_in_bytes', limit)
+
+
+  def ioStat(self, key):
+    """ Returns the cumulative IOs of a cgroup per device
+        {dev: {rios, wios}}
+    """
+    stats = {}
+    with open(self.path(key, 'blkio') + '/blkio.throttle.io_serviced') as _:
+      for line in _:
+        fields = line.split()
+        if len(fields) == 3 and fields[1] in ['Read', 'Write']:
+          stats.setdefault(fields[0], {})['rios' if fields[1] == 'Read' else 'wios'] = int(fields[2])
+    return stats
+
+
+class CgroupV2(object):
+  """This class reads and writes the cgroup v2 knobs of the controller.
+
+     All controllers share one hierarchy. CPU usage and throttling come from
+     cpu.stat, IOs and bytes of all devices from io.stat, so a sample is a
+     single read per cgroup, and limits are single writes to cpu.max and
+     io.max.
+
+     Useful documents and examples:
+      - cgroup v2
+        https://www.kernel.org/doc/Documentation/cgroup-v2.txt
+  """
+  version = 2
+
+  def __init__(self, root='/sys/fs/cgroup'):
+    self.root = root
+
+
+  def path(self, key, controller=None):
+    return self.root + '/' + key
+
+
+  def exists(self, key, controller='cpu'):
+    """ Checks if a cgroup exists
+    """
+    return os.path.isdir(self.path(key))
+
+
+  def write(self, key, knob, value):
+    with open(self.path(key) + '/' + knob, 'w') as _:
+      _.write(str(value))
+
+
+  def descendants(self, key, controller='cpu'):
+    """ Returns the keys of all cgroups below a cgroup, parents first
+    """
+    top = self.path(key)
+    keys = []
+    for path, dirs, _ in os.walk(top):
+      keys.extend([key + path[len(top):] + '/' + d for d in dirs])
+    return keys
+
+
+  def setCpuQuota(self, key, quota, period=None):
+    """ Sets the CFS quota (us per period, -1 for no limit) and optionally the period
+    """
+    value = 'max' if quota < 0 else str(quota)
+    if period:
+      value += ' %d' % period
+    self.write(key, 'cpu.max', value)
+
+
+  def cpuQuota(self, key):
+    """ Returns the CFS (quota, period) of a cgroup, quota is -1 for no limit
+    """
+    with open(self.path(key) + '/cpu.max') as _:
+      quota, period = _.read().split()
+    return (-1 if quota == 'max' else int(quota)), int(period)
+
+
+  def cpuStat(self, key):
+    """ Returns the cumulative CPU counters of a cgroup
+        {usage (ns), nr_periods, nr_throttled, throttled_time (ns)}
+    """
+    stat = ReadKeyed(self.path(key) + '/cpu.stat')
+    return {
+        'usage': 1000 * stat.get('usage_usec', 0),
+        'nr_periods': stat.get('nr_periods', 0),
+        'nr_throttled': stat.get('nr_throttled', 0),
+        'throttled_time': 1000 * stat.get('throttled_usec', 0)
+    }
+
+
+  def setIoLimit(self, key, dev, riops, wiops):
+    """ Sets the read/write IOPS limits of a cgroup on a device, 0 for no limit
+    """
+    self.write(key, 'io.max', '%s riops=%s wiops=%s' % (dev, riops or 'max', wiops or 'max'))
+
+
+  def setCpus(self, key, cpus):
+    """ Sets the CPUs a cgroup may run on, as a cpu list (e.g. "0-3,8-11")
+    """
+    self.write(key, 'cpuset.cpus', cpus)
+
+
+  def memStat(self, key):
+    """ Returns the memory usage (bytes) and cumulative reclaim counters of a cgroup
+        {usage, anon, file, inactive_file, pgscan, refault, pgmajfault}
+    """
+    stat = ReadKeyed(self.path(key) + '/memory.stat')
+    with open(self.path(key) + '/memory.current') as _:
+      usage = int(_.read())
+    return {
+        'usage': usage,
+        'anon': stat.get('anon', 0),
+        'file': stat.get('file', 0),
+        'inactive_file': stat.get('inactive_file', 0),
+        'pgscan': stat.get('pgscan', 0),
+        'refault': stat.get('workingset_refault_file', stat.get('workingset_refault', 0)),
+        'pgmajfault': stat.get('pgmajfault', 0)
+    }
+
+
+  def setMemLimit(self, key, limit):
+    """ Throttles and reclaims the memory of a cgroup above limit (bytes, -1 for no limit)
+        with memory.high, which never invokes the OOM killer
+    """
+    self.write(key, 'memory.high', 'max' if limit < 0 else str(limit))
+
+
+  def ioStat(self, key):
+    """ Returns the cumulative IOs and bytes of a cgroup per device
+        {dev: {rbytes, wbytes, rios, wios, ...}}
+    """
+    stats = {}
+    with open(self.path(key) + '/io.stat') as _:
+      for line in _:
+        fields = line.split()
+        if not fields:
+          continue
+        stats[fields[0]] = dict([(k, int(v)) for k, v in [f.split('=', 1) for f in fields[1:]]])
+    return stats
+
+
+def MakeCgroup(root='/sys/fs/cgroup'):
+  """ Picks the cgroup version of the host: v2 if root is a unified hierarchy
+  """
+  if os.path.isfile(root + '/cgroup.controllers'):
+    return CgroupV2(root)
+  return CgroupV1(root)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cgroup as cg
+import cpuacct
+import quotaclass
+import blkioclass
+
+KEY = 'kubepods/besteffort/pod1/c1'
+
+def Write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as _:
+        _.write(text)
+
+def Read(path):
+    with open(path) as _:
+        return _.read()
+
+class TestCgroupMethods(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_detect(self):
+        self.assertEqual(cg.MakeCgroup(self.root).version, 1)
+        Write(self.root + '/cgroup.controllers', 'cpu io memory\n')
+        self.assertEqual(cg.MakeCgroup(self.root).version, 2)
+
+    def test_v1(self):
+        r = self.root
+        Write(r + '/cpu/' + KEY + '/cpu.stat', 'nr_periods 10\nnr_throttled 2\nthrottled_time 3000\n')
+        Write(r + '/cpuacct/' + KEY + '/cpuacct.usage', '5000\n')
+        Write(r + '/blkio/' + KEY + '/blkio.throttle.io_serviced',
+              '202:0 Read 7\n202:0 Write 3\n202:0 Sync 10\n202:0 Total 10\nTotal 10\n')
+        c = cg.MakeCgroup(r)
+        self.assertEqual(c.cpuStat(KEY), {'usage': 5000, 'nr_periods': 10,
+                                          'nr_throttled': 2, 'throttled_time': 3000})
+        self.assertEqual(c.ioStat(KEY), {'202:0': {'rios': 7, 'wios': 3}})
+        c.setCpuQuota(KEY, 20000, 100000)
+        self.assertEqual(c.cpuQuota(KEY), (20000, 100000))
+        self.assertEqual(Read(r + '/cpu/' + KEY + '/cpu.cfs_quota_us'), '20000')
+        self.assertEqual(Read(r + '/cpu/' + KEY + '/cpu.cfs_period_us'), '100000')
+        c.setIoLimit(KEY, '202:0', 100, 50)
+        self.assertEqual(Read(r + '/blkio/' + KEY + '/blkio.throttle.read_iops_device'), '202:0 100')
+        self.assertEqual(Read(r + '/blkio/' + KEY + '/blkio.throttle.write_iops_device'), '202:0 50')
+        self.assertEqual(c.descendants('kubepods/besteffort'),
+                         ['kubepods/besteffort/pod1', KEY])
+
+    def test_v2(self):
+        r = self.root
+        Write(r + '/cgroup.controllers', 'cpu io memory\n')
+        Write(r + '/' + KEY + '/cpu.stat', 'usage_usec 5\nuser_usec 3\nsystem_usec 2\n'
+              'nr_periods 10\nnr_throttled 2\nthrottled_usec 3\n')
+        Write(r + '/' + KEY + '/io.stat', '8:16 rbytes=4096 wbytes=8192 rios=7 wios=3 dbytes=0 dios=0\n'
+              '202:0 rbytes=0 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n')
+        c = cg.MakeCgroup(r)
+        self.assertEqual(c.cpuStat(KEY), {'usage': 5000, 'nr_periods': 10,
+                                          'nr_throttled': 2, 'throttled_time': 3000})
+        self.assertEqual(c.ioStat(KEY)['8:16'], {'rbytes': 4096, 'wbytes': 8192, 'rios': 7,
+                                                 'wios': 3, 'dbytes': 0, 'dios': 0})
+        c.setCpuQuota(KEY, 20000, 100000)
+        self.assertEqual(Read(r + '/' + KEY + '/cpu.max'), '20000 100000')
+        c.setCpuQuota(KEY, -1)
+        self.assertEqual(Read(r + '/' + KEY + '/cpu.max'), 'max')
+        c.setCpuQuota(KEY, -1, 100000)
+        self.assertEqual(c.cpuQuota(KEY), (-1, 100000))
+        c.setIoLimit(KEY, '8:16', 100, 0)
+        self.assertEqual(Read(r + '/' + KEY + '/io.max'), '8:16 riops=100 wiops=max')
+
+    def test_v2_classes(self):
+        r = self.root
+        Write(r + '/cgroup.controllers', 'cpu io memory\n')
+        Write(r + '/' + KEY + '/cpu.stat', 'usage_usec 0\nnr_periods 0\nnr_throttled 0\nthrottled_usec 0\n')
+        Write(r + '/' + KEY + '/io.stat', '8:16 rbytes=0 wbytes=0 rios=7 wios=3 dbytes=0 dios=0\n')
+        c = cg.MakeCgroup(r)
+        quota = quotaclass.QuotaClass(c)
+        self.assertTrue(quota.setQuota(KEY, None, 30000))
+        self.assertEqual(Read(r + '/' + KEY + '/cpu.max'), '30000')
+        self.assertEqual(quota.clearTree('kubepods/besteffort'), 3)
+        self.assertEqual(Read(r + '/' + KEY + '/cpu.max'), 'max')
+        acct = cpuacct.CpuAcct(4, c)
+        self.assertEqual(acct.sample([KEY], 0.0)[KEY]['nr_throttled'], 0)
+        blkio = blkioclass.BlkioClass('8:16', 1500, 1000, c)
+        self.assertEqual(blkio.getIopUsed(KEY), (7, 3))
+        blkio.addBeCont(KEY)
+        blkio.setIopsLimit(100, 0)
+        self.assertEqual(Read(r + '/' + KEY + '/io.max'), '8:16 riops=100 wiops=1')
+        # new BE containers get the last limit right away
+        blkio.removeBeCont(KEY)
+        Write(r + '/' + KEY + '/io.max', '')
+        blkio.addBeCont(KEY)
+        self.assertEqual(Read(r + '/' + KEY + '/io.max'), '8:16 riops=100 wiops=1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+CPU accounting utilities class
+
+Current assumptions:
+ - cpu and cpuacct controllers are enabled in cgroups (v1 or v2, cgroupfs driver)
+ - Container cgroups follow the kubelet layout kubepods/<qos>/pod<uid>/<cid>
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+class CpuAcct(object):
+  """This class samples per-container CPU usage and throttling from cgroup accounting.
+
+     A sweep reads the CPU counters of every container (cpuacct.usage and
+     cpu.stat on cgroup v1, cpu.stat alone on cgroup v2), and keeps
+     the counters in memory to report deltas on the next sweep. Usage is
+     reported as a percentage of the whole node, the same way docker stats do.
+
+     Useful documents and examples:
+      - cpuacct background
+        https://www.kernel.org/doc/Documentation/cgroup-v1/cpuacct.txt
+      - cpu.stat throttling counters
+        https://www.kernel.org/doc/Documentation/scheduler/sched-bwc.txt
+  """
+  def __init__(self, ncpu, cgroup):
+    self.ncpu = ncpu
+    self.cgroup = cgroup
+    self.timestamp = None
+    # previous counters per container key
+    self.prev = {}
+
+
+  def readCounters(self, cont_key):
+    """ Reads the cumulative CPU counters of a container
+        {usage (ns), nr_periods, nr_throttled, throttled_time (ns)}
+    """
+    return self.cgroup.cpuStat(cont_key)
+
+
+  def sample(self, cont_keys, now):
+    """ Sweeps all containers and returns deltas since the previous sweep at now (s),
+        from a monotonic clock: {key: {cpu_percent, nr_periods, nr_throttled, throttled_time}}
+        Containers seen for the first time report no usage.
+    """
+    elapsed = (now - self.timestamp) if self.timestamp is not None else 0.0
+    stats = {}
+    current = {}
+    for key in cont_keys:
+      try:
+        counters = self.readCounters(key)
+      except (EnvironmentError, ValueError):
+        print 'CpuAcct:WARNING: Cpuacct not configured for container %s' % key
+        continue
+      current[key] = counters
+      prev = self.prev.get(key, counters)
+      delta = {}
+      for _ in ['nr_periods', 'nr_throttled', 'throttled_time']:
+        delta[_] = counters.get(_, 0) - prev.get(_, 0)
+      delta['cpu_percent'] = 0.0
+      if elapsed > 0.0 and counters['usage'] > prev['usage']:
+        delta['cpu_percent'] = (counters['usage'] - prev['usage']) * 100.0 / \
+                               (elapsed * 1E9 * self.ncpu)
+      stats[key] = delta
+
+    # swap, forgetting containers that are gone
+    self.timestamp = now
+    self.prev = current
+    return stats
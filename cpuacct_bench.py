@@ -0,0 +1,73 @@
+"""
+Benchmark for the cgroup CPU accounting sweep
+
+Builds a synthetic cgroup tree with many containers in a temp directory and
+times CpuAcct.sample() over it.
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import shutil
+import tempfile
+import time
+import argparse
+import cgroup
+import cpuacct
+
+CPU_STAT = "nr_periods %d\nnr_throttled %d\nthrottled_time %d\n"
+
+def BuildTree(root, containers):
+  """ Creates a kubepods tree with the given number of containers
+      returns the container keys
+  """
+  keys = []
+  for i in range(containers):
+    qos = ['besteffort', 'burstable'][i % 2]
+    key = 'kubepods/%s/pod%08d/%064x' % (qos, i, i)
+    for ctrl in ['cpu', 'cpuacct']:
+      os.makedirs(root + '/' + ctrl + '/' + key)
+    keys.append(key)
+  return keys
+
+
+def UpdateTree(root, keys, step):
+  """ Advances the counters of every container
+  """
+  for i, key in enumerate(keys):
+    with open(root + '/cpuacct/' + key + '/cpuacct.usage', 'w') as _:
+      _.write(str(step * (i + 1) * 1000000))
+    with open(root + '/cpu/' + key + '/cpu.stat', 'w') as _:
+      _.write(CPU_STAT % (step * 10, step * (i % 3), step * (i % 3) * 100000))
+
+
+def __init__():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("-n", "--containers", type=int, default=500, help="containers in the tree")
+  parser.add_argument("-i", "--iterations", type=int, default=50, help="sweeps to time")
+  args = parser.parse_args()
+
+  root = tempfile.mkdtemp()
+  try:
+    keys = BuildTree(root, args.containers)
+    UpdateTree(root, keys, 0)
+    acct = cpuacct.CpuAcct(64, cgroup.CgroupV1(root))
+    acct.sample(keys, 0.0)
+    times = []
+    for step in range(1, args.iterations + 1):
+      UpdateTree(root, keys, step)
+      start = time.time()
+      stats = acct.sample(keys, float(step))
+      times.append(time.time() - start)
+      assert len(stats) == len(keys)
+    times.sort()
+    print "CpuAcct sweep of %d containers, %d iterations" % (args.containers, args.iterations)
+    print "  mean %.2f ms, p50 %.2f ms, max %.2f ms" \
+          % (1000 * sum(times) / len(times), 1000 * times[len(times) / 2], 1000 * times[-1])
+  finally:
+    shutil.rmtree(root)
+
+__init__()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cgroup as cg
+import cpuacct
+
+KEYS = ['kubepods/besteffort/pod1/c1', 'kubepods/burstable/pod2/c2']
+
+def Write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as _:
+        _.write(text)
+
+class TestCpuacctMethods(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def setV1(self, key, usage, periods, throttled, throttled_time):
+        Write(self.root + '/cpu/' + key + '/cpu.stat', 'nr_periods %d\nnr_throttled %d\nthrottled_time %d\n'
+              % (periods, throttled, throttled_time))
+        Write(self.root + '/cpuacct/' + key + '/cpuacct.usage', '%d\n' % usage)
+
+    def test_v1(self):
+        acct = cpuacct.CpuAcct(4, cg.CgroupV1(self.root))
+        self.setV1(KEYS[0], 10 ** 9, 10, 1, 500)
+        self.setV1(KEYS[1], 5 * 10 ** 9, 10, 0, 0)
+        # the first sweep has no usage
+        stats = acct.sample(KEYS, 1000.0)
+        self.assertEqual(stats[KEYS[0]], {'cpu_percent': 0.0, 'nr_periods': 0, 'nr_throttled': 0, 'throttled_time': 0})
+        # 2 s of CPU in 1 s on 4 CPUs
+        self.setV1(KEYS[0], 3 * 10 ** 9, 20, 4, 2500)
+        self.setV1(KEYS[1], 5 * 10 ** 9 + 4 * 10 ** 8, 15, 0, 0)
+        stats = acct.sample(KEYS, 1001.0)
+        self.assertAlmostEqual(stats[KEYS[0]]['cpu_percent'], 50.0)
+        self.assertEqual(stats[KEYS[0]]['nr_periods'], 10)
+        self.assertEqual(stats[KEYS[0]]['nr_throttled'], 3)
+        self.assertEqual(stats[KEYS[0]]['throttled_time'], 2000)
+        self.assertAlmostEqual(stats[KEYS[1]]['cpu_percent'], 10.0)
+        # a reset counter is not negative usage
+        self.setV1(KEYS[1], 0, 0, 0, 0)
+        self.assertEqual(acct.sample(KEYS, 1002.0)[KEYS[1]]['cpu_percent'], 0.0)
+        # so is a clock that did not advance
+        self.setV1(KEYS[0], 4 * 10 ** 9, 20, 4, 2500)
+        self.assertEqual(acct.sample(KEYS, 1002.0)[KEYS[0]]['cpu_percent'], 0.0)
+
+    def test_containers(self):
+        acct = cpuacct.CpuAcct(1, cg.CgroupV1(self.root))
+        self.setV1(KEYS[0], 0, 0, 0, 0)
+        # missing containers are skipped
+        self.assertEqual(acct.sample(KEYS, 0.0).keys(), [KEYS[0]])
+        self.setV1(KEYS[0], 10 ** 9, 0, 0, 0)
+        self.setV1(KEYS[1], 10 ** 9, 0, 0, 0)
+        stats = acct.sample(KEYS, 2.0)
+        self.assertAlmostEqual(stats[KEYS[0]]['cpu_percent'], 50.0)
+        # new containers report no usage
+        self.assertEqual(stats[KEYS[1]]['cpu_percent'], 0.0)
+        # containers left out are forgotten
+        acct.sample([KEYS[1]], 4.0)
+        self.assertEqual(acct.prev.keys(), [KEYS[1]])
+
+    def test_v2(self):
+        Write(self.root + '/cgroup.controllers', 'cpu io memory\n')
+        acct = cpuacct.CpuAcct(2, cg.MakeCgroup(self.root))
+        path = self.root + '/' + KEYS[0] + '/cpu.stat'
+        Write(path, 'usage_usec 1000000\nnr_periods 5\nnr_throttled 1\nthrottled_usec 10\n')
+        acct.sample(KEYS[:1], 10.0)
+        Write(path, 'usage_usec 1500000\nnr_periods 10\nnr_throttled 3\nthrottled_usec 30\n')
+        stats = acct.sample(KEYS[:1], 10.5)[KEYS[0]]
+        self.assertAlmostEqual(stats['cpu_percent'], 50.0)
+        self.assertEqual(stats['nr_throttled'], 2)
+        self.assertEqual(stats['throttled_time'], 20000)
+
+if __name__ == '__main__':
+    unittest.main()
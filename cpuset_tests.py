@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cgroup as cg
+import cpusetclass as cs
+
+def Write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as _:
+        _.write(text)
+
+def Read(path):
+    with open(path) as _:
+        return _.read()
+
+def BuildSysfs(root):
+    # 2 NUMA nodes, 2 cores each, 2 threads per core; siblings are n and n+4
+    Write(root + '/devices/system/cpu/online', '0-7\n')
+    Write(root + '/devices/system/node/node0/cpulist', '0-1,4-5\n')
+    Write(root + '/devices/system/node/node1/cpulist', '2-3,6-7\n')
+    for cpu in range(8):
+        Write(root + '/devices/system/cpu/cpu%d/topology/thread_siblings_list' % cpu,
+              '%d,%d\n' % (cpu % 4, cpu % 4 + 4))
+
+class TestCpusetMethods(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_cpulist(self):
+        self.assertEqual(cs.ParseCpuList('0-3,8,10-11\n'), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(cs.FormatCpuList([11, 0, 1, 2, 3, 8, 10]), '0-3,8,10-11')
+        self.assertEqual(cs.FormatCpuList([]), '')
+
+    def test_topology(self):
+        BuildSysfs(self.root)
+        t = cs.Topology(self.root)
+        self.assertEqual(t.cores, [[0, 4], [1, 5], [2, 6], [3, 7]])
+        self.assertEqual(t.numa[6], 1)
+
+    def test_partition(self):
+        BuildSysfs(self.root)
+        Write(self.root + '/cg/cgroup.controllers', 'cpu cpuset\n')
+        for key in ['be', 'hp']:
+            Write(self.root + '/cg/' + key + '/cpuset.cpus', '')
+        c = cs.CpusetClass(cs.Topology(self.root), cg.MakeCgroup(self.root + '/cg'), 1)
+        self.assertEqual(c.max_be_cores, 3)
+        self.assertEqual(c.partition(1), ([3, 7], [0, 1, 2, 4, 5, 6]))
+        self.assertEqual(c.apply(['be'], ['hp'], 2), 2)
+        self.assertEqual(Read(self.root + '/cg/be/cpuset.cpus'), '2-3,6-7')
+        self.assertEqual(Read(self.root + '/cg/hp/cpuset.cpus'), '0-1,4-5')
+        # bounded, and all cores go to HP without BE containers
+        self.assertEqual(c.apply(['be'], ['hp'], 9), 3)
+        self.assertEqual(c.apply([], ['hp'], 2), 0)
+        self.assertEqual(Read(self.root + '/cg/hp/cpuset.cpus'), '0-7')
+        self.assertEqual(c.written.keys(), ['hp'])
+
+if __name__ == '__main__':
+    unittest.main()
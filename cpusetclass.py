@@ -0,0 +1,152 @@
+"""
+Cpuset utilities class
+
+Current assumptions:
+ - cpuset is enabled in cgroups (v1 or v2) and kubelet runs without the static CPU manager
+ - Physical cores are the sibling groups of /sys/devices/system/cpu/cpu*/topology
+ - All online CPUs are available to pods
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import glob
+
+def ParseCpuList(text):
+  """ Parses a cpu list (e.g. "0-3,8,10-11") into a sorted list of CPU ids
+  """
+  cpus = set()
+  for part in text.strip().split(','):
+    if not part:
+      continue
+    if '-' in part:
+      first, last = part.split('-')
+      cpus.update(range(int(first), int(last) + 1))
+    else:
+      cpus.add(int(part))
+  return sorted(cpus)
+
+
+def FormatCpuList(cpus):
+  """ Formats CPU ids as a cpu list, with ranges
+  """
+  ranges = []
+  for cpu in sorted(cpus):
+    if ranges and ranges[-1][1] == cpu - 1:
+      ranges[-1][1] = cpu
+    else:
+      ranges.append([cpu, cpu])
+  return ','.join([('%d' % a) if a == b else ('%d-%d' % (a, b)) for a, b in ranges])
+
+
+class Topology(object):
+  """This class reads the physical cores and NUMA nodes of the host from sysfs.
+
+     cores is the list of physical cores, each a sorted list of its hyperthread
+     siblings, ordered by NUMA node and then by first CPU.
+  """
+  def __init__(self, sysfs='/sys'):
+    base = sysfs + '/devices/system'
+    with open(base + '/cpu/online') as _:
+      online = set(ParseCpuList(_.read()))
+    numa = {}
+    for path in glob.glob(base + '/node/node[0-9]*/cpulist'):
+      node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+      with open(path) as _:
+        for cpu in ParseCpuList(_.read()):
+          numa[cpu] = node
+    cores = set()
+    for cpu in online:
+      siblings = [cpu]
+      try:
+        with open(base + '/cpu/cpu%d/topology/thread_siblings_list' % cpu) as _:
+          siblings = ParseCpuList(_.read())
+      except EnvironmentError:
+        pass
+      cores.add(tuple([_ for _ in siblings if _ in online]))
+    self.numa = numa
+    self.cores = sorted([list(_) for _ in cores], key=lambda c: (numa.get(c[0], 0), c[0]))
+    self.cpus = sorted(online)
+
+
+class CpusetClass(object):
+  """This class partitions physical cores between HP and BE containers with cpusets.
+
+     BE containers get the last be_cores cores of the topology, so they fill
+     the last NUMA node first and HP keeps the first one; HP containers get
+     all other cores. Hyperthread siblings always go to the same side, so HP
+     and BE never share a physical core or its L1/L2 caches. When the
+     partition changes, the side losing cores is written first, so the two
+     sets never overlap.
+
+     Useful documents and examples:
+      - cpusets
+        https://www.kernel.org/doc/Documentation/cgroup-v1/cpusets.txt
+      - Heracles: Improving Resource Efficiency at Scale (ISCA 2015)
+  """
+  def __init__(self, topology, cgroup, min_be_cores=1, max_be_cores=None):
+    self.topology = topology
+    self.cgroup = cgroup
+    ncores = len(topology.cores)
+    self.min_be_cores = min(min_be_cores, ncores - 1)
+    self.max_be_cores = min(max_be_cores or ncores - 1, ncores - 1)
+    self.be_cores = self.min_be_cores
+    # cpu list last written per container key
+    self.written = {}
+
+
+  def partition(self, be_cores):
+    """ Returns (be_cpus, hp_cpus) for be_cores BE cores
+    """
+    split = len(self.topology.cores) - be_cores
+    hp = sorted([cpu for core in self.topology.cores[:split] for cpu in core])
+    be = sorted([cpu for core in self.topology.cores[split:] for cpu in core])
+    return be, hp
+
+
+  def writeCpus(self, keys, cpus):
+    """ Writes a cpu list into the cgroups that do not have it yet
+    """
+    for key in keys:
+      if self.written.get(key) == cpus:
+        continue
+      try:
+        self.cgroup.setCpus(key, cpus)
+        self.written[key] = cpus
+      except EnvironmentError as e:
+        print 'Cpuset:WARNING: Cannot set cpuset of container %s: %s' % (key, e)
+
+
+  def apply(self, be_keys, hp_keys, be_cores):
+    """ Moves BE containers to be_cores cores and HP containers to the rest
+        with no BE containers, HP gets all cores
+    """
+    be_cores = min(max(be_cores, self.min_be_cores), self.max_be_cores)
+    if not be_keys:
+      be_cores = 0
+    be, hp = self.partition(be_cores)
+    be_cpus = FormatCpuList(be)
+    hp_cpus = FormatCpuList(hp)
+    if be_cores > self.be_cores:
+      self.writeCpus(hp_keys, hp_cpus)
+      self.writeCpus(be_keys, be_cpus)
+    else:
+      self.writeCpus(be_keys, be_cpus)
+      self.writeCpus(hp_keys, hp_cpus)
+    self.be_cores = be_cores
+    # forget containers that are gone
+    active = set(be_keys) | set(hp_keys)
+    for key in self.written.keys():
+      if key not in active:
+        del self.written[key]
+    return be_cores
+
+
+  def clear(self, keys):
+    """ Gives all CPUs back to the given containers
+    """
+    self.writeCpus(keys, FormatCpuList(self.topology.cpus))
+    self.be_cores = 0
@@ -0,0 +1,122 @@
+"""
+Cpuset controller
+
+Current assumptions:
+ - Slack comes from the QoS data store sample of the quota controller
+ - One physical core moves between HP and BE per cycle
+ - CFS quota keeps limiting BE inside its cores
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+from datetime import datetime as dt
+
+# hyperpilot imports
+import settings as st
+import cpusetclass
+
+def HpCoreLoad(cpuset, hp_cpus):
+  """ Average load (0-100.0) of the HP cores, None if per-core loads are not available
+  """
+  loads = st.node.core_load
+  if not hp_cpus or len(loads) != len(cpuset.topology.cpus):
+    return None
+  load = dict(zip(cpuset.topology.cpus, loads))
+  return sum([load[_] for _ in hp_cpus]) / len(hp_cpus)
+
+
+def CpusetControll():
+  """ Cpuset controller
+  """
+  # initialize controller
+  csst = st.params['cpuset_controller']
+  qc = st.params['quota_controller']
+  topology = cpusetclass.Topology(st.get_param('sysfs', None, '/sys'))
+  if len(topology.cores) < 2:
+    print "Cpuset:WARNING: %d physical core(s), not partitioning cores" % len(topology.cores)
+    return
+  cpuset = cpusetclass.CpusetClass(topology, st.node.cgroup, \
+                                   st.get_param('min_be_cores', 'cpuset_controller', 1), \
+                                   st.get_param('max_be_cores', 'cpuset_controller', None))
+  if st.verbose:
+    print "Cpuset: Starting CpusetControl (%d cores, %d cpus, BE cores %d-%d)" \
+           % (len(topology.cores), len(topology.cpus), cpuset.min_be_cores, cpuset.max_be_cores)
+  period = csst['period']
+  cycle = 0
+  target = cpuset.min_be_cores
+  was_enabled = False
+
+  # control loop
+  while 1:
+
+    # get cgroups of all active containers
+    snapshot = st.active.snapshot
+    be_keys = list(snapshot.be_keys)
+    hp_keys = list(snapshot.hp_keys)
+
+    # give all cores back if the controller is turned off
+    disabled = st.get_param('disabled', 'cpuset_controller', False) is True
+    if was_enabled and (disabled or not st.enabled):
+      cpuset.clear(be_keys + hp_keys)
+      was_enabled = False
+
+    if not st.enabled:
+      print "Cpuset:WARNING: BE Controller is disabled, skipping cpuset control"
+      time.sleep(period)
+      continue
+
+    if disabled:
+      print "Cpuset:WARNING: Cpuset Controller is disabled"
+      time.sleep(period)
+      continue
+
+    was_enabled = True
+
+    # actual controller: one core at a time, driven by slack and the load of HP cores
+    slack, _ = st.qosds.slack(st.node.qos_app)
+    be_cpus, hp_cpus = cpuset.partition(cpuset.be_cores)
+    hp_load = HpCoreLoad(cpuset, hp_cpus)
+    action = "none"
+    if not be_keys:
+      target = cpuset.min_be_cores
+    elif slack < qc['slack_threshold_shrink'] or \
+         (hp_load is not None and hp_load > qc['load_threshold_shrink']):
+      if target > cpuset.min_be_cores:
+        target -= 1
+        action = "shrink_be"
+    elif slack > qc['slack_threshold_grow'] and target < cpuset.max_be_cores:
+      # the HP cores left must absorb the load of the core moved to BE
+      core = len(topology.cores[len(topology.cores) - target - 1])
+      if hp_load is None or hp_load * len(hp_cpus) / (len(hp_cpus) - core) < qc['load_threshold_grow']:
+        target += 1
+        action = "grow_be"
+    be_cores = cpuset.apply(be_keys, hp_keys, target)
+
+    cpuset_cycle_data = {
+        "cycle": cycle,
+        "slack": slack,
+        "hp_core_load": hp_load if hp_load is not None else -1.0,
+        "be_cores": be_cores,
+        "hp_cores": len(topology.cores) - be_cores,
+        "action": action
+    }
+
+    at = dt.now().strftime('%H:%M:%S')
+
+    # loop
+    if st.verbose:
+      print "Cpuset: Cpuset controller cycle", cycle, "at", at
+      be_cpus, hp_cpus = cpuset.partition(be_cores)
+      print "Cpuset:   BE cpus %s, HP cpus %s (%s)" \
+            % (cpusetclass.FormatCpuList(be_cpus), cpusetclass.FormatCpuList(hp_cpus), action)
+
+    if st.get_param('write_metrics', 'cpuset_controller', False) is True:
+      st.stats_writer.write(at, st.node.name, "cpuset", cpuset_cycle_data)
+
+    cycle += 1
+    time.sleep(period)
@@ -0,0 +1,100 @@
+"""
+Bounded parallel pod eviction
+
+Current assumptions:
+ - The kill function raises an exception if the kill failed
+ - A kill that overruns its timeout cannot be cancelled, it is only reported
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import time
+import threading
+import Queue
+
+class Evictor(object):
+  """This class kills pods from a bounded pool of worker threads.
+
+     submit() never blocks the caller. Kills run with at most max_workers in
+     flight, each with a timeout passed to the kill function. collect()
+     returns the kills completed since the last call, and reports kills that
+     overran their timeout while they are still running.
+
+     Pods killed successfully are not killed again, even though they may
+     still be listed until their deletion is seen; retain() forgets them.
+  """
+  def __init__(self, kill, max_workers=8, timeout=5.0):
+    self.kill = kill
+    self.timeout = timeout
+    self.queue = Queue.Queue()
+    self.lock = threading.Lock()
+    # pod key -> start time (None while queued)
+    self.in_flight = {}
+    self.reported = set()
+    self.done = []
+    # keys of pods killed successfully
+    self.killed = set()
+    for i in range(max_workers):
+      _ = threading.Thread(name='Evictor-%d' % i, target=self.worker)
+      _.setDaemon(True)
+      _.start()
+
+
+  def submit(self, key, pod):
+    """ Queues a pod for eviction, returns False if it is already being evicted or killed
+    """
+    with self.lock:
+      if key in self.in_flight or key in self.killed:
+        return False
+      self.in_flight[key] = None
+    self.queue.put((key, pod))
+    return True
+
+
+  def worker(self):
+    """ Runs kills from the queue
+    """
+    while 1:
+      key, pod = self.queue.get()
+      start = time.time()
+      with self.lock:
+        self.in_flight[key] = start
+      error = None
+      try:
+        self.kill(pod, self.timeout)
+      except Exception as e:
+        error = str(e)
+      with self.lock:
+        self.in_flight.pop(key)
+        self.reported.discard(key)
+        self.done.append((key, time.time() - start, error))
+        if error is None:
+          self.killed.add(key)
+
+
+  def retain(self, keys):
+    """ Forgets the kills of pods not in keys, e.g. pods whose deletion was seen
+    """
+    with self.lock:
+      self.killed.intersection_update(keys)
+
+
+  def collect(self):
+    """ Returns (done, stragglers):
+        done: [(key, seconds, error)] of kills completed since the last call,
+              error is None for successful kills
+        stragglers: keys of running kills that overran the timeout, each reported once
+    """
+    now = time.time()
+    with self.lock:
+      done = self.done
+      self.done = []
+      stragglers = []
+      for key, start in self.in_flight.items():
+        if start is not None and now - start > self.timeout and key not in self.reported:
+          self.reported.add(key)
+          stragglers.append(key)
+    return done, stragglers
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+import evictor
+
+class FakeKill(object):
+    """ Kills that block until released, tracking how many run at once
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self.killed = []
+
+    def __call__(self, pod, timeout):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait()
+        with self.lock:
+            self.running -= 1
+            self.killed.append(pod)
+        if pod == 'bad':
+            raise Exception('cannot kill')
+
+def Collect(ev, count, deadline=10.0):
+    """ Waits for count kills to complete, or for the deadline (s) to pass
+    """
+    done = []
+    end = time.time() + deadline
+    while len(done) < count and time.time() < end:
+        done.extend(ev.collect()[0])
+        time.sleep(0.001)
+    return done
+
+class TestEvictorMethods(unittest.TestCase):
+    def test_bounded(self):
+        kill = FakeKill()
+        ev = evictor.Evictor(kill, max_workers=2, timeout=5.0)
+        for i in range(5):
+            self.assertTrue(ev.submit('p%d' % i, 'p%d' % i))
+        while kill.running < 2:
+            time.sleep(0.001)
+        time.sleep(0.01)
+        self.assertEqual(kill.max_running, 2)
+        kill.release.set()
+        done = Collect(ev, 5)
+        self.assertEqual(sorted([k for k, _, _ in done]), ['p%d' % i for i in range(5)])
+        self.assertEqual([e for _, _, e in done], [None] * 5)
+
+    def test_dedupe(self):
+        kill = FakeKill()
+        ev = evictor.Evictor(kill, max_workers=1, timeout=5.0)
+        self.assertTrue(ev.submit('a', 'a'))
+        self.assertFalse(ev.submit('a', 'a'))
+        self.assertTrue(ev.submit('b', 'bad'))
+        kill.release.set()
+        done = dict([(k, e) for k, _, e in Collect(ev, 2)])
+        self.assertEqual(done, {'a': None, 'b': 'cannot kill'})
+        # killed pods are not killed again until forgotten, failed ones are retried
+        self.assertFalse(ev.submit('a', 'a'))
+        self.assertTrue(ev.submit('b', 'bad'))
+        ev.retain(['b'])
+        self.assertTrue(ev.submit('a', 'a'))
+        self.assertEqual(len(Collect(ev, 2)), 2)
+
+    def test_stragglers(self):
+        kill = FakeKill()
+        ev = evictor.Evictor(kill, max_workers=1, timeout=0.01)
+        ev.submit('a', 'a')
+        while not kill.running:
+            time.sleep(0.001)
+        time.sleep(0.02)
+        # reported once, while it runs
+        self.assertEqual(ev.collect(), ([], ['a']))
+        self.assertEqual(ev.collect(), ([], []))
+        kill.release.set()
+        done = Collect(ev, 1)
+        self.assertEqual(done[0][0], 'a')
+        self.assertTrue(done[0][1] >= 0.01)
+
+if __name__ == '__main__':
+    unittest.main()
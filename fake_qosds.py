@@ -0,0 +1,103 @@
+"""
+Local stand-in for the QoS data store
+
+Serves /v1/switch and /v1/apps/metrics over HTTP/1.1 with keep-alive, with an
+optional per-request delay. /v1/apps/metrics?wait=N long-polls for changes.
+Used by benchmarks and for running the controller without a real QoS data
+store.
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import time
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+class FakeQosHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """ Request handler, serves the state of the owning FakeQosDataStore
+  """
+  protocol_version = 'HTTP/1.1'
+  # send each response in one segment, keep-alive clients would stall on delayed ACKs
+  wbufsize = -1
+  disable_nagle_algorithm = True
+
+  def do_GET(self):
+    store = self.server.store
+    if store.delay:
+      time.sleep(store.delay)
+    url = urlparse.urlparse(self.path)
+    query = urlparse.parse_qs(url.query)
+    if url.path in store.documents:
+      self.reply(store.documents[url.path])
+    elif url.path == '/v1/switch':
+      self.reply({'error': False, 'data': store.enabled})
+    elif url.path == '/v1/apps/metrics':
+      # long-poll: hold the request until the metrics change
+      if 'wait' in query:
+        store.waitChange(float(query['wait'][0]))
+      self.reply({'error': False, 'data': store.apps})
+    else:
+      self.send_error(404)
+
+  def reply(self, body):
+    data = body if isinstance(body, str) else json.dumps(body)
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, *args):
+    pass
+
+
+class FakeQosServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """ Threaded HTTP server
+  """
+  daemon_threads = True
+  allow_reuse_address = True
+
+
+class FakeQosDataStore(object):
+  """This class runs a QoS data store stand-in in a background thread.
+  """
+  def __init__(self, port=0, delay=0.0):
+    self.enabled = True
+    self.delay = delay
+    self.apps = {}
+    # documents served as is instead of the state, by path, e.g. errors
+    self.documents = {}
+    self.changed = threading.Condition()
+    self.server = FakeQosServer(('127.0.0.1', port), FakeQosHandler)
+    self.server.store = self
+    self.port = self.server.server_address[1]
+    self.url = '127.0.0.1:%d' % self.port
+    self.thread = None
+
+  def setSlack(self, name, slack, latency=0.0):
+    """ Sets the metrics reported for an app, releasing pending long-polls
+    """
+    with self.changed:
+      self.apps[name] = {'metrics': {'slack': slack, 'latency': latency}}
+      self.changed.notifyAll()
+
+  def waitChange(self, timeout):
+    """ Waits until the metrics change or timeout expires
+    """
+    with self.changed:
+      self.changed.wait(timeout)
+
+  def start(self):
+    self.thread = threading.Thread(name='FakeQosDataStore', target=self.server.serve_forever)
+    self.thread.setDaemon(True)
+    self.thread.start()
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
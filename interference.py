@@ -0,0 +1,104 @@
+"""
+Local interference monitor, from pressure stall information and HP throttling
+
+Current assumptions:
+ - /proc/pressure/{cpu,io,memory} exist on kernels 4.20+ built with PSI; missing files are skipped
+ - HP throttling is only seen for HP containers with CPU limits
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+import threading
+
+RESOURCES = ['cpu', 'io', 'memory']
+
+def ParsePressure(text):
+  """ Parses a /proc/pressure file into {'some': total (us), 'full': total (us)}
+  """
+  totals = {}
+  for line in text.splitlines():
+    fields = line.split()
+    if not fields:
+      continue
+    for field in fields[1:]:
+      if field.startswith('total='):
+        totals[fields[0]] = int(field[len('total='):])
+  return totals
+
+
+class InterferenceMonitor(object):
+  """This class samples signals of local interference, faster than the quota loop.
+
+     Signals are fractions (0-1.0) over the last sample interval:
+       cpu, io, memory - share of time some tasks stalled on the resource (PSI)
+       hp_throttled    - share of CFS periods in which HP containers were throttled
+     PSI stall totals are used instead of the kernel's 10s averages, which
+     lag behind. snapshot() returns the peak of each signal since the last
+     snapshot, so spikes between two quota cycles are not lost.
+  """
+  def __init__(self, cgroup, procfs='/proc'):
+    self.cgroup = cgroup
+    self.resources = [r for r in RESOURCES if os.path.isfile(procfs + '/pressure/' + r)]
+    self.paths = dict([(r, procfs + '/pressure/' + r) for r in self.resources])
+    if len(self.resources) < len(RESOURCES):
+      print 'Interference:WARNING: No pressure stall information for %s' \
+            % ', '.join([r for r in RESOURCES if r not in self.resources])
+    self.lock = threading.Lock()
+    self.timestamp = None
+    self.prev_psi = {}
+    self.prev_hp = {}
+    self.peak = {}
+
+
+  def sample(self, hp_keys, now):
+    """ Samples all signals, returns {signal: fraction}; nothing on the first call
+    """
+    psi = {}
+    for r in self.resources:
+      try:
+        with open(self.paths[r]) as _:
+          psi[r] = ParsePressure(_.read()).get('some', 0)
+      except (EnvironmentError, ValueError):
+        continue
+    hp = {}
+    for key in hp_keys:
+      try:
+        stat = self.cgroup.cpuStat(key)
+      except (EnvironmentError, ValueError):
+        continue
+      hp[key] = (stat.get('nr_periods', 0), stat.get('nr_throttled', 0))
+
+    signals = {}
+    elapsed = (now - self.timestamp) if self.timestamp is not None else 0.0
+    if elapsed > 0:
+      for r, total in psi.items():
+        if r in self.prev_psi:
+          signals[r] = min(max((total - self.prev_psi[r]) / (elapsed * 1E6), 0.0), 1.0)
+      periods = 0
+      throttled = 0
+      for key, (nr_periods, nr_throttled) in hp.items():
+        if key in self.prev_hp:
+          periods += nr_periods - self.prev_hp[key][0]
+          throttled += nr_throttled - self.prev_hp[key][1]
+      signals['hp_throttled'] = (float(throttled) / periods) if periods > 0 else 0.0
+    self.timestamp = now
+    self.prev_psi = psi
+    self.prev_hp = hp
+
+    with self.lock:
+      for name, value in signals.items():
+        self.peak[name] = max(self.peak.get(name, 0.0), value)
+    return signals
+
+
+  def snapshot(self):
+    """ Returns the peak of each signal since the last snapshot
+    """
+    with self.lock:
+      peak = self.peak
+      self.peak = {}
+    return peak
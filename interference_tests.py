@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cgroup as cg
+import interference as itf
+
+PSI = "some avg10=0.00 avg60=0.00 avg300=0.00 total=%d\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=%d\n"
+KEY = 'kubepods/burstable/pod1/c1'
+
+def Write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as _:
+        _.write(text)
+
+class TestInterferenceMethods(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_parse(self):
+        self.assertEqual(itf.ParsePressure(PSI % (10, 5)), {'some': 10, 'full': 5})
+        self.assertEqual(itf.ParsePressure("some avg10=1.0 avg60=0 avg300=0 total=7\n"), {'some': 7})
+
+    def test_sample(self):
+        r = self.root
+        Write(r + '/proc/pressure/cpu', PSI % (0, 0))
+        Write(r + '/proc/pressure/io', PSI % (0, 0))
+        Write(r + '/cg/cgroup.controllers', 'cpu io\n')
+        Write(r + '/cg/' + KEY + '/cpu.stat', 'usage_usec 0\nnr_periods 0\nnr_throttled 0\nthrottled_usec 0\n')
+        m = itf.InterferenceMonitor(cg.MakeCgroup(r + '/cg'), r + '/proc')
+        self.assertEqual(m.resources, ['cpu', 'io'])
+        self.assertEqual(m.sample([KEY], 0.0), {})
+        # 0.5 s of 1 s stalled on cpu, 1 of 4 HP periods throttled
+        Write(r + '/proc/pressure/cpu', PSI % (500000, 0))
+        Write(r + '/cg/' + KEY + '/cpu.stat', 'usage_usec 0\nnr_periods 4\nnr_throttled 1\nthrottled_usec 0\n')
+        self.assertEqual(m.sample([KEY], 1.0), {'cpu': 0.5, 'io': 0.0, 'hp_throttled': 0.25})
+        Write(r + '/proc/pressure/cpu', PSI % (600000, 0))
+        self.assertEqual(m.sample([KEY], 2.0)['cpu'], 0.1)
+        # the snapshot keeps the peaks between quota cycles
+        self.assertEqual(m.snapshot(), {'cpu': 0.5, 'io': 0.0, 'hp_throttled': 0.25})
+        self.assertEqual(m.snapshot(), {})
+
+if __name__ == '__main__':
+    unittest.main()
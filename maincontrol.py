@@ -2,7 +2,7 @@
 Dynamic CPU controller based on the Heracles design
 
 Current pitfalls:
-- when shrinking, we penalize all BE containers instead of killing 1-2 of them
+- without victim_selection, when shrinking, we penalize all BE containers instead of killing 1-2 of them
 
 TODO
 - validate CPU usage measurements
@@ -22,7 +22,6 @@ import argparse
 import os.path
 import os
 from io import BytesIO
-import subprocess
 import threading
 import pycurl
 import docker
@@ -32,33 +31,44 @@ import store
 
 # hyperpilot imports
 import settings as st
+import rwlock
+import cgroup
+import quotaclass
+import cpuacct
+import qosclient
+import victims
+import evictor
+import policy
+import allocator
+import interference
 import netcontrol as net
 import blkiocontrol as blkio
+import cpusetcontrol as cpuset
+import memcontrol as mem
 
 
-def CpuStatsDocker():
-  """Calculates CPU usage for the node using container statistics from Docker APIs
+def CpuStatsCgroup():
+  """Calculates CPU usage of HP and BE containers using cgroup CPU accounting
   """
-  cpu_usage = 0.0
-  for _, pod in st.active.pods.items():
-    for _, cont in pod.containers().items():
-      try:
-        percent = 0.0
-        new_stats = cont.docker.stats(stream=False, decode=True)
-        new_cpu_stats = new_stats['cpu_stats']
-        past_cpu_stats = new_stats['precpu_stats']
-        cpu_delta = float(new_cpu_stats['cpu_usage']['total_usage']) - \
-                    float(past_cpu_stats['cpu_usage']['total_usage'])
-        system_delta = float(new_cpu_stats['system_cpu_usage']) - \
-                       float(past_cpu_stats['system_cpu_usage'])
-        # The percentages are system-wide, not scaled per core
-        if (system_delta > 0.0) and (cpu_delta > 0.0):
-          percent = (cpu_delta / system_delta) * 100.0
-        cont.cpu_percent = percent
-        cpu_usage += percent
-      except docker.errors.APIError:
-        print "Main:WARNING: Problem with docker container %s" % cont.docker_name
-  return cpu_usage
+  conts = st.active.snapshot.containers
+  stats = st.node.cpuacct.sample(conts.keys(), st.Monotonic())
+
+  hp_cpu_percent = 0.0
+  be_cpu_percent = 0.0
+  for key, (pod, cont) in conts.items():
+    if key not in stats:
+      continue
+    cont.cpu_percent = stats[key]['cpu_percent']
+    cont.nr_periods = stats[key]['nr_periods']
+    cont.nr_throttled = stats[key]['nr_throttled']
+    cont.throttled_time = stats[key]['throttled_time']
+    if pod.wclass == 'BE':
+      be_cpu_percent += cont.cpu_percent
+    else:
+      hp_cpu_percent += cont.cpu_percent
+  st.node.hp_cpu_percent = hp_cpu_percent
+  st.node.be_cpu_percent = be_cpu_percent
+  return hp_cpu_percent + be_cpu_percent
 
 
 def CpuStatsK8S():
@@ -84,7 +94,7 @@ def CpuStats():
   #if st.k8sOn:
   #  return CpuStatsK8S()
   #else:
-  #  return CpuStatsDocker()
+  #  return CpuStatsCgroup()
   return st.node.GetCpuLoad()
 
 def SloSlackFile():
@@ -95,47 +105,67 @@ def SloSlackFile():
   return array[0][0]
 
 def ControllerEnabled():
-  try:
-    _ = pycurl.Curl()
-    data = BytesIO()
-    _.setopt(_.URL, 'qos-data-store:7781/v1/switch')
-    _.setopt(_.WRITEFUNCTION, data.write)
-    _.perform()
-    output = json.loads(data.getvalue())
-    return output['data']
-  except (ValueError, pycurl.error) as e:
-    print "Main:WARNING:: Problem accessing QoS data store:", e
-    return st.enabled
+  """ Read the controller switch from the QoS data store, as of the last refresh
+  """
+  return st.qosds.enabled(st.enabled)
 
 
 def SloSlackQoSDS(name):
-  """ Read SLO slack from QoS data store
+  """ Read SLO slack from QoS data store, as of the last refresh
   """
   print "Main: Getting slack value for", name, "from QoS data store"
-  try:
-    _ = pycurl.Curl()
-    data = BytesIO()
-    _.setopt(_.URL, 'qos-data-store:7781/v1/apps/metrics')
-    _.setopt(_.WRITEFUNCTION, data.write)
-    _.perform()
-    output = json.loads(data.getvalue())
-    if output['error']:
-      print "Main:WARNING: Problem accessing QoS data store: " + output['data']
-      return 0.0, 0.0
-    if name not in output['data']:
-      print "Main:WARNING: QoS datastore does not track workload", name
-      return 0.0, 0.0
-    elif 'metrics' not in output['data'][name] or \
-       'slack' not in output['data'][name]['metrics']:
-      return 0.0, 0.0
-    else:
-      metrics = output['data'][name]['metrics']
-      if 'latency' not in metrics:
-        metrics['latency'] = 0.0
-      return float(metrics['slack']), float(metrics['latency'])
-  except (ValueError, pycurl.error) as e:
-    print "Main:WARNING: Problem accessing QoS data store ", e
-    return 0.0, 0.0
+  return st.qosds.slack(name)
+
+def SlackWatch():
+  """ Fast path: long-polls SLO slack and wakes up the quota loop as soon as
+      slack drops below the reset or disable thresholds
+  """
+  qc = st.params['quota_controller']
+  wait = st.get_param('slack_watch_wait', 'quota_controller', 30)
+  min_interval = st.get_param('slack_watch_interval', 'quota_controller', 1.0)
+  thresholds = [qc['slack_threshold_disable'], qc['slack_threshold_reset']]
+  last_slack = None
+  while 1:
+    start = st.Monotonic()
+    metrics = st.qosds.watch(wait)
+    if metrics is None:
+      # regular polling in the quota loop still works, retry later
+      last_slack = None
+      time.sleep(qc['period'])
+      continue
+    slack, _ = qosclient.AppSlack(metrics, st.node.qos_app)
+    for threshold in thresholds:
+      if slack < threshold and (last_slack is None or last_slack >= threshold):
+        if st.verbose:
+          print "Main: Slack watch: slack %.3f below %.3f, waking up quota controller" % (slack, threshold)
+        st.wakeup.set()
+        break
+    last_slack = slack
+    # a QoS data store without long-poll support answers right away, do not spin
+    elapsed = st.Monotonic() - start
+    if elapsed < min_interval:
+      time.sleep(min_interval - elapsed)
+
+
+def InterferenceWatch():
+  """ Fast path: samples local interference signals faster than the quota loop and
+      wakes it up as soon as one of them crosses its threshold
+  """
+  period = st.get_param('interference_period', 'quota_controller', 0.5)
+  interfered = False
+  while 1:
+    snapshot = st.active.snapshot
+    signals = st.node.interference.sample(snapshot.hp_keys, st.Monotonic())
+    # only BE pods can be shrunk; interference without them is not ours to fix
+    rate = st.node.policy.interferenceRate(signals) if snapshot.be_pods else None
+    if rate is not None and not interfered:
+      if st.verbose:
+        print "Main: Interference watch: %s, waking up quota controller" \
+              % ", ".join(["%s %.2f" % _ for _ in sorted(signals.items())])
+      st.wakeup.set()
+    interfered = rate is not None
+    time.sleep(period)
+
 
 def SloSlack(name):
   """ Read SLO slack
@@ -144,72 +174,134 @@ def SloSlack(name):
 #  return SloSlackFile()
 
 
+def LabelNode(value):
+  """ sets the hyperpilot.io/be-enabled label of the local node with a JSON patch
+      (patch_node sends application/json-patch+json, its first content type)
+      skips the patch if the label already has this value, retries with backoff on failure
+  """
+  if st.node.be_label == value:
+    return True
+  # "/" in the label key is escaped as "~1"; add replaces an existing label
+  body = [{'op': 'add', 'path': '/metadata/labels/hyperpilot.io~1be-enabled', 'value': value}]
+  backoff = st.get_param('label_backoff', None, 0.1)
+  retries = st.get_param('label_retries', None, 3)
+  for attempt in range(retries):
+    try:
+      st.node.kenv.patch_node(st.node.name, body)
+      st.node.be_label = value
+      return True
+    except ApiException as e:
+      print "Main:WARNING: Failed to label node (attempt %d): %s" % (attempt + 1, e.reason)
+      if attempt + 1 < retries:
+        time.sleep(backoff)
+        backoff *= 2
+  print "Main:ERROR: Failed to set hyperpilot.io/be-enabled=%s on k8s" % value
+  return False
+
+
 def EnableBE():
   """ enables BE workloads, locally
   """
   if st.k8sOn:
-    command = 'kubectl label --overwrite nodes ' + st.node.name + ' hyperpilot.io/be-enabled=true'
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, \
-                               stderr=subprocess.PIPE)
-    _, stderr = process.communicate()
-    if process.returncode != 0:
-      print "Main:ERROR: Failed to enable BE on k8s: %s" % stderr
+    LabelNode('true')
+
+
+def KillPod(pod, timeout):
+  """ kills a BE pod, raises an exception on failure
+  """
+  # K8s delete pod
+  if st.k8sOn:
+    st.node.kenv.delete_namespaced_pod(pod.name, pod.namespace, \
+        client.V1DeleteOptions(), grace_period_seconds=0, \
+        orphan_dependents=True, _request_timeout=timeout)
+  else:
+  # docker kill container
+    for _, cont in pod.containers.items():
+      cont.docker.kill()
+
+
+def EvictKey(pod):
+  """ identifies a pod for eviction, a pod recreated with the same name is a new pod
+  """
+  return pod.namespace + '/' + pod.name + '/' + pod.uid
+
+
+def EvictBE(pods):
+  """ kills the given BE pods, in parallel and without waiting for the kills
+      pods already killed are skipped until their deletion is seen
+  """
+  st.node.evictor.retain([EvictKey(_) for _ in st.active.snapshot.be_pods])
+  for pod in pods:
+    st.node.evictor.submit(EvictKey(pod), pod)
+
+
+def EvictionStats(quota_cycle_data):
+  """ reports the pod kills completed since the last cycle
+  """
+  done, stragglers = st.node.evictor.collect()
+  failed = 0
+  for key, seconds, error in done:
+    if error:
+      failed += 1
+      print "Main:WARNING: Cannot kill BE pod %s (%.0f ms): %s" % (key, 1000 * seconds, error)
+    elif st.verbose:
+      print "Main: Killed BE pod %s in %.0f ms" % (key, 1000 * seconds)
+  for key in stragglers:
+    print "Main:WARNING: Kill of BE pod %s is taking longer than %.1f s" % (key, st.node.evictor.timeout)
+  quota_cycle_data["evictions"] = len(done) - failed
+  quota_cycle_data["eviction_failures"] = failed
+  quota_cycle_data["eviction_stragglers"] = len(stragglers)
+  quota_cycle_data["eviction_max_ms"] = 1000 * max([_[1] for _ in done] or [0.0])
 
 
 def DisableBE():
   """ kills all BE workloads
   """
-  if st.k8sOn:
-    body = client.V1DeleteOptions()
-  # kill BE pods
-  for _, pod in st.active.pods.items():
-    if pod.wclass == 'BE':
-      # K8s delete pod
-      if st.k8sOn:
-        try:
-          _ = st.node.kenv.delete_namespaced_pod(pod.name, \
-                  pod.namespace, body, grace_period_seconds=0, \
-                  orphan_dependents=True)
-        except ApiException as e:
-          print "Main:WARNING: Cannot kill K8S BE pod: %s\n" % e
-      else:
-      # docker kill container
-        try:
-          for _, cont in pod.containers.items():
-            cont.docker.kill()
-        except docker.errors.APIError:
-          print "Main:WARNING: Cannot kill container %s" % cont.name
+  EvictBE(st.active.snapshot.be_pods)
+  # BE pods scheduled later start from the min aggregate quota
+  if st.node.be_group:
+    SetGroupQuotaBE(int(st.node.cpu * 100000 * st.params["quota_controller"]['min_be_quota']))
 
   # taint local node
   if st.k8sOn:
-    command = 'kubectl label --overwrite nodes ' + st.node.name + ' hyperpilot.io/be-enabled=false'
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, \
-                                 stderr=subprocess.PIPE)
-    _, stderr = process.communicate()
-    if process.returncode != 0:
-      print "Main:ERROR: Failed to disable BE on k8s: %s" % stderr
+    LabelNode('false')
+
+def SetContQuota(pod, cont, period=None):
+  """ applies the current quota of a BE container, directly in its cgroup
+  """
+  st.node.quotactl.setQuota(pod.cgroup_key(cont.docker_id), cont, cont.quota, period)
+
+
+def SetGroupQuotaBE(quota):
+  """ applies the aggregate quota of all BE workloads on the BE cgroup
+  """
+  try:
+    st.node.quotactl.setGroupQuota(st.node.be_group, quota)
+    if st.verbose:
+      print "Main: Aggregate CPU quota of BE set from %d to %d" % (st.node.be_quota, quota)
+    st.node.be_quota = quota
+  except EnvironmentError as e:
+    print "Main:WARNING: Cannot update quota of BE cgroup %s: %s" % (st.node.be_group, e)
+
 
 def SetQuotaBE(quota):
   """ allows all BE workloads to run at max quota
   """
-
-  for _, pod in st.active.pods.items():
-    for _, cont in pod.containers.items():
-      if pod.wclass == 'BE':
-        cont.quota = quota
-        try:
-          cont.docker.update(cpu_quota=cont.quota)
-          print "Main: CPU quota of BE container set to %d" % (cont.quota)
-        except docker.errors.APIError as e:
-          print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
-        # special case for disabling quota
-        if quota == 0:
-          cont.quota = st.node.cpu * 100000
-          try:
-            cont.docker.update(cpu_quota=cont.quota)
-            print "Main: CPU quota of BE container set to %d" % (cont.quota)
-          except docker.errors.APIError as e:
-            print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+  if st.node.be_group:
+    # special case for disabling quota: the BE cgroup may use all the CPUs of the node
+    SetGroupQuotaBE(quota if quota else int(st.node.cpu * 100000))
+    return
+
+  for pod, cont in st.active.snapshot.be_containers():
+    cont.quota = quota
+    # special case for disabling quota
+    if quota == 0:
+      cont.quota = st.node.cpu * 100000
+    try:
+      SetContQuota(pod, cont)
+      print "Main: CPU quota of BE container set to %d" % (cont.quota)
+    except docker.errors.APIError as e:
+      print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
 
 
 
@@ -217,83 +309,269 @@ def ResetBE():
   """ resets quota for all BE workloads to min_be_quota
   """
   min_be_quota = int(st.node.cpu * 100000 * st.params["quota_controller"]['min_be_quota'])
+  if st.node.be_group:
+    SetGroupQuotaBE(min_be_quota)
+    return
 
-  for _, pod in st.active.pods.items():
-    for _, cont in pod.containers.items():
-      if pod.wclass == 'BE':
-        old_quota = cont.quota
-        cont.quota = min_be_quota
-        try:
-          cont.docker.update(cpu_quota=cont.quota)
-          print "Main: Reset CPU quota of BE container from %d to %d" % (old_quota, cont.quota)
-        except docker.errors.APIError as e:
-          print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+  for pod, cont in st.active.snapshot.be_containers():
+    old_quota = cont.quota
+    cont.quota = min_be_quota
+    try:
+      SetContQuota(pod, cont)
+      print "Main: Reset CPU quota of BE container from %d to %d" % (old_quota, cont.quota)
+    except docker.errors.APIError as e:
+      print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+
+
+def ScaleAggregateBE(rate, min_be_quota, max_be_quota):
+  """ returns the aggregate BE quota scaled by rate, within [min_be_quota, max_be_quota]
+      an unlimited (-1) quota scales from max_be_quota
+  """
+  quota = st.node.be_quota if st.node.be_quota > 0 else max_be_quota
+  return min(max(int(rate * quota), min_be_quota), max_be_quota)
+
+
+def ConfigAggregateBE(group):
+  """ moves the BE quota to the BE cgroup: clears the quota of all cgroups below it,
+      then sets the min aggregate quota; stays in per-container mode on failure
+  """
+  if not st.node.quotactl.direct:
+    print "Main:WARNING: Aggregate BE quota needs the cpu cgroup, using per-container quota"
+    return
+  try:
+    cleared = st.node.quotactl.clearTree(group)
+    st.node.quotactl.setGroupQuota(group, -1, 100000)
+  except EnvironmentError as e:
+    print "Main:WARNING: Cannot use BE cgroup %s, using per-container quota: %s" % (group, e)
+    return
+  st.node.be_group = group
+  # the cleared BE cgroup may use all the CPUs of the node
+  st.node.be_quota = int(st.node.cpu * 100000)
+  SetGroupQuotaBE(int(st.node.cpu * 100000 * st.params["quota_controller"]['min_be_quota']))
+  print "Main: Aggregate BE quota on %s (%d cgroups cleared)" % (group, cleared)
+
+
+def BudgetBE(rate):
+  """ returns the aggregate quota of BE containers scaled by rate,
+      within min_be_quota and max_be_quota per container
+  """
+  min_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['min_be_quota'])
+  max_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['max_be_quota'])
+  quotas = [c.quota for _, c in st.active.snapshot.be_containers()]
+  budget = int(rate * sum([max(_, min_be_quota) for _ in quotas]))
+  return min(max(budget, min_be_quota * len(quotas)), max_be_quota * len(quotas))
 
 
-def GrowBE(slack):
+def DistributeBE(budget):
+  """ splits the aggregate quota of BE containers by demand, water-filling
+      only quotas that change by more than 1% are written
+  """
+  min_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['min_be_quota'])
+  max_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['max_be_quota'])
+  conts = dict([(cont.docker_id, (pod, cont)) for pod, cont in st.active.snapshot.be_containers()])
+  alloc = st.node.allocator.allocate(budget, dict([(k, c) for k, (_, c) in conts.items()]), \
+                                     min_be_quota, max_be_quota)
+
+  aggregate_be_quota = 0
+  for cid, quota in alloc.items():
+    pod, cont = conts[cid]
+    period = None
+    if not cont.period == 100000:
+      cont.period = period = 100000
+    if period or abs(quota - cont.quota) > 0.01 * cont.quota:
+      old_quota = cont.quota
+      cont.quota = quota
+      try:
+        SetContQuota(pod, cont, period)
+        if st.verbose:
+          print "Main: Set CPU quota of BE container in pod %s from %d to %d" % (pod.name, old_quota, cont.quota)
+      except docker.errors.APIError as e:
+        print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+    aggregate_be_quota += cont.quota
+  st.node.be_quota = aggregate_be_quota
+
+
+def AllocationStats():
+  """ returns the quota and throttled periods of each BE container,
+      as points tagged with the container
+  """
+  return [({"container": cont.docker_id[:12], "pod": pod.name}, \
+           {"alloc": cont.quota, "throttled": cont.nr_throttled}) \
+          for pod, cont in st.active.snapshot.be_containers()]
+
+
+def GrowBE(be_growth_rate):
   """ grows quotas for all BE workloads by be_growth_rate
       assumption: non 0 quotas to begin with
   """
-  be_growth_ratio = st.params['quota_controller']['BE_growth_ratio']
-  be_growth_rate = 1 + be_growth_ratio * slack
   max_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['max_be_quota'])
   min_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['min_be_quota'])
+  if st.node.be_group:
+    SetGroupQuotaBE(ScaleAggregateBE(be_growth_rate, min_be_quota, max_be_quota))
+    return
+  if st.node.allocator is not None:
+    DistributeBE(BudgetBE(be_growth_rate))
+    return
 
   aggregate_be_quota = 0
-  for _, pod in st.active.pods.items():
-    for _, cont in pod.containers.items():
-      if pod.wclass == 'BE':
-        if not cont.period == 100000:
-          cont.period = 100000
-          cont.docker.update(cpu_period=100000)
-        old_quota = cont.quota
-        cont.quota = int(be_growth_rate * cont.quota)
-        # We limit each BE container to a max quota
-        if cont.quota > max_be_quota:
-          cont.quota = max_be_quota
-        if cont.quota < min_be_quota:
-          cont.quota = min_be_quota
-        try:
-          cont.docker.update(cpu_quota=cont.quota)
-          print "Main: Grow CPU quota of BE container in pod %s from %d to %d" % (pod.name, old_quota, cont.quota)
-        except docker.errors.APIError as e:
-          print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
-        aggregate_be_quota += cont.quota
+  for pod, cont in st.active.snapshot.be_containers():
+    period = None
+    if not cont.period == 100000:
+      cont.period = period = 100000
+    old_quota = cont.quota
+    cont.quota = int(be_growth_rate * cont.quota)
+    # We limit each BE container to a max quota
+    if cont.quota > max_be_quota:
+      cont.quota = max_be_quota
+    if cont.quota < min_be_quota:
+      cont.quota = min_be_quota
+    try:
+      SetContQuota(pod, cont, period)
+      print "Main: Grow CPU quota of BE container in pod %s from %d to %d" % (pod.name, old_quota, cont.quota)
+    except docker.errors.APIError as e:
+      print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+    aggregate_be_quota += cont.quota
 
   st.node.be_quota = aggregate_be_quota
 
 
-def ShrinkBE(slack):
+def ShrinkBE(be_shrink_rate):
   """ shrinks quota for all BE workloads by be_shrink_rate
   """
-  be_shrink_ratio = st.params['quota_controller']['BE_shrink_ratio']
-  be_shrink_rate = 1 + be_shrink_ratio * slack
   min_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['min_be_quota'])
   max_be_quota = int(st.node.cpu * 100000 * st.params['quota_controller']['max_be_quota'])
+  if st.node.be_group:
+    SetGroupQuotaBE(ScaleAggregateBE(be_shrink_rate, min_be_quota, max_be_quota))
+    return
+  if st.node.allocator is not None and st.node.victims is None:
+    DistributeBE(BudgetBE(be_shrink_rate))
+    return
+
+  # with victim selection, take the same aggregate quota from the fewest heaviest pods
+  snapshot = st.active.snapshot
+  victim_pods = None
+  if st.node.victims is not None:
+    be_pods = snapshot.be_pods
+    victim_pods = st.node.victims.select(be_pods, 1 - be_shrink_rate)
+    total_quota = sum([c.quota for pod in be_pods for _, c in pod.containers.items()])
+    victim_quota = sum([c.quota for pod in victim_pods for _, c in pod.containers.items()])
+    victim_rate = 0.0
+    if victim_quota > 0:
+      victim_rate = max(0.0, 1 - (1 - be_shrink_rate) * total_quota / float(victim_quota))
+    if st.verbose:
+      print "Main: Shrinking %d victim BE pods by %.2f" % (len(victim_pods), victim_rate)
 
   aggregate_be_quota = 0
-  for _, pod in st.active.pods.items():
-    for _, cont in pod.containers.items():
-      if pod.wclass == 'BE':
-        if not cont.period == 100000:
-          pod.period = 100000
-          cont.docker.update(cpu_period=100000)
-        old_quota = cont.quota
-        cont.quota = int(be_shrink_rate * cont.quota)
-        if cont.quota < min_be_quota:
-          cont.quota = min_be_quota
-        if cont.quota > max_be_quota:
-          cont.quota = max_be_quota
-        try:
-          cont.docker.update(cpu_quota=cont.quota)
-          print "Main: Shrink CPU quota of BE container in pod %s from %d to %d" % (pod.name, old_quota, cont.quota)
-        except docker.errors.APIError as e:
-          print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
-        aggregate_be_quota += cont.quota
+  for pod, cont in snapshot.be_containers():
+    rate = be_shrink_rate
+    if victim_pods is not None:
+      rate = victim_rate if pod in victim_pods else 1.0
+    period = None
+    if not cont.period == 100000:
+      cont.period = period = 100000
+    old_quota = cont.quota
+    cont.quota = int(rate * cont.quota)
+    if cont.quota < min_be_quota:
+      cont.quota = min_be_quota
+    if cont.quota > max_be_quota:
+      cont.quota = max_be_quota
+    try:
+      SetContQuota(pod, cont, period)
+      print "Main: Shrink CPU quota of BE container in pod %s from %d to %d" % (pod.name, old_quota, cont.quota)
+    except docker.errors.APIError as e:
+      print "Main:WARNING: Cannot update quota for container %s: %s" % (str(cont), e)
+    aggregate_be_quota += cont.quota
 
   st.node.be_quota = aggregate_be_quota
 
 
+def SampleAll():
+  """ Samples the QoS data store, node CPU load and container CPU usage concurrently
+      returns the node CPU load
+  """
+  remote = threading.Thread(name='QosSample', target=st.qosds.refresh)
+  remote.start()
+  cpu_usage = CpuStats()
+  CpuStatsCgroup()
+  remote.join()
+  return cpu_usage
+
+
+def DecideBE(slo_slack, cpu_usage, signals=None):
+  """ picks the action for BE workloads with the configured policy, returns (action, rate)
+  """
+  state = {
+      "slack": slo_slack,
+      "cpu_usage": cpu_usage,
+      "be_pods": st.active.be_pods,
+      "be_quota": st.node.be_quota,
+      "now": st.Monotonic(),
+      "interference": signals
+  }
+  return st.node.policy.decide(state)
+
+
+def ActuateBE(action, arg):
+  """ applies the action picked by DecideBE, returns the action taken
+  """
+  # with victim selection, evict the top offenders first and disable all BE only if that fails
+  if action == "disable_be" and st.node.victims is not None:
+    response = st.node.victims.onSlackLoss()
+    if response == "evict":
+      victim_pods = st.node.victims.evict(st.active.snapshot.be_pods)
+      if st.verbose:
+        print "Main:Action: Evicting BE pods", ", ".join([_.name for _ in victim_pods])
+      EvictBE(victim_pods)
+      return "evict_be"
+    elif response == "wait":
+      action = "reset_be"
+
+  if action == "disable_be":
+    if st.verbose:
+      print "Main:Action: Disabling BE"
+    DisableBE()
+  elif action == "reset_be":
+    if st.verbose:
+      print "Main:Action: Resetting BE"
+    ResetBE()
+  elif action == "shrink_be":
+    if st.verbose:
+      print "Main:Action: Shrinking BE"
+    ShrinkBE(arg)
+  elif action == "enable_be":
+    if st.verbose:
+      print "Main:Action: Enabling BE"
+    EnableBE()
+  elif action == "grow_be":
+    if st.verbose:
+      print "Main:Action: Growing BE"
+    GrowBE(arg)
+  else:
+    if st.verbose:
+      print "Main:Action: No change"
+    # same budget, moved to where it is used
+    if st.node.allocator is not None:
+      DistributeBE(BudgetBE(1.0))
+  return action
+
+
+def WaitNextCycle(deadline, period):
+  """ sleeps until the next tick of a fixed-rate schedule, returns its deadline
+      if the cycle overran, the next one starts right away and missed ticks are skipped
+      the slack watch can wake us up early; the schedule restarts from that point
+  """
+  deadline += period
+  now = st.Monotonic()
+  if deadline < now:
+    deadline = now
+  else:
+    st.wakeup.wait(deadline - now)
+  if st.wakeup.is_set():
+    st.wakeup.clear()
+    deadline = st.Monotonic()
+  return deadline
+
+
 def ParseArgs():
   """ parse arguments and print config
   """
@@ -372,6 +650,8 @@ def configK8S():
       print "Main:ERROR: Exception when calling CoreV1Api->read_node: %s\n" % e
       sys.exit(-1)
     st.node.cpu = int(_.status.capacity['cpu'])
+    if _.metadata.labels:
+      st.node.be_label = _.metadata.labels.get('hyperpilot.io/be-enabled')
 
 
 def __init__():
@@ -395,19 +675,39 @@ def __init__():
                           "settings", stored_params)
 
   # initialize environment
+  st.qosds = qosclient.QosClient(st.get_param('qos_data_store', None, 'qos-data-store:7781'), \
+                                 st.get_param('qos_connect_timeout_ms', None, 500), \
+                                 st.get_param('qos_timeout_ms', None, 1000))
   configDocker()
   configK8S()
+  st.node.cgroup = cgroup.MakeCgroup(st.get_param('cgroup_root', None, '/sys/fs/cgroup'))
+  print "Main: Using cgroup v%d at %s" % (st.node.cgroup.version, st.node.cgroup.root)
+  st.node.quotactl = quotaclass.QuotaClass(st.node.cgroup)
+  st.node.cpuacct = cpuacct.CpuAcct(st.node.cpu, st.node.cgroup)
+  st.node.policy = policy.MakePolicy(st.params['quota_controller'])
+  if st.get_param('quota_mode', 'quota_controller', 'container') == 'aggregate':
+    ConfigAggregateBE(st.get_param('be_cgroup', 'quota_controller', 'kubepods/besteffort'))
+  if st.get_param('quota_alloc', 'quota_controller', 'uniform') == 'waterfill':
+    if st.node.be_group:
+      print "Main:WARNING: Water-filling allocation does not apply to the aggregate BE quota"
+    else:
+      st.node.allocator = allocator.Allocator(st.node.cpu, \
+                              st.get_param('alloc_headroom', 'quota_controller', 0.1), \
+                              st.get_param('alloc_throttle_boost', 'quota_controller', 1.0))
+  st.node.evictor = evictor.Evictor(KillPod, st.get_param('evict_workers', 'quota_controller', 8), \
+                                    st.get_param('evict_timeout', 'quota_controller', 5.0))
+  if st.get_param('victim_selection', 'quota_controller', False) is True:
+    st.node.victims = victims.VictimSelector(st.get_param('victim_weights', 'quota_controller'), \
+                          st.get_param('victim_evict_share', 'quota_controller', 0.5), \
+                          st.get_param('victim_grace_s', 'quota_controller', 4.0), \
+                          st.get_param('victim_escalation_s', 'quota_controller', 20.0), st.Monotonic)
+    if st.node.victims.weights.get('net', 0.0) > 0 and \
+       st.get_param('per_pod_classes', 'net_controller', False) is not True:
+      print "Main:WARNING: BE network usage is measured only with per_pod_classes, victims are not ranked by it"
   EnableBE()
 
   # simpler parameters
-  slack_threshold_disable = st.params['quota_controller']['slack_threshold_disable']
-  slack_threshold_reset = st.params['quota_controller']['slack_threshold_reset']
-  slack_threshold_shrink = st.params['quota_controller']['slack_threshold_shrink']
-  load_threshold_shrink = st.params['quota_controller']['load_threshold_shrink']
-  slack_threshold_grow = st.params['quota_controller']['slack_threshold_grow']
-  load_threshold_grow = st.params['quota_controller']['load_threshold_grow']
   period = st.params['quota_controller']['period']
-  max_be_quota = int(st.node.cpu * 100000 * st.params["quota_controller"]['max_be_quota'])
   min_be_quota = int(st.node.cpu * 100000 * st.params["quota_controller"]['min_be_quota'])
 
   # launch watcher for active containers and pods
@@ -420,6 +720,20 @@ def __init__():
   except threading.ThreadError:
     print "Main:ERROR: Cannot start K8S watcher; terminating"
     sys.exit(-1)
+  try:
+    _ = threading.Thread(name='ContainerResolver', target=st.ContainerResolver)
+    _.setDaemon(True)
+    _.start()
+  except threading.ThreadError:
+    print "Main:ERROR: Cannot start container resolver; terminating"
+    sys.exit(-1)
+  try:
+    _ = threading.Thread(name='QosWatch', target=st.QosWatch)
+    _.setDaemon(True)
+    _.start()
+  except threading.ThreadError:
+    print "Main:ERROR: Cannot start QoS app watcher; terminating"
+    sys.exit(-1)
   # launch other controllers
   if st.verbose:
     print "Main: Starting network controller"
@@ -437,12 +751,54 @@ def __init__():
     _.start()
   except threading.ThreadError:
     print "Main:WARNING: Cannot start blkio controller; continuing without it"
+  if st.verbose:
+    print "Main: Starting cpuset controller"
+  try:
+    _ = threading.Thread(name='CpusetControll', target=cpuset.CpusetControll)
+    _.setDaemon(True)
+    _.start()
+  except threading.ThreadError:
+    print "Main:WARNING: Cannot start cpuset controller; continuing without it"
+  if st.verbose:
+    print "Main: Starting memory controller"
+  try:
+    _ = threading.Thread(name='MemControll', target=mem.MemControll)
+    _.setDaemon(True)
+    _.start()
+  except threading.ThreadError:
+    print "Main:WARNING: Cannot start memory controller; continuing without it"
+  if st.get_param('interference_watch', 'quota_controller', False) is True:
+    if st.verbose:
+      print "Main: Starting interference watch"
+    st.node.interference = interference.InterferenceMonitor(st.node.cgroup, st.get_param('procfs', None, '/proc'))
+    try:
+      _ = threading.Thread(name='InterferenceWatch', target=InterferenceWatch)
+      _.setDaemon(True)
+      _.start()
+    except threading.ThreadError:
+      st.node.interference = None
+      print "Main:WARNING: Cannot start interference watch; continuing without it"
+  if st.get_param('slack_watch', 'quota_controller', False) is True:
+    if st.verbose:
+      print "Main: Starting slack watch"
+    try:
+      _ = threading.Thread(name='SlackWatch', target=SlackWatch)
+      _.setDaemon(True)
+      _.start()
+    except threading.ThreadError:
+      print "Main:WARNING: Cannot start slack watch; continuing with polling only"
 
 
   # control loop
   cycle = 0
+  deadline = st.Monotonic()
   while 1:
 
+    # sample the QoS data store and the local CPU stats concurrently
+    cycle_start = st.Monotonic()
+    cpu_usage = SampleAll()
+    sampled = st.Monotonic()
+
     old_enabled = st.enabled
     st.enabled = ControllerEnabled()
 
@@ -457,20 +813,17 @@ def __init__():
 
     if not st.enabled:
       print "Main:WARNING: BE Controller is disabled, skipping main control"
-      time.sleep(period)
+      deadline = WaitNextCycle(deadline, period)
       continue
 
     if st.get_param('disabled', 'quota_controller', False) is True:
       print "Main:WARNING: CPU controller is disabled"
-      time.sleep(period)
+      deadline = WaitNextCycle(deadline, period)
       continue
 
-    # check SLO slack from file
+    # check SLO slack
     slo_slack, latency = SloSlack(st.node.qos_app)
 
-    # get CPU stats
-    cpu_usage = CpuStats()
-
     at = dt.now().strftime('%H:%M:%S')
 
     quota_cycle_data = {
@@ -479,6 +832,9 @@ def __init__():
         "slack": slo_slack,
         "latency": latency,
         "cpu_usage": cpu_usage,
+        "hp_cpu_usage": st.node.hp_cpu_percent,
+        "be_cpu_usage": st.node.be_cpu_percent,
+        "max_core_load": max(st.node.core_load or [0.0]),
         "hp_pods": st.active.hp_pods,
         "be_pods": st.active.be_pods,
         "be_quota": st.node.be_quota
@@ -488,58 +844,45 @@ def __init__():
       print "Main: Quota controller cycle", cycle, "at", dt.now().strftime('%H:%M:%S')
       print "Main: Current state:"
       print "Main:   Qos app", st.node.qos_app, " SLO slack", slo_slack, " CPU utilization", cpu_usage
-      print "Main:   HP (%d)" % (st.active.hp_pods)
-      print "Main:   BE (%d): %d quota" % (st.active.be_pods, st.node.be_quota)
-
-    # grow, shrink or disable control
-    # Disable
-    if slo_slack < slack_threshold_disable and st.active.be_pods:
-      quota_cycle_data["action"] = "disable_be"
+      print "Main:   Per-core utilization", " ".join(["%.0f" % _ for _ in st.node.core_load])
+      print "Main:   HP (%d): %.2f CPU" % (st.active.hp_pods, st.node.hp_cpu_percent)
+      print "Main:   BE (%d): %d quota, %.2f CPU" % (st.active.be_pods, st.node.be_quota, st.node.be_cpu_percent)
+
+    # peak local interference since the last cycle
+    signals = None
+    if st.node.interference is not None:
+      signals = st.node.interference.snapshot()
+      for name, value in signals.items():
+        quota_cycle_data["interference_" + name] = value
       if st.verbose:
-        print "Main:Action: Disabling BE"
-      DisableBE()
-    # Reset to minimum
-    elif slo_slack < slack_threshold_reset and st.active.be_pods:
-      quota_cycle_data["action"] = "reset_be"
-      if st.verbose:
-        print "Main:Action: Resetting BE"
-      ResetBE()
-    # Shrink quota due to slack
-    elif slo_slack < slack_threshold_shrink and st.active.be_pods:
-      quota_cycle_data["action"] = "shrink_be"
-      if st.verbose:
-        print "Main:Action: Shrinking BE"
-      ShrinkBE(slo_slack-slack_threshold_shrink)
-    # Shrink quota due to high utilization
-    elif cpu_usage > load_threshold_shrink and st.active.be_pods:
-      quota_cycle_data["action"] = "shrink_be"
-      if st.verbose:
-        print "Main:Action: Shrinking BE"
-      ShrinkBE((load_threshold_shrink - cpu_usage)/100.0)
-    # Enable best effort
-    elif slo_slack > slack_threshold_grow and \
-         cpu_usage < load_threshold_grow and not st.active.be_pods:
-      quota_cycle_data["action"] = "enable_be"
-      if st.verbose:
-        print "Main:Action: Enabling BE"
-      EnableBE()
-    # Grow best effort
-    elif slo_slack > slack_threshold_grow and \
-      cpu_usage < load_threshold_grow and st.active.be_pods:
-      quota_cycle_data["action"] = "grow_be"
-      if st.verbose:
-        print "Main:Action: Growing BE"
-      GrowBE(slo_slack)
-    # Default
-    else:
-      quota_cycle_data["action"] = "none"
-      if st.verbose:
-        print "Main:Action: No change"
+        print "Main:   Interference", " ".join(["%s %.2f" % _ for _ in sorted(signals.items())])
+
+    # decide
+    start = st.Monotonic()
+    action, arg = DecideBE(slo_slack, cpu_usage, signals)
+    decided = st.Monotonic()
+    # actuate
+    quota_cycle_data["action"] = ActuateBE(action, arg)
+    if arg is not None:
+      quota_cycle_data["rate"] = arg
+    actuated = st.Monotonic()
+
+    EvictionStats(quota_cycle_data)
+    quota_cycle_data["sample_ms"] = 1000 * (sampled - cycle_start)
+    quota_cycle_data["decide_ms"] = 1000 * (decided - start)
+    quota_cycle_data["actuate_ms"] = 1000 * (actuated - decided)
+    if st.verbose:
+      print "Main:   Sample %.1f ms, decide %.1f ms, actuate %.1f ms" \
+            % (quota_cycle_data["sample_ms"], quota_cycle_data["decide_ms"], quota_cycle_data["actuate_ms"])
 
     if st.get_param('write_metrics', 'quota_controller', False) is True:
       st.stats_writer.write(at, st.node.name, "cpu_quota", quota_cycle_data)
+      st.stats_writer.write_tagged(at, st.node.name, "cpu_quota_cont", AllocationStats())
+      # wait and hold times of the pod tracking locks
+      st.stats_writer.write(at, st.node.name, "locks", rwlock.Stats())
 
     cycle += 1
-    time.sleep(period)
+    deadline = WaitNextCycle(deadline, period)
 
-__init__()
+if __name__ == '__main__':
+  __init__()
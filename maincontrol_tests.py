@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from testutil import MakePod
+from kubernetes.client.rest import ApiException
+import settings as st
+import maincontrol as mc
+import cgroup as cg
+import evictor
+import quotaclass
+
+class FakeKenv(object):
+    """ Records node patches, failing the first ones
+    """
+    def __init__(self, failures=0):
+        self.patches = []
+        self.deleted = []
+        self.failures = failures
+        # kills of pod 'stuck' block until released
+        self.release = threading.Event()
+
+    def patch_node(self, name, body):
+        self.patches.append((name, body))
+        if len(self.patches) <= self.failures:
+            raise ApiException(status=422, reason='Unprocessable Entity')
+
+    def delete_namespaced_pod(self, name, namespace, body, **kwargs):
+        self.deleted.append((namespace, name, kwargs['_request_timeout']))
+        if name == 'stuck':
+            self.release.wait()
+        if name == 'bad':
+            raise ApiException(status=403, reason='Forbidden')
+
+def EvictionStats(until, deadline=10.0):
+    """ Sums the eviction stats of cycles until until(totals) holds, or the deadline (s) passes
+    """
+    totals = {'evictions': 0, 'eviction_failures': 0, 'eviction_stragglers': 0, 'eviction_max_ms': 0.0}
+    end = time.time() + deadline
+    while not until(totals) and time.time() < end:
+        data = {}
+        mc.EvictionStats(data)
+        for key, value in data.items():
+            totals[key] = max(totals[key], value) if key == 'eviction_max_ms' else totals[key] + value
+        time.sleep(0.001)
+    return totals
+
+class TestMaincontrolMethods(unittest.TestCase):
+    def setUp(self):
+        self.node = st.node
+        self.params = st.params
+        self.active = st.active
+        st.active = st.ActivePods()
+        st.node = st.NodeInfo()
+        st.node.name = 'node-1'
+        st.params = {'label_backoff': 0.0}
+
+    def tearDown(self):
+        st.node = self.node
+        st.params = self.params
+        st.active = self.active
+
+    def test_label_node(self):
+        st.node.kenv = FakeKenv(failures=1)
+        self.assertTrue(mc.LabelNode('true'))
+        # a JSON patch, retried once
+        self.assertEqual(st.node.kenv.patches, [('node-1', [
+            {'op': 'add', 'path': '/metadata/labels/hyperpilot.io~1be-enabled', 'value': 'true'}])] * 2)
+        self.assertEqual(st.node.be_label, 'true')
+        # unchanged labels are not patched again
+        self.assertTrue(mc.LabelNode('true'))
+        self.assertEqual(len(st.node.kenv.patches), 2)
+        st.node.kenv = FakeKenv(failures=3)
+        self.assertFalse(mc.LabelNode('false'))
+        self.assertEqual(st.node.be_label, 'true')
+
+    def test_allocation_stats(self):
+        st.active.publish('default/be', MakePod('be', 'BE', ['a' * 64], 5000))
+        st.active.publish('default/hp', MakePod('hp', 'HP', ['b' * 64]))
+        st.active.snapshot.pods['default/be'].containers['a' * 64].nr_throttled = 3
+        # one point per BE container, tagged with it
+        self.assertEqual(mc.AllocationStats(), [({'container': 'a' * 12, 'pod': 'be'}, {'alloc': 5000, 'throttled': 3})])
+
+    def test_evict_be(self):
+        st.node.kenv = FakeKenv()
+        st.node.evictor = evictor.Evictor(mc.KillPod, 2, 0.02)
+        pods = [MakePod('ok', 'BE', ['a']), MakePod('bad', 'BE', ['b']), MakePod('stuck', 'BE', ['c'])]
+        for pod in pods:
+            st.active.publish('default/' + pod.name, pod)
+        mc.EvictBE(pods)
+        # the stuck kill is reported while it runs
+        totals = EvictionStats(lambda _: _['eviction_stragglers'] and _['evictions'] + _['eviction_failures'] == 2)
+        self.assertEqual((totals['evictions'], totals['eviction_failures'], totals['eviction_stragglers']), (1, 1, 1))
+        st.node.kenv.release.set()
+        totals = EvictionStats(lambda _: _['evictions'] == 1)
+        self.assertTrue(totals['eviction_max_ms'] >= 20)
+        self.assertEqual(sorted(st.node.kenv.deleted), [('default', 'bad', 0.02), ('default', 'ok', 0.02),
+                                                        ('default', 'stuck', 0.02)])
+        # killed pods still listed are not killed again, failed ones are
+        mc.EvictBE(pods)
+        self.assertEqual(EvictionStats(lambda _: _['eviction_failures'])['evictions'], 0)
+        self.assertEqual(len(st.node.kenv.deleted), 4)
+        # a pod recreated with the same name is
+        st.active.publish('default/ok', MakePod('ok', 'BE', ['d'], uid='ok-2'))
+        mc.EvictBE(st.active.snapshot.be_pods)
+        EvictionStats(lambda _: _['evictions'])
+        self.assertEqual([_ for _ in st.node.kenv.deleted if _[1] == 'ok'], [('default', 'ok', 0.02)] * 2)
+
+    def test_aggregate_be(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        group = 'kubepods/besteffort'
+        for key in [group, group + '/pod1', group + '/pod1/c1']:
+            os.makedirs(root + '/cpu/' + key)
+            for knob, value in [('cpu.cfs_quota_us', '50000'), ('cpu.cfs_period_us', '100000')]:
+                with open(root + '/cpu/' + key + '/' + knob, 'w') as _:
+                    _.write(value)
+        acct = cg.MakeCgroup(root)
+        st.node.cpu = 4
+        st.node.quotactl = quotaclass.QuotaClass(acct)
+        st.params['quota_controller'] = {'min_be_quota': 0.1, 'max_be_quota': 0.5}
+        # the quota moves from the containers to the BE cgroup
+        mc.ConfigAggregateBE(group)
+        self.assertEqual(st.node.be_group, group)
+        self.assertEqual(acct.cpuQuota(group), (40000, 100000))
+        self.assertEqual(acct.cpuQuota(group + '/pod1/c1')[0], -1)
+        self.assertEqual(st.node.be_quota, 40000)
+        # scaled within [min_be_quota, max_be_quota]
+        mc.GrowBE(3.0)
+        self.assertEqual(acct.cpuQuota(group)[0], 120000)
+        mc.GrowBE(3.0)
+        self.assertEqual(acct.cpuQuota(group)[0], 200000)
+        mc.ShrinkBE(0.1)
+        self.assertEqual(acct.cpuQuota(group)[0], 40000)
+        # without quota, the BE cgroup may use the whole node
+        mc.SetQuotaBE(0)
+        self.assertEqual(acct.cpuQuota(group)[0], 400000)
+        self.assertEqual(st.node.be_quota, 400000)
+        mc.SetQuotaBE(40000)
+        self.assertEqual(st.node.be_quota, 40000)
+        # a failed write keeps the quota that was applied
+        shutil.rmtree(root + '/cpu/' + group)
+        mc.SetGroupQuotaBE(80000)
+        self.assertEqual(st.node.be_quota, 40000)
+
+    def test_aggregate_be_docker(self):
+        st.node.quotactl = quotaclass.QuotaClass(cg.CgroupV1(tempfile.gettempdir() + '/nonexistent'))
+        # per-container mode without the cpu cgroup
+        mc.ConfigAggregateBE('kubepods/besteffort')
+        self.assertEqual(st.node.be_group, None)
+
+if __name__ == '__main__':
+    unittest.main()
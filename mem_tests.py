@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+import testutil
+import cgroup as cg
+import memclass
+import memcontrol
+
+BE = 'kubepods/besteffort/pod1/c1'
+HP = 'kubepods/burstable/pod2/c2'
+STAT_V2 = "anon %d\nfile %d\ninactive_file %d\npgscan %d\nworkingset_refault_file %d\npgmajfault %d\n"
+
+def Write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as _:
+        _.write(text)
+
+def Read(path):
+    with open(path) as _:
+        return _.read()
+
+class TestMemMethods(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_v1(self):
+        r = self.root
+        Write(r + '/memory/' + BE + '/memory.usage_in_bytes', '4096\n')
+        Write(r + '/memory/' + BE + '/memory.stat', 'cache 1\nrss 2\ntotal_cache 1024\ntotal_rss 2048\n'
+              'total_inactive_file 512\ntotal_pgmajfault 3\n')
+        c = cg.MakeCgroup(r)
+        self.assertEqual(c.memStat(BE), {'usage': 4096, 'anon': 2048, 'file': 1024, 'inactive_file': 512,
+                                         'pgscan': 0, 'refault': 0, 'pgmajfault': 3})
+        c.setMemLimit(BE, 1 << 20)
+        self.assertEqual(Read(r + '/memory/' + BE + '/memory.limit_in_bytes'), str(1 << 20))
+
+    def test_sample_and_limit(self):
+        r = self.root
+        Write(r + '/cgroup.controllers', 'cpu io memory\n')
+        for key in [BE, HP]:
+            Write(r + '/' + key + '/memory.current', '%d\n' % (100 << 20))
+            Write(r + '/' + key + '/memory.stat', STAT_V2 % (60 << 20, 40 << 20, 20 << 20, 0, 0, 0))
+        mem = memclass.MemClass(cg.MakeCgroup(r), 10 << 20)
+        stats = mem.sample([BE, HP], 0.0)
+        self.assertEqual(stats[HP], {'usage': 100 << 20, 'working_set': 80 << 20, 'reclaim': 0.0})
+        Write(r + '/' + HP + '/memory.stat', STAT_V2 % (60 << 20, 40 << 20, 20 << 20, 300, 100, 100))
+        self.assertEqual(mem.sample([BE, HP], 2.0)[HP]['reclaim'], 250.0)
+        limits = mem.setLimits(50 << 20, {BE: 80 << 20})
+        self.assertEqual(limits, {BE: 50 << 20})
+        self.assertEqual(Read(r + '/' + BE + '/memory.high'), str(50 << 20))
+        mem.clearLimits()
+        self.assertEqual(Read(r + '/' + BE + '/memory.high'), 'max')
+
+    def test_budget(self):
+        step = 64 << 20
+        # the first cycle starts at the ceiling, then grows towards it
+        self.assertEqual(memcontrol.NextBudget(None, 8 << 30, 0, 0, step, 100.0, 0.2, 0.05), (8 << 30, 'none'))
+        self.assertEqual(memcontrol.NextBudget(4 << 30, 8 << 30, 0, 0, step, 100.0, 0.2, 0.05),
+                         (int((4 << 30) * 1.05), 'grow_be'))
+        self.assertEqual(memcontrol.NextBudget(4 << 30, 8 << 30, 500, 0, step, 100.0, 0.2, 0.05),
+                         (int((4 << 30) * 0.8), 'shrink_be'))
+        # BE containers keep their min limit, even above the ceiling
+        self.assertEqual(memcontrol.NextBudget(4 << 30, 0, 0, 2 * step, step, 100.0, 0.2, 0.05), (2 * step, 'none'))
+        # a budget that dropped to 0 without BE pods recovers
+        budget, _ = memcontrol.NextBudget(4 << 30, 0, 0, 0, step, 100.0, 0.2, 0.05)
+        self.assertEqual(budget, 0)
+        for _ in range(3):
+            budget, action = memcontrol.NextBudget(budget, 8 << 30, 0, 0, step, 100.0, 0.2, 0.05)
+        self.assertEqual((budget, action), (3 * step, 'grow_be'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Memory utilities class
+
+Current assumptions:
+ - Memory controller is enabled in cgroups (v1 or v2)
+ - Working set is usage minus inactive page cache, as kubelet counts it
+ - Reclaim activity is scans, refaults and major faults, in events per second
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import allocator
+
+def MemTotal(procfs='/proc'):
+  """ Returns the memory of the node in bytes, from /proc/meminfo
+  """
+  with open(procfs + '/meminfo') as _:
+    for line in _:
+      if line.startswith('MemTotal:'):
+        return int(line.split()[1]) * 1024
+  raise Exception('Cannot find MemTotal in /proc/meminfo')
+
+
+class MemClass(object):
+  """This class tracks memory usage and reclaim of containers and limits BE containers.
+
+     On cgroup v2, BE limits are memory.high: a BE container above it is
+     throttled and reclaimed, never OOM killed. On v1 the only per-cgroup
+     limit that forces reclaim is the hard limit, so BE containers that cannot
+     be reclaimed under it are OOM killed.
+
+     Useful documents and examples:
+      - cgroup v2 memory controller
+        https://www.kernel.org/doc/Documentation/cgroup-v2.txt
+      - cgroup v1 memory controller
+        https://www.kernel.org/doc/Documentation/cgroup-v1/memory.txt
+  """
+  def __init__(self, cgroup, min_limit):
+    self.cgroup = cgroup
+    self.min_limit = min_limit
+    self.timestamp = None
+    # previous counters per container key
+    self.prev = {}
+    # limit last written per BE container key
+    self.limits = {}
+
+
+  def sample(self, keys, now):
+    """ Returns {key: {usage, working_set, reclaim}}: bytes and reclaim events per second
+        Containers seen for the first time report no reclaim.
+    """
+    elapsed = (now - self.timestamp) if self.timestamp is not None else 0.0
+    stats = {}
+    current = {}
+    for key in keys:
+      try:
+        counters = self.cgroup.memStat(key)
+      except (EnvironmentError, ValueError):
+        print 'Mem:WARNING: Memory cgroup not configured for container %s' % key
+        continue
+      current[key] = counters
+      events = counters['pgscan'] + counters['refault'] + counters['pgmajfault']
+      prev = self.prev.get(key)
+      reclaim = 0.0
+      if prev is not None and elapsed > 0:
+        reclaim = max(events - (prev['pgscan'] + prev['refault'] + prev['pgmajfault']), 0) / elapsed
+      stats[key] = {
+          'usage': counters['usage'],
+          'working_set': max(counters['usage'] - counters['inactive_file'], 0),
+          'reclaim': reclaim
+      }
+    self.timestamp = now
+    self.prev = current
+    return stats
+
+
+  def setLimits(self, budget, demands):
+    """ Splits budget (bytes) over BE containers by water-filling their demands {key: bytes}
+        only limits that change by more than 1% are written; returns {key: limit}
+    """
+    limits = allocator.WaterFill(budget, demands, self.min_limit, max(budget, self.min_limit))
+    for key, limit in limits.items():
+      limit = int(limit)
+      limits[key] = limit
+      old = self.limits.get(key)
+      if old is not None and abs(limit - old) <= 0.01 * old:
+        continue
+      try:
+        self.cgroup.setMemLimit(key, limit)
+        self.limits[key] = limit
+      except EnvironmentError as e:
+        print 'Mem:WARNING: Cannot set memory limit of container %s: %s' % (key, e)
+    # forget containers that are gone
+    for key in self.limits.keys():
+      if key not in demands:
+        del self.limits[key]
+    return limits
+
+
+  def clearLimits(self):
+    """ Removes the limits of all BE containers
+    """
+    for key in self.limits.keys():
+      try:
+        self.cgroup.setMemLimit(key, -1)
+      except EnvironmentError as e:
+        print 'Mem:WARNING: Cannot clear memory limit of container %s: %s' % (key, e)
+    self.limits = {}
@@ -0,0 +1,127 @@
+"""
+Memory controller
+
+Current assumptions:
+ - BE memory is what HP leaves of the node, minus headroom and a reserve
+ - Reclaim in HP containers means BE memory is hurting them
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+# standard
+import time
+from datetime import datetime as dt
+
+# hyperpilot imports
+import settings as st
+import memclass
+
+MB = 1024 * 1024
+
+def NextBudget(budget, ceiling, hp_reclaim, min_budget, step, reclaim_threshold, shrink_ratio, growth_ratio):
+  """ returns the next BE budget and the action taken
+      BE gets what HP leaves (ceiling), and backs off while HP reclaims.
+      Growth is at least step, so a budget that dropped to 0 recovers.
+  """
+  action = "none"
+  if budget is None:
+    budget = ceiling
+  elif hp_reclaim > reclaim_threshold:
+    budget = int(budget * (1 - shrink_ratio))
+    action = "shrink_be"
+  elif budget < ceiling:
+    budget = max(int(budget * (1 + growth_ratio)), budget + step)
+    action = "grow_be"
+  # BE containers keep at least min_be_mb each
+  return max(min(budget, ceiling), min_budget), action
+
+
+def MemControll():
+  """ Memory controller
+  """
+  # initialize controller
+  memst = st.params['mem_controller']
+  total = memclass.MemTotal(st.get_param('procfs', None, '/proc'))
+  mem = memclass.MemClass(st.node.cgroup, st.get_param('min_be_mb', 'mem_controller', 64) * MB)
+  hp_headroom = st.get_param('hp_headroom', 'mem_controller', 0.1)
+  reserve = st.get_param('reserve_mb', 'mem_controller', 512) * MB
+  reclaim_threshold = st.get_param('reclaim_threshold', 'mem_controller', 100.0)
+  shrink_ratio = st.get_param('shrink_ratio', 'mem_controller', 0.2)
+  growth_ratio = st.get_param('growth_ratio', 'mem_controller', 0.05)
+  if st.verbose:
+    print "Mem: Starting MemControl (%d MB, reserve %d MB)" % (total / MB, reserve / MB)
+  period = memst['period']
+  cycle = 0
+  budget = None
+  was_enabled = False
+
+  # control loop
+  while 1:
+
+    # remove limits if the controller is turned off
+    disabled = st.get_param('disabled', 'mem_controller', False) is True
+    if was_enabled and (disabled or not st.enabled):
+      mem.clearLimits()
+      budget = None
+      was_enabled = False
+
+    if not st.enabled:
+      print "Mem:WARNING: BE Controller is disabled, skipping memory control"
+      time.sleep(period)
+      continue
+
+    if disabled:
+      print "Mem:WARNING: Memory Controller is disabled"
+      time.sleep(period)
+      continue
+
+    was_enabled = True
+
+    # get cgroups of all active containers
+    snapshot = st.active.snapshot
+    be_keys = snapshot.be_keys
+    keys = snapshot.containers.keys()
+
+    # get usage and reclaim statistics
+    stats = mem.sample(keys, st.Monotonic())
+    hp_usage = sum([s['usage'] for k, s in stats.items() if k not in be_keys])
+    hp_reclaim = sum([s['reclaim'] for k, s in stats.items() if k not in be_keys])
+    be_usage = sum([s['usage'] for k, s in stats.items() if k in be_keys])
+    be_reclaim = sum([s['reclaim'] for k, s in stats.items() if k in be_keys])
+
+    # actual controller: BE gets what HP leaves, and backs off while HP reclaims
+    ceiling = max(total - reserve - int(hp_usage * (1 + hp_headroom)), 0)
+    budget, action = NextBudget(budget, ceiling, hp_reclaim, mem.min_limit * len(be_keys), mem.min_limit,
+                                reclaim_threshold, shrink_ratio, growth_ratio)
+    demands = dict([(k, stats[k]['working_set'] * (1 + hp_headroom)) for k in be_keys if k in stats])
+    limits = mem.setLimits(budget, demands)
+
+    mem_cycle_data = {
+        "cycle": cycle,
+        "total_mb": total / MB,
+        "hp_usage_mb": hp_usage / MB,
+        "be_usage_mb": be_usage / MB,
+        "hp_reclaim": hp_reclaim,
+        "be_reclaim": be_reclaim,
+        "be_budget_mb": budget / MB,
+        "be_limit_mb": sum(limits.values()) / MB,
+        "action": action
+    }
+
+    at = dt.now().strftime('%H:%M:%S')
+
+    # loop
+    if st.verbose:
+      print "Mem: Memory controller cycle", cycle, "at", at
+      print "Mem:   Usage: %d MB (HP), %d MB (BE)" % (hp_usage / MB, be_usage / MB)
+      print "Mem:   Reclaim: %.0f/s (HP), %.0f/s (BE)" % (hp_reclaim, be_reclaim)
+      print "Mem:   BE budget %d MB (%s)" % (budget / MB, action)
+
+    if st.get_param('write_metrics', 'mem_controller', False) is True:
+      st.stats_writer.write(at, st.node.name, "mem", mem_cycle_data)
+
+    cycle += 1
+    time.sleep(period)
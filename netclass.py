@@ -5,8 +5,8 @@ Current assumptions:
 - Manual entry of max throughput
 - Each BE container has their own IP address
 - Not managing bursts for now
-- Using tc (htb) + iptables for outgoing traffic
-- Using tc (cbq) for incoming traffic
+- Using tc (htb) + iptables with an ipset of BE IPs for outgoing traffic
+- Using tc (cbq) with a u32 hash table of BE IPs for incoming traffic
 
 """
 
@@ -18,9 +18,44 @@ import re
 from datetime import datetime as dt
 import command_client as cc
 
+# unit multipliers of tc rates
+RATE_UNITS = {'': 1, 'K': 1000, 'M': 1000000, 'G': 1000000000}
+
+def ParseTcBatchErrors(text):
+  """ Parses the errors of tc -force -batch into {line: message}
+      tc prints the error of a line, then "Command failed -:<line>"
+  """
+  errors = {}
+  message = []
+  for line in text.splitlines():
+    match = re.search(r'Command failed -:(\d+)', line)
+    if match is None:
+      if line.strip():
+        message.append(line.strip())
+      continue
+    errors[int(match.group(1))] = ' '.join(message)
+    message = []
+  return errors
+
+
 class NetClass(object):
   """This class performs network bandwidth isolation using HTB/CBQ qdisc and ipfilters.
 
+     BE traffic is classified in constant time per packet: egress by one
+     iptables rule matching the ipset of BE IPs, ingress by a u32 hash table
+     keyed on the last byte of the destination IP. Adding or removing a BE IP
+     is one ipset entry and one u32 filter.
+
+     With per_pod_classes, each BE IP gets its own child class under the BE
+     class, in both directions. Children are guaranteed an equal share of the
+     BE limit and may borrow up to all of it, so one bulk transfer cannot
+     starve the other BE pods. Egress packets get the mark of their child
+     class from the ipset entry of their source IP (skbinfo).
+
+     Between begin() and commit(), ipset, tc and iptables changes are gathered
+     and applied with one ipset restore, one tc -batch and one iptables-restore
+     command, instead of one command (a fork on the host) each.
+
      Useful documents and examples:
       - Creating multiple htb service classes:
         http://luxik.cdi.cz/~devik/qos/htb/manual/userg.htm
@@ -29,14 +64,28 @@ class NetClass(object):
       - Common iptables commands
         http://www.thegeekstuff.com/2011/06/iptables-rules-examples
       - http://lartc.org/howto/lartc.ratelimit.single.html
+      - Hashing filters
+        http://lartc.org/howto/lartc.adv-filter.hashing.html
+      - ipset
+        http://ipset.netfilter.org/ipset.man.html
   """
-  def __init__(self, iface_ext, iface_cont, max_bw_mbps, link_bw_mbps, default_limit_mbps, ctlloc):
+  def __init__(self, iface_ext, iface_cont, max_bw_mbps, link_bw_mbps, default_limit_mbps, ctlloc, \
+               per_pod_classes=False):
     self.iface_ext = iface_ext
     self.iface_cont = iface_cont
     self.max_bw_mbps = max_bw_mbps
     self.link_bw_mbps = link_bw_mbps
     self.default_limit_mbps = default_limit_mbps
     self.mark = 6
+    self.per_pod_classes = per_pod_classes
+    # the ipset type differs with per pod marks, so does its name
+    self.ipset_name = 'hyperpilot-be-pods' if per_pod_classes else 'hyperpilot-be'
+    # child class minor (also the egress mark) of each BE IP, with per_pod_classes
+    # minors are written with decimal digits, tc reads and prints them as hex
+    self.pod_classes = {}
+    # u32 hash table of BE IPs and the filter handle of each IP
+    self.hash_table = 10
+    self.ingress_handles = {}
     self.cont_ips = set()
     self.cc = cc.CommandClient(ctlloc)
     self.stats_timestamp = None
@@ -44,96 +93,319 @@ class NetClass(object):
     self.ingress_total_bytes = 0
     self.egress_be_bytes = 0
     self.egress_total_bytes = 0
-
-    # reset IP tables
-    _, err = self.cc.run_command('iptables -t mangle -F')
+    # bytes of each class at the last stats, and per pod usage in mbps
+    self.egress_class_bytes = {}
+    self.ingress_class_bytes = {}
+    self.pod_bytes = {}
+    self.pod_mbps = {}
+    # ipset commands, tc commands and mangle rules gathered since begin(), None if not batching
+    # each is (command, error, IP whose filter it changes or None)
+    self.batch = None
+    # IPs added (True) or removed (False) since begin(), with their ingress handle and class minor
+    self.batch_ips = {}
+    # last BE limits set
+    self.egress_limit = None
+    self.ingress_limit = None
+
+    # HTB rate estimators are enabled through the module parameter, which exists
+    # once the module is loaded by a first HTB qdisc
+    _, err = self.cc.run_command('tc qdisc replace dev %s root handle 1: htb default 1 && ' \
+                                 'echo 1 > /sys/module/sch_htb/parameters/htb_rate_est' % self.iface_ext)
     if err:
-      raise Exception('Could not reset iptables: ' + err)
-
-    # make sure HTB is in a reasonable state to begin with
-    self.cc.run_command('tc qdisc del dev %s root' % self.iface_ext)
-    # replace root qdisc with HTB
-    # need to disable/enable HTB to get the stats working
-    success = self.cc.run_commands([
-        'tc qdisc add dev %s root handle 1: htb default 1' % self.iface_ext,
-        'echo 1 > /sys/module/sch_htb/parameters/htb_rate_est',
-        'tc qdisc del dev %s root' % self.iface_ext,
-        'tc qdisc add dev %s root handle 1: htb default 1' % self.iface_ext,
-        'tc class add dev %s parent 1: classid 1:1 htb rate %dmbit ceil %dmbit' \
-                        % (self.iface_ext, self.link_bw_mbps, self.link_bw_mbps),
-        'tc class add dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
-                        % (self.iface_ext, self.max_bw_mbps, self.max_bw_mbps),
-        'tc filter add dev %s parent 1: protocol all prio 10 handle %d fw flowid 1:10' \
-                        % (self.iface_ext, self.mark)])
-    if not success:
-      raise Exception('Could not setup htb qdisc')
-
-    # make sure CBQ is in a reasonable state to begin with
-    self.cc.run_command('tc qdisc del dev %s root' % self.iface_cont)
+      raise Exception('Could not setup htb qdisc: ' + err)
+
+    self.begin()
+    # empty set of BE IPs
+    self.ipset('create %s hash:ip%s' % (self.ipset_name, ' skbinfo' if per_pod_classes else ''), \
+               'Could not create ipset')
+    self.ipset('flush %s' % self.ipset_name, 'Could not reset ipset')
+    # reset IP tables, then mark all BE traffic with a single rule
+    self.mangle('-F', 'Could not reset iptables')
+    if per_pod_classes:
+      self.mangle('-A PREROUTING -i %s -j SET --map-set %s src --map-mark' \
+                  % (self.iface_cont, self.ipset_name), 'Could not setup iptables')
+    else:
+      self.mangle('-A PREROUTING -i %s -m set --match-set %s src -j MARK --set-mark %d' \
+                  % (self.iface_cont, self.ipset_name, self.mark), 'Could not setup iptables')
+    # recreate the root qdisc with HTB, so the estimators are on
+    self.tc('qdisc del dev %s root' % self.iface_ext, 'Could not setup htb qdisc')
+    self.tc('qdisc add dev %s root handle 1: htb default 1' % self.iface_ext, 'Could not setup htb qdisc')
+    self.tc('class add dev %s parent 1: classid 1:1 htb rate %dmbit ceil %dmbit' \
+            % (self.iface_ext, self.link_bw_mbps, self.link_bw_mbps), 'Could not setup htb qdisc')
+    self.tc('class add dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
+            % (self.iface_ext, self.max_bw_mbps, self.max_bw_mbps), 'Could not setup htb qdisc')
+    self.tc('filter add dev %s parent 1: protocol all prio 10 handle %d fw flowid 1:10' \
+            % (self.iface_ext, self.mark), 'Could not setup htb qdisc')
+    # make sure CBQ is in a reasonable state to begin with, there may be no root qdisc
+    self.tc('qdisc del dev %s root' % self.iface_cont)
     # replace root qdisc with CBQ
-    success = self.cc.run_commands([
-        'tc qdisc replace dev %s root handle 2: cbq avpkt 1000 bandwidth %dmbit' \
-            % (self.iface_cont, self.link_bw_mbps),
-   	    'tc class replace dev %s parent 2: classid 2:10 cbq rate %dmbit allot 1500 prio 5 bounded isolated'\
-            % (self.iface_cont, self.link_bw_mbps)])
-    if not success:
-      raise Exception('Could not setup cbq qdisc')
+    self.tc('qdisc replace dev %s root handle 2: cbq avpkt 1000 bandwidth %dmbit' \
+            % (self.iface_cont, self.link_bw_mbps), 'Could not setup cbq qdisc')
+    self.tc('class replace dev %s parent 2: classid 2:10 cbq rate %dmbit allot 1500 prio 5 bounded isolated' \
+            % (self.iface_cont, self.link_bw_mbps), 'Could not setup cbq qdisc')
+    # hash table with 256 buckets, picked by the last byte of the destination IP
+    self.tc('filter add dev %s parent 2: prio 16 handle %d: protocol ip u32 divisor 256' \
+            % (self.iface_cont, self.hash_table), 'Could not setup u32 hash table')
+    self.tc('filter add dev %s parent 2: prio 16 protocol ip u32 ht 800:: match ip dst 0.0.0.0/0 ' \
+            'hashkey mask 0x000000ff at 16 link %d:' % (self.iface_cont, self.hash_table), \
+            'Could not setup u32 hash table')
+    failed = self.commit()
+    if failed:
+      raise Exception('; '.join(['%s (%s)' % (e, c) for c, e in failed]))
 
     # init stats
     self.initStats()
 
 
+  def begin(self):
+    """ Starts gathering tc and iptables changes, until commit()
+    """
+    self.batch = ([], [], [])
+    self.batch_ips = {}
+
+
+  def commit(self):
+    """ Applies the changes gathered since begin(), with one ipset restore, one tc -batch
+        and one iptables-restore; returns [(command, error)] of the failed commands
+        IPs with a failed command are rolled back, so the controller retries them:
+        a failed add is removed again, ignoring errors, a failed removal is kept
+    """
+    ipset, tc, mangle = self.batch
+    changes = self.batch_ips
+    self.batch = None
+    self.batch_ips = {}
+    failed = []
+    # sets first, the iptables rules may use them
+    if ipset:
+      failed.extend(self.restore('ipset restore -exist', '\n'.join([c for c, _, _ in ipset]), \
+                                 'ipset -exist ', ipset))
+    if tc:
+      script = '\n'.join([c for c, _, _ in tc])
+      _, err = self.cc.run_command("tc -force -batch - <<'EOF'\n%s\nEOF" % script)
+      if err:
+        errors = ParseTcBatchErrors(err)
+        for line, (command, error, ip) in enumerate(tc, 1):
+          # an error we cannot attribute to a line fails all of them
+          if error and (line in errors or not errors):
+            failed.append(('tc ' + command, '%s: %s' % (error, errors.get(line, err)), ip))
+    if mangle:
+      script = '\n'.join(['*mangle'] + [r for r, _, _ in mangle] + ['COMMIT'])
+      failed.extend(self.restore('iptables-restore --noflush', script, 'iptables -t mangle ', mangle))
+    # limits may not be what we think, write them again next time
+    if failed:
+      self.egress_limit = None
+      self.ingress_limit = None
+    for cont_ip in set([ip for _, _, ip in failed if ip in changes]):
+      self.rollback(cont_ip, *changes[cont_ip])
+    return [(command, error) for command, error, _ in failed]
+
+
+  def rollback(self, cont_ip, added, handle, minor):
+    """ Undoes the tracking of an IP whose filter change failed to apply
+    """
+    if added:
+      self.removeIPfromFilter(cont_ip, quiet=True)
+    else:
+      self.cont_ips.add(cont_ip)
+      self.ingress_handles[cont_ip] = handle
+      if minor is not None:
+        self.pod_classes[cont_ip] = minor
+
+
+  def restore(self, restore, script, prefix, lines):
+    """ Feeds script to a restore command; if it fails, runs the (command, error, IP)
+        lines one by one with prefix, to keep the good ones and find the ones that fail
+        returns [(command, error, IP)] of the failed lines
+    """
+    _, err = self.cc.run_command("%s <<'EOF'\n%s\nEOF" % (restore, script))
+    if not err:
+      return []
+    failed = []
+    for command, error, ip in lines:
+      _, err = self.cc.run_command(prefix + command)
+      if err and error:
+        failed.append((prefix + command, '%s: %s' % (error, err), ip))
+    return failed
+
+
+  def ipset(self, command, error=None, ip=None):
+    """ Runs an ipset command (without "ipset"), or adds it to the batch for the filter of ip
+        existing entries are not errors; if it fails, raises Exception(error),
+        or with no error ignores it
+    """
+    if self.batch is not None:
+      self.batch[0].append((command, error, ip))
+      return
+    _, err = self.cc.run_command('ipset -exist ' + command)
+    if err and error:
+      raise Exception('%s: %s' % (error, err))
+
+
+  def tc(self, command, error=None, ip=None):
+    """ Runs a tc command (without "tc"), or adds it to the batch for the filter of ip
+        if it fails, raises Exception(error), or with no error ignores it
+    """
+    if self.batch is not None:
+      self.batch[1].append((command, error, ip))
+      return
+    _, err = self.cc.run_command('tc ' + command)
+    if err and error:
+      raise Exception('%s: %s' % (error, err))
+
+
+  def mangle(self, rule, error=None, ip=None):
+    """ Applies an iptables rule to the mangle table, or adds it to the batch for the filter of ip
+        if it fails, raises Exception(error), or with no error ignores it
+    """
+    if self.batch is not None:
+      self.batch[2].append((rule, error, ip))
+      return
+    _, err = self.cc.run_command('iptables -t mangle ' + rule)
+    if err and error:
+      raise Exception('%s: %s' % (error, err))
+
+
   def addIPtoFilter(self, cont_ip):
     """ Adds the IP of a container to the IPtables filter
     """
     if cont_ip in self.cont_ips:
       raise Exception('Duplicate filter for IP %s' % cont_ip)
     self.cont_ips.add(cont_ip)
+    handle = self.ingressHandle(cont_ip)
+    self.ingress_handles[cont_ip] = handle
 
     # egress
-    _, err = self.cc.run_command('iptables -t mangle -A PREROUTING -i %s -s %s -j MARK --set-mark %d' \
-                               % (self.iface_cont, cont_ip, self.mark))
-    if err:
-      raise Exception('Could not add iptable filter for %s: %s' % (cont_ip, err))
-    # ingress
-    _, err = self.cc.run_command('tc filter add dev %s parent 2: protocol ip prio 16 u32 match ip dst %s flowid 2:10' \
-                               % (self.iface_cont, cont_ip))
-    if err:
-      raise Exception('Could not add cbq filter for %s: %s' % (cont_ip, err))
-
-
-  def removeIPfromFilter(self, cont_ip):
-    """ Adds the IP of a container to the IPtables filter
+    flowid = 10
+    if self.per_pod_classes:
+      flowid = self.addPodClasses(cont_ip)
+      self.ipset('add %s %s skbmark %d' % (self.ipset_name, cont_ip, flowid), \
+                 'Could not add %s to ipset' % cont_ip, cont_ip)
+    else:
+      self.ipset('add %s %s' % (self.ipset_name, cont_ip), 'Could not add %s to ipset' % cont_ip, cont_ip)
+    # ingress, in the bucket of the last byte of the IP
+    self.tc('filter add dev %s parent 2: prio 16 handle %s protocol ip u32 ht %s: match ip dst %s/32 flowid 2:%d' \
+            % (self.iface_cont, handle, handle.rsplit(':', 1)[0], cont_ip, flowid), \
+            'Could not add cbq filter for %s' % cont_ip, cont_ip)
+    if self.batch is not None:
+      self.batch_ips[cont_ip] = (True, handle, self.pod_classes.get(cont_ip))
+
+
+  def removeIPfromFilter(self, cont_ip, quiet=False):
+    """ Removes the IP of a container from the IPtables filter
+        quiet ignores errors, to clean up after a failed add
     """
     if cont_ip not in self.cont_ips:
       raise Exception('Not existing filter for %s' % cont_ip)
     self.cont_ips.remove(cont_ip)
+    handle = self.ingress_handles.pop(cont_ip)
+    if self.batch is not None:
+      self.batch_ips[cont_ip] = (False, handle, self.pod_classes.get(cont_ip))
+    error = lambda message: None if quiet else message
 
     #egress
-    _, err = self.cc.run_command('iptables -t mangle -D PREROUTING -i %s -s %s -j MARK --set-mark %d' \
-                               % (self.iface_cont, cont_ip, self.mark))
-    if err:
-      raise Exception('Could not remove iptable filter for %s: %s' % (cont_ip, err))
-    #ingress
-    _, err = self.cc.run_command('tc filter del dev %s prio 16' % (self.iface_cont))
-    if err:
-      raise Exception('Could not remove cbq filter for %s: %s' % (cont_ip, err))
+    self.ipset('del %s %s' % (self.ipset_name, cont_ip), error('Could not remove %s from ipset' % cont_ip), cont_ip)
+    #ingress, only the filter of this IP
+    self.tc('filter del dev %s parent 2: prio 16 handle %s protocol ip u32' % (self.iface_cont, handle), \
+            error('Could not remove cbq filter for %s' % cont_ip), cont_ip)
+    if self.per_pod_classes:
+      self.removePodClasses(cont_ip, quiet)
+
+
+  def podShare(self, bw_mbps):
+    """ Rate guaranteed to each child class under a BE limit
+    """
+    return max(int(bw_mbps / max(len(self.pod_classes), 1)), 1)
+
+
+  def addPodClasses(self, cont_ip):
+    """ Adds the child classes of a BE IP and the egress filter of its mark
+        returns the class minor
+    """
+    used = set(self.pod_classes.values())
+    minor = 1001
+    while minor in used:
+      minor += 1
+    self.pod_classes[cont_ip] = minor
+    # shares of the other children are updated with the next limits
+    egress = self.egress_limit or self.max_bw_mbps
+    ingress = self.ingress_limit or self.link_bw_mbps
+    self.tc('class add dev %s parent 1:10 classid 1:%d htb rate %dmbit ceil %dmbit' \
+            % (self.iface_ext, minor, self.podShare(egress), egress), 'Could not add htb class for %s' % cont_ip, \
+            cont_ip)
+    self.tc('filter add dev %s parent 1: protocol all prio 10 handle %d fw flowid 1:%d' \
+            % (self.iface_ext, minor, minor), 'Could not add htb filter for %s' % cont_ip, cont_ip)
+    self.tc('class add dev %s parent 2:10 classid 2:%d cbq rate %dmbit allot 1500 prio 5 avpkt 1000' \
+            % (self.iface_cont, minor, self.podShare(ingress)), 'Could not add cbq class for %s' % cont_ip, \
+            cont_ip)
+    self.egress_limit = None
+    self.ingress_limit = None
+    return minor
+
+
+  def removePodClasses(self, cont_ip, quiet=False):
+    """ Removes the child classes of a BE IP, after its filters
+        quiet ignores errors, to clean up after a failed add
+    """
+    minor = self.pod_classes.pop(cont_ip)
+    error = lambda message: None if quiet else message
+    self.tc('filter del dev %s parent 1: prio 10 handle %d fw' % (self.iface_ext, minor), \
+            error('Could not remove htb filter for %s' % cont_ip), cont_ip)
+    self.tc('class del dev %s classid 1:%d' % (self.iface_ext, minor), \
+            error('Could not remove htb class for %s' % cont_ip), cont_ip)
+    self.tc('class del dev %s classid 2:%d' % (self.iface_cont, minor), \
+            error('Could not remove cbq class for %s' % cont_ip), cont_ip)
+    self.egress_limit = None
+    self.ingress_limit = None
+
+
+  def ingressHandle(self, cont_ip):
+    """ Picks a free u32 filter handle in the hash bucket of an IP
+    """
+    bucket = '%d:%x:' % (self.hash_table, int(cont_ip.split('.')[-1]))
+    used = set([h for h in self.ingress_handles.values() if h.startswith(bucket)])
+    node = 1
+    while '%s%x' % (bucket, node) in used:
+      node += 1
+    return '%s%x' % (bucket, node)
+
+
+  @staticmethod
+  def beBwLimit(max_bw_mbps, hp_mbps, default_limit_mbps):
+    """ BE bandwidth limit: what HP leaves of the max bandwidth, minus a 10% margin
+        never lower than the default limit
+    """
+    limit = max_bw_mbps - hp_mbps - max(0.10*max_bw_mbps, 0.10*hp_mbps)
+    if limit < default_limit_mbps:
+      limit = default_limit_mbps
+    return limit
 
 
   def setEgressBwLimit(self, bw_mbps):
+    # unchanged limits are not rewritten
+    if bw_mbps == self.egress_limit:
+      return
     # replace always work for tc filter
-    _, err = self.cc.run_command('tc class replace dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
-                               % (self.iface_ext, bw_mbps, bw_mbps))
-    if err:
-      raise Exception('Could not change htb class rate: ' + err)
+    self.tc('class replace dev %s parent 1: classid 1:10 htb rate %dmbit ceil %dmbit' \
+            % (self.iface_ext, bw_mbps, bw_mbps), 'Could not change htb class rate')
+    # children share the limit and may borrow all of it
+    for cont_ip, minor in sorted(self.pod_classes.items()):
+      self.tc('class change dev %s parent 1:10 classid 1:%d htb rate %dmbit ceil %dmbit' \
+              % (self.iface_ext, minor, self.podShare(bw_mbps), bw_mbps), \
+              'Could not change htb class rate for %s' % cont_ip)
+    self.egress_limit = bw_mbps
 
   def setIngressBwLimit(self, bw_mbps):
+    if bw_mbps == self.ingress_limit:
+      return
     # ingress
-    _, err = self.cc.run_command('tc class replace dev %s parent 2: classid 2:10 cbq rate %dmbit \
-	                                 allot 1500 prio 5 bounded isolated ' \
-                               % (self.iface_cont, bw_mbps))
-    if err:
-      raise Exception('Could not change cbq class rate: ' + err)
+    self.tc('class replace dev %s parent 2: classid 2:10 cbq rate %dmbit allot 1500 prio 5 bounded isolated' \
+            % (self.iface_cont, bw_mbps), 'Could not change cbq class rate')
+    # children are not bounded, they borrow from the BE class
+    for cont_ip, minor in sorted(self.pod_classes.items()):
+      self.tc('class change dev %s parent 2:10 classid 2:%d cbq rate %dmbit allot 1500 prio 5 avpkt 1000' \
+              % (self.iface_cont, minor, self.podShare(bw_mbps)), \
+              'Could not change cbq class rate for %s' % cont_ip)
+    self.ingress_limit = bw_mbps
 
 
   def getEgressBEBytes(self):
@@ -155,15 +427,9 @@ class NetClass(object):
     if err:
       raise Exception("Unable to get Bw stats for %s: %s" % (self.iface_ext, err))
 
-    be_bytes = 0
-    total_bytes = 0
-    for _ in re.finditer('class htb 1:(?P<cls>\d+).*?\n.*?Sent (?P<bytes>\d+) bytes', text, re.DOTALL):
-      cls = int(_.group('cls'))
-      if cls == "10":
-        be_bytes = int(_.group('bytes'))
-      else:
-        total_bytes = int(_.group('bytes'))
-    return be_bytes, total_bytes
+    stats = self.parseClassStats(text)
+    self.egress_class_bytes = dict([(cls, sent) for cls, (sent, _) in stats.items()])
+    return self.classBEBytes(self.egress_class_bytes), self.egress_class_bytes.get(1, 0)
 
 
   def getIngressBEBytes(self):
@@ -183,10 +449,42 @@ class NetClass(object):
     if err:
       raise Exception("Unable to get tc stats for %s: %s" % (self.iface_cont, err))
 
-    be_bytes = 0
-    for _ in re.finditer('class cbq 2:(10).*?\n.*?Sent (?P<bytes>\d+) bytes', text, re.DOTALL):
-      be_bytes = int(_.group('bytes'))
-    return be_bytes
+    stats = self.parseClassStats(text)
+    self.ingress_class_bytes = dict([(cls, sent) for cls, (sent, _) in stats.items()])
+    return self.classBEBytes(self.ingress_class_bytes)
+
+
+  def classBEBytes(self, class_bytes):
+    """ BE bytes of a device from its bytes per class: the BE class, or the sum
+        of the per pod classes, which carry all BE traffic
+    """
+    if self.per_pod_classes:
+      return sum([class_bytes.get(minor, 0) for minor in self.pod_classes.values()])
+    return class_bytes.get(10, 0)
+
+
+  @staticmethod
+  def parseClassStats(text):
+    """ Parses the output of tc -s class show into {minor: (bytes, rate in mbps)}
+        rate is None when tc does not report it (e.g. for cbq, or without rate
+        estimators). Minors are read as written by this class, with decimal digits.
+    """
+    stats = {}
+    for _ in re.finditer('class \S+ \d+:(?P<cls>\d+) [^\n]*\n\s*Sent (?P<bytes>\d+) bytes[^\n]*\n' \
+                         '\s*(?:rate (?P<rate>[\d.]+)(?P<unit>[KMG]?)bit)?', text):
+      rate = None
+      if _.group('rate') is not None:
+        rate = float(_.group('rate')) * RATE_UNITS[_.group('unit')] / 1000000.0
+      stats[int(_.group('cls'))] = (int(_.group('bytes')), rate)
+    return stats
+
+
+  @staticmethod
+  def parseBwStats(text):
+    """ Parses the output of tc -s class show into {minor: rate in mbps}
+        with 0.0 for classes without a rate estimate
+    """
+    return dict([(cls, rate or 0.0) for cls, (_, rate) in NetClass.parseClassStats(text).items()])
 
 
   def initStats(self):
@@ -236,6 +534,14 @@ class NetClass(object):
     egress_total_mbps = int(8*(new_egress_total - self.egress_total_bytes)/(1000000*elapsed_time))
     egress_be_mbps = int(8*(new_egress_be - self.egress_be_bytes)/(1000000*elapsed_time))
 
+    # per pod usage, both directions
+    pod_bytes = {}
+    for cont_ip, minor in self.pod_classes.items():
+      pod_bytes[cont_ip] = self.egress_class_bytes.get(minor, 0) + self.ingress_class_bytes.get(minor, 0)
+    self.pod_mbps = dict([(ip, max(int(8*(sent - self.pod_bytes[ip])/(1000000*elapsed_time)), 0)) \
+                          for ip, sent in pod_bytes.items() if ip in self.pod_bytes])
+    self.pod_bytes = pod_bytes
+
     # swap
     self.stats_timestamp = ts
     self.ingress_total_bytes = new_ingress_total
@@ -1,7 +1,153 @@
 import unittest
 import netclass as nc
 
+class FakeClient(object):
+    """ Records commands, failing the ones that start with a prefix in errors
+    """
+    def __init__(self, ctlloc):
+        self.commands = []
+        self.errors = {}
+
+    def run_command(self, command):
+        self.commands.append(command)
+        for prefix, err in self.errors.items():
+            if command.startswith(prefix):
+                return None, err
+        return '', None
+
 class TestNetclassMethods(unittest.TestCase):
+    def setUp(self):
+        self.client = nc.cc.CommandClient
+        nc.cc.CommandClient = FakeClient
+
+    def tearDown(self):
+        nc.cc.CommandClient = self.client
+
+    def test_batch(self):
+        net = nc.NetClass('eth0', 'weave', 650, 10000, 30, 'out')
+        # module setup, one ipset restore, one tc batch, one iptables-restore, then the stats
+        self.assertEqual(len(net.cc.commands), 7)
+        net.cc.commands = []
+        net.begin()
+        for i in range(20):
+            net.addIPtoFilter('10.0.0.%d' % i)
+        net.setEgressBwLimit(100)
+        net.setIngressBwLimit(100)
+        self.assertEqual(net.commit(), [])
+        self.assertEqual(len(net.cc.commands), 2)
+        self.assertEqual(net.cc.commands[0].count('\nadd hyperpilot-be'), 20)
+        self.assertEqual(net.cc.commands[1].count('\nfilter add dev weave'), 20)
+        # unchanged limits are not written again
+        net.cc.commands = []
+        net.setEgressBwLimit(100)
+        self.assertEqual(net.cc.commands, [])
+
+    def test_batch_errors(self):
+        self.assertEqual(nc.ParseTcBatchErrors('RTNETLINK answers: File exists\nWe have an error talking to the kernel\nCommand failed -:2\n'),
+                         {2: 'RTNETLINK answers: File exists We have an error talking to the kernel'})
+        net = nc.NetClass('eth0', 'weave', 650, 10000, 30, 'out')
+        net.cc.errors = {'tc -force': 'RTNETLINK answers: File exists\nCommand failed -:2\n',
+                         'ipset restore': 'ipset v6.29: Error in line 3: Syntax error',
+                         'ipset -exist add hyperpilot-be 10.0.0.2': 'Syntax error'}
+        net.begin()
+        for i in range(3):
+            net.addIPtoFilter('10.0.0.%d' % i)
+        failed = net.commit()
+        self.assertEqual([c for c, _ in failed], [
+            'ipset -exist add hyperpilot-be 10.0.0.2',
+            'tc filter add dev weave parent 2: prio 16 handle 10:1:1 protocol ip u32 ht 10:1: match ip dst 10.0.0.1/32 flowid 2:10'])
+        self.assertEqual(failed[1][1], 'Could not add cbq filter for 10.0.0.1: RTNETLINK answers: File exists')
+
+    def test_batch_rollback(self):
+        net = nc.NetClass('eth0', 'weave', 650, 10000, 30, 'out')
+        active = set(['10.0.0.%d' % i for i in range(3)])
+        net.cc.errors = {'tc -force': 'RTNETLINK answers: File exists\nCommand failed -:2\n'}
+        net.begin()
+        for ip in sorted(active.difference(net.cont_ips)):
+            net.addIPtoFilter(ip)
+        self.assertEqual(len(net.commit()), 1)
+        # the failed IP is cleaned up, ignoring errors, and not tracked
+        self.assertEqual(net.cont_ips, set(['10.0.0.0', '10.0.0.2']))
+        self.assertEqual(net.cc.commands[-2:], ['ipset -exist del hyperpilot-be 10.0.0.1',
+                                                'tc filter del dev weave parent 2: prio 16 handle 10:1:1 protocol ip u32'])
+        # so the next cycle adds it again
+        net.cc.errors = {}
+        net.begin()
+        for ip in active.difference(net.cont_ips):
+            net.addIPtoFilter(ip)
+        self.assertEqual(net.commit(), [])
+        self.assertEqual(net.cont_ips, active)
+        # a failed removal is kept, to be removed again
+        net.cc.errors = {'tc -force': 'RTNETLINK answers: No such file or directory\nCommand failed -:1\n'}
+        net.begin()
+        net.removeIPfromFilter('10.0.0.1')
+        self.assertEqual(len(net.commit()), 1)
+        self.assertEqual(net.cont_ips, active)
+        self.assertEqual(net.ingress_handles['10.0.0.1'], '10:1:1')
+
+    def test_hash_filters(self):
+        net = nc.NetClass('eth0', 'weave', 650, 10000, 30, 'out')
+        net.addIPtoFilter('10.0.0.42')
+        net.addIPtoFilter('10.0.1.42')
+        net.addIPtoFilter('10.0.0.43')
+        self.assertEqual(net.ingress_handles, {'10.0.0.42': '10:2a:1', '10.0.1.42': '10:2a:2', '10.0.0.43': '10:2b:1'})
+        net.cc.commands = []
+        net.removeIPfromFilter('10.0.0.42')
+        # only the filter of the IP is deleted
+        self.assertEqual(net.cc.commands, ['ipset -exist del hyperpilot-be 10.0.0.42',
+                                           'tc filter del dev weave parent 2: prio 16 handle 10:2a:1 protocol ip u32'])
+        # its handle is free again
+        net.addIPtoFilter('10.0.2.42')
+        self.assertEqual(net.ingress_handles['10.0.2.42'], '10:2a:1')
+
+    def test_per_pod_classes(self):
+        net = nc.NetClass('eth0', 'weave', 650, 10000, 30, 'out', per_pod_classes=True)
+        net.addIPtoFilter('10.0.0.1')
+        net.addIPtoFilter('10.0.0.2')
+        self.assertEqual(net.pod_classes, {'10.0.0.1': 1001, '10.0.0.2': 1002})
+        self.assertTrue('ipset -exist add hyperpilot-be-pods 10.0.0.2 skbmark 1002' in net.cc.commands)
+        self.assertTrue('tc filter add dev eth0 parent 1: protocol all prio 10 handle 1002 fw flowid 1:1002' in net.cc.commands)
+        # children get an equal share of the BE limit and may borrow all of it
+        net.cc.commands = []
+        net.setEgressBwLimit(100)
+        self.assertEqual(net.cc.commands[1:], [
+            'tc class change dev eth0 parent 1:10 classid 1:1001 htb rate 50mbit ceil 100mbit',
+            'tc class change dev eth0 parent 1:10 classid 1:1002 htb rate 50mbit ceil 100mbit'])
+        # filters go before classes, and the minor is reused
+        net.cc.commands = []
+        net.removeIPfromFilter('10.0.0.1')
+        self.assertEqual(net.cc.commands[-3:], ['tc filter del dev eth0 parent 1: prio 10 handle 1001 fw',
+                                                'tc class del dev eth0 classid 1:1001',
+                                                'tc class del dev weave classid 2:1001'])
+        net.addIPtoFilter('10.0.0.3')
+        self.assertEqual(net.pod_classes['10.0.0.3'], 1001)
+        # a child class that fails to apply is not kept, nor changed with the limits
+        net.cc.errors = {'tc -force': 'RTNETLINK answers: Invalid argument\nCommand failed -:1\n'}
+        net.begin()
+        net.addIPtoFilter('10.0.0.4')
+        self.assertEqual(len(net.commit()), 1)
+        self.assertEqual(net.pod_classes, {'10.0.0.2': 1002, '10.0.0.3': 1001})
+        self.assertTrue('tc class del dev eth0 classid 1:1003' in net.cc.commands)
+        net.cc.errors = {}
+        net.cc.commands = []
+        net.setEgressBwLimit(100)
+        self.assertFalse([c for c in net.cc.commands if '1:1003' in c])
+        # BE bytes are the sum of the children
+        stats = """
+class htb 1:1 root rate 10Gbit ceil 10Gbit burst 0b cburst 0b
+ Sent 5000 bytes 50 pkt (dropped 0, overlimits 0 requeues 0)
+ rate 8Kbit 1pps backlog 0b 0p requeues 0
+class htb 1:10 parent 1:1 rate 100Mbit ceil 100Mbit burst 1600b cburst 1600b
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0)
+class htb 1:1001 parent 1:10 prio 0 rate 50Mbit ceil 100Mbit burst 1600b cburst 1600b
+ Sent 1000 bytes 10 pkt (dropped 0, overlimits 0 requeues 0)
+class htb 1:1002 parent 1:10 prio 0 rate 50Mbit ceil 100Mbit burst 1600b cburst 1600b
+ Sent 3000 bytes 30 pkt (dropped 0, overlimits 0 requeues 0)
+"""
+        net.cc.run_command = lambda command: (stats, None)
+        self.assertEqual(net.getEgressBEBytes(), (4000, 5000))
+        self.assertEqual(nc.NetClass.parseClassStats(stats)[1], (5000, 0.008))
+
     def test_parse_bw_stats(self):
         s = """
 class htb 1:10 root prio 0 rate 664Mbit ceil 664Mbit burst 1494b cburst 1494b
@@ -13,7 +13,6 @@ __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
 # standard
-import time
 from datetime import datetime as dt
 
 # hyperpilot imports
@@ -30,41 +29,56 @@ def NetControll():
            % (netst['iface_ext'], netst['iface_cont'], netst['max_bw_mbps'], netst['link_bw_mbps'])
   net = netclass.NetClass(netst['iface_ext'], netst['iface_cont'], \
                           netst['max_bw_mbps'], netst['link_bw_mbps'], \
-                          netst['default_limit_mbps'], st.params['ctlloc'])
+                          netst['default_limit_mbps'], st.params['ctlloc'], \
+                          st.get_param('per_pod_classes', 'net_controller', False) is True)
   period = netst['period']
   cycle = 0
   was_enabled = False
+  deltas = st.active.subscribe()
+
+  def report(failed):
+    for command, error in failed:
+      print "Net:WARNING: %s (%s)" % (error, command)
+
+  def filterDeltas(added, removed):
+    # BE pods are filtered as soon as their first container is seen
+    net.begin()
+    for _, pod, _ in added:
+      if pod.wclass == 'BE' and pod.ipaddress and pod.ipaddress not in net.cont_ips:
+        net.addIPtoFilter(pod.ipaddress)
+    for _, pod, _ in removed:
+      if pod.ipaddress in net.cont_ips and pod.ipaddress not in st.active.snapshot.be_ips:
+        net.removeIPfromFilter(pod.ipaddress)
+    report(net.commit())
 
   # control loop
   while 1:
 
     # reset limits if the controller is turned off
     if was_enabled and not st.enabled:
-      for _, pod in st.active.pods.items():
-        if pod.wclass == 'BE':
-          net.removeIPfromFilter(pod.ipaddress)
+      net.begin()
+      for _ in list(net.cont_ips):
+        net.removeIPfromFilter(_)
+      report(net.commit())
 
     if not st.enabled:
       print "Net:WARNING: BE Controller is disabled, skipping net control"
       was_enabled = False
-      time.sleep(period)
+      st.SleepOnDeltas(deltas, period)
       continue
 
     if st.get_param('disabled', 'net_controller', False) is True:
       print "Net:WARNING: Net Controller is disabled"
       was_enabled = False
-      time.sleep(period)
+      st.SleepOnDeltas(deltas, period)
       continue
 
     was_enabled = True
 
     # get IP of all active BE containers
-    active_be_ips = set()
-    st.active.lock.acquire_read()
-    for _, pod in st.active.pods.items():
-      if pod.wclass == 'BE':
-        active_be_ips.add(pod.ipaddress)
-    st.active.lock.release_read()
+    active_be_ips = st.active.snapshot.be_ips
+    # all filter and limit changes of the cycle go in one batch
+    net.begin()
     # track BW usage of new containers
     new_ips = active_be_ips.difference(net.cont_ips)
     for _ in new_ips:
@@ -80,19 +94,19 @@ def NetControll():
       net.currentStats()
     ingress_hp_mbps = ingress_total_mbps - ingress_be_mbps
     egress_hp_mbps = egress_total_mbps - egress_be_mbps
+    # per BE pod usage, with per pod classes, for victim selection
+    snapshot = st.active.snapshot
+    for ip, mbps in net.pod_mbps.items():
+      for pod in snapshot.by_ip.get(ip, {}).values():
+        pod.net_mbps = mbps
 
-    be_ingress_limit = net.max_bw_mbps - ingress_hp_mbps - \
-      max(0.10*net.max_bw_mbps, 0.10*ingress_hp_mbps)
-    be_egress_limit = net.max_bw_mbps - egress_hp_mbps - \
-      max(0.10*net.max_bw_mbps, 0.10*egress_hp_mbps)
-    if be_ingress_limit < netst['default_limit_mbps']:
-      be_ingress_limit = netst['default_limit_mbps']
-    if be_egress_limit < netst['default_limit_mbps']:
-      be_egress_limit = netst['default_limit_mbps']
+    be_ingress_limit = net.beBwLimit(net.max_bw_mbps, ingress_hp_mbps, netst['default_limit_mbps'])
+    be_egress_limit = net.beBwLimit(net.max_bw_mbps, egress_hp_mbps, netst['default_limit_mbps'])
 
     # enforce limits
     net.setEgressBwLimit(int(be_egress_limit))
     net.setIngressBwLimit(int(be_ingress_limit))
+    report(net.commit())
 
     net_cycle_data = {
         "cycle": cycle,
@@ -118,6 +132,10 @@ def NetControll():
 
     if st.get_param('write_metrics', 'net_controller', False) is True:
       st.stats_writer.write(at, st.node.name, "net", net_cycle_data)
+      # per BE pod usage, tagged with the pod
+      st.stats_writer.write_tagged(at, st.node.name, "net_pod", \
+          [({"pod": pod.name, "namespace": pod.namespace}, {"bw": mbps}) \
+           for ip, mbps in net.pod_mbps.items() for pod in snapshot.by_ip.get(ip, {}).values()])
 
     cycle += 1
-    time.sleep(period)
+    st.SleepOnDeltas(deltas, period, filterDeltas)
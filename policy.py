@@ -0,0 +1,258 @@
+"""
+Quota policies for the CPU controller
+
+A policy looks at the state of one quota cycle and returns the action for BE
+workloads, with a multiplicative rate for the BE quota when growing or
+shrinking:
+  ("disable_be", None), ("reset_be", None), ("enable_be", None),
+  ("grow_be", rate), ("shrink_be", rate), ("none", None)
+
+The state is a dict with:
+  slack     - SLO slack of the QoS app
+  cpu_usage - node CPU load (0-100.0)
+  be_pods   - number of BE pods
+  be_quota  - aggregate BE quota
+  now       - monotonic timestamp (s)
+  interference - optional {signal: fraction} from the local interference monitor
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import math
+
+class HeraclesPolicy(object):
+  """The threshold ladder of the Heracles design, driven by slack and load thresholds.
+  """
+  def __init__(self, params):
+    self.params = params
+    self.min_rate = params.get('min_rate', 0.05)
+    self.max_rate = params.get('max_rate', 2.0)
+    self.interference_thresholds = params.get('interference_thresholds', \
+        {'cpu': 0.25, 'io': 0.25, 'memory': 0.1, 'hp_throttled': 0.2})
+
+
+  def clampRate(self, rate):
+    """ Keeps a rate within [min_rate, max_rate]
+    """
+    return min(max(rate, self.min_rate), self.max_rate)
+
+
+  def guard(self, slack, cpu_usage, be_pods):
+    """ Disable, reset and enable decisions, shared by all policies
+        returns None if none of them applies
+    """
+    p = self.params
+    # Disable
+    if slack < p['slack_threshold_disable'] and be_pods:
+      return "disable_be", None
+    # Reset to minimum
+    elif slack < p['slack_threshold_reset'] and be_pods:
+      return "reset_be", None
+    # Enable best effort
+    elif slack > p['slack_threshold_grow'] and \
+         cpu_usage < p['load_threshold_grow'] and not be_pods:
+      return "enable_be", None
+    return None
+
+
+  def interferenceRate(self, interference):
+    """ Shrink rate for local interference signals above their thresholds
+        returns None if all of them are below
+    """
+    excess = [value - self.interference_thresholds[name] for name, value in (interference or {}).items() \
+              if name in self.interference_thresholds and value > self.interference_thresholds[name]]
+    if not excess:
+      return None
+    excess = max(excess)
+    return self.clampRate(1 - self.params['BE_shrink_ratio'] * excess)
+
+
+  def ladder(self, slack, cpu_usage, be_pods, interference=None):
+    """ The threshold ladder
+    """
+    p = self.params
+    action = self.guard(slack, cpu_usage, be_pods)
+    if action:
+      return action
+    # Shrink quota due to slack
+    if slack < p['slack_threshold_shrink'] and be_pods:
+      return "shrink_be", 1 + p['BE_shrink_ratio'] * (slack - p['slack_threshold_shrink'])
+    # Shrink quota due to local interference
+    elif be_pods and self.interferenceRate(interference) is not None:
+      return "shrink_be", self.interferenceRate(interference)
+    # Shrink quota due to high utilization
+    elif cpu_usage > p['load_threshold_shrink'] and be_pods:
+      return "shrink_be", 1 + p['BE_shrink_ratio'] * (p['load_threshold_shrink'] - cpu_usage)/100.0
+    # Grow best effort
+    elif slack > p['slack_threshold_grow'] and \
+         cpu_usage < p['load_threshold_grow'] and be_pods:
+      return "grow_be", 1 + p['BE_growth_ratio'] * slack
+    # Default
+    return "none", None
+
+
+  def decide(self, state):
+    return self.ladder(state['slack'], state['cpu_usage'], state['be_pods'], state.get('interference'))
+
+
+class PIPolicy(HeraclesPolicy):
+  """A proportional-integral controller that steers slack to a target.
+
+     The error is the distance of slack from pi_target_slack, capped by the
+     headroom to load_threshold_shrink. The BE quota is scaled by
+     1 + pi_kp * error + pi_ki * integral(error dt). The disable, reset and
+     enable thresholds of the ladder still apply.
+  """
+  def __init__(self, params):
+    super(PIPolicy, self).__init__(params)
+    self.kp = params.get('pi_kp', 0.5)
+    self.ki = params.get('pi_ki', 0.1)
+    self.target = params.get('pi_target_slack', \
+                    (params['slack_threshold_shrink'] + params['slack_threshold_grow']) / 2.0)
+    self.deadband = params.get('pi_deadband', 0.02)
+    self.integral_max = params.get('pi_integral_max', 2.0)
+    self.integral = 0.0
+    self.last = None
+
+
+  def decide(self, state):
+    p = self.params
+    slack = state['slack']
+    cpu_usage = state['cpu_usage']
+    dt = (state['now'] - self.last) if self.last is not None else p.get('period', 1.0)
+    self.last = state['now']
+
+    action = self.guard(slack, cpu_usage, state['be_pods'])
+    if action or not state['be_pods']:
+      self.integral = 0.0
+      return action or ("none", None)
+    # local interference overrides the slack error, without winding up the integral
+    rate = self.interferenceRate(state.get('interference'))
+    if rate is not None:
+      return "shrink_be", rate
+
+    error = slack - self.target
+    load_error = (p['load_threshold_shrink'] - cpu_usage) / 100.0
+    if load_error < 0:
+      error = min(error, load_error)
+    elif cpu_usage > p['load_threshold_grow'] and error > 0:
+      error = 0.0
+    self.integral += error * dt
+    self.integral = min(max(self.integral, -self.integral_max), self.integral_max)
+
+    rate = self.clampRate(1 + self.kp * error + self.ki * self.integral)
+    if abs(rate - 1) < self.deadband:
+      return "none", None
+    return ("grow_be" if rate > 1 else "shrink_be"), rate
+
+
+class PredictivePolicy(HeraclesPolicy):
+  """A short-horizon predictive controller.
+
+     Slack is extrapolated predict_horizon cycles ahead from a linear fit over
+     the last predict_window samples. The sensitivity of slack to the BE quota
+     is learned online, from how slack moved after past quota changes. The
+     policy then picks the quota rate that brings predicted slack to
+     pi_target_slack. Until a sensitivity is learned, it runs the ladder on
+     predicted slack, which still reacts to a falling trend before the
+     thresholds are crossed.
+  """
+  def __init__(self, params):
+    super(PredictivePolicy, self).__init__(params)
+    self.window = params.get('predict_window', 5)
+    self.horizon = params.get('predict_horizon', 2)
+    self.target = params.get('pi_target_slack', \
+                    (params['slack_threshold_shrink'] + params['slack_threshold_grow']) / 2.0)
+    self.deadband = params.get('pi_deadband', 0.02)
+    self.forget = params.get('predict_forget', 0.8)
+    self.history = []
+    # exponentially weighted regression of d(slack) on d(log quota)
+    self.sxy = 0.0
+    self.sxx = 0.0
+
+
+  def trend(self):
+    """ Slope of slack over time (1/s) from a least squares fit of the history
+    """
+    if len(self.history) < 2:
+      return 0.0
+    n = float(len(self.history))
+    mt = sum([_[0] for _ in self.history]) / n
+    ms = sum([_[1] for _ in self.history]) / n
+    sxx = sum([(_[0] - mt) ** 2 for _ in self.history])
+    if sxx <= 0:
+      return 0.0
+    return sum([(_[0] - mt) * (_[1] - ms) for _ in self.history]) / sxx
+
+
+  def gain(self):
+    """ Learned d(slack)/d(log quota), None until it is meaningful
+        more quota for BE should only ever reduce slack
+    """
+    if self.sxx < 1E-3:
+      return None
+    g = self.sxy / self.sxx
+    if g > -1E-3:
+      return None
+    return g
+
+
+  def learn(self, state):
+    """ Updates the history and the sensitivity estimate
+    """
+    if self.history:
+      _, prev_slack, prev_quota = self.history[-1]
+      if prev_quota > 0 and state['be_quota'] > 0 and state['be_quota'] != prev_quota:
+        dq = math.log(float(state['be_quota']) / prev_quota)
+        ds = state['slack'] - prev_slack
+        self.sxy = self.forget * self.sxy + dq * ds
+        self.sxx = self.forget * self.sxx + dq * dq
+    self.history.append((state['now'], state['slack'], state['be_quota']))
+    self.history = self.history[-self.window:]
+
+
+  def decide(self, state):
+    p = self.params
+    self.learn(state)
+    slack = state['slack']
+    cpu_usage = state['cpu_usage']
+    be_pods = state['be_pods']
+    predicted = slack + self.trend() * self.horizon * p.get('period', 1.0)
+    # act on the worse of current and predicted slack, but disable only on measured slack
+    worst = min(slack, predicted)
+
+    action = self.guard(slack, cpu_usage, be_pods)
+    if action or not be_pods:
+      return action or ("none", None)
+    if worst < p['slack_threshold_reset']:
+      return "reset_be", None
+    g = self.gain()
+    if g is None or cpu_usage > p['load_threshold_shrink'] or \
+       self.interferenceRate(state.get('interference')) is not None:
+      return self.ladder(worst, cpu_usage, be_pods, state.get('interference'))
+
+    log_rate = (self.target - predicted) / g
+    rate = self.clampRate(math.exp(min(max(log_rate, math.log(self.min_rate)), math.log(self.max_rate))))
+    if rate > 1 and cpu_usage > p['load_threshold_grow']:
+      return "none", None
+    if abs(rate - 1) < self.deadband:
+      return "none", None
+    return ("grow_be" if rate > 1 else "shrink_be"), rate
+
+
+POLICIES = {
+    'heracles': HeraclesPolicy,
+    'pi': PIPolicy,
+    'predictive': PredictivePolicy,
+}
+
+def MakePolicy(params):
+  """ Creates the policy selected by the 'policy' parameter of the quota controller
+  """
+  name = params.get('policy', 'heracles')
+  if name not in POLICIES:
+    raise Exception('Unknown quota policy %s' % name)
+  return POLICIES[name](params)
@@ -0,0 +1,82 @@
+import json
+import unittest
+import policy as pl
+
+def Params(**kwargs):
+    with open('config.json') as _:
+        params = json.load(_)['quota_controller']
+    params.update(kwargs)
+    return params
+
+def State(slack, cpu_usage=10.0, be_pods=1, be_quota=100000, now=0.0):
+    return {'slack': slack, 'cpu_usage': cpu_usage, 'be_pods': be_pods,
+            'be_quota': be_quota, 'now': now}
+
+class TestPolicyMethods(unittest.TestCase):
+    def test_heracles(self):
+        p = pl.MakePolicy(Params())
+        self.assertEqual(p.decide(State(-0.6)), ('disable_be', None))
+        self.assertEqual(p.decide(State(-0.2)), ('reset_be', None))
+        self.assertEqual(p.decide(State(0.5, be_pods=0)), ('enable_be', None))
+        self.assertEqual(p.decide(State(0.25)), ('none', None))
+        action, rate = p.decide(State(0.1))
+        self.assertEqual(action, 'shrink_be')
+        self.assertAlmostEqual(rate, 1 + 3.0 * (0.1 - 0.2))
+        action, rate = p.decide(State(0.25, cpu_usage=90.0))
+        self.assertEqual(action, 'shrink_be')
+        self.assertAlmostEqual(rate, 1 + 3.0 * (80.0 - 90.0) / 100.0)
+        action, rate = p.decide(State(0.5))
+        self.assertEqual(action, 'grow_be')
+        self.assertAlmostEqual(rate, 1 + 0.5 * 0.5)
+
+    def test_pi(self):
+        p = pl.MakePolicy(Params(policy='pi', pi_target_slack=0.25, pi_kp=1.0, pi_ki=0.5))
+        self.assertEqual(p.decide(State(0.25, now=0.0)), ('none', None))
+        action, rate = p.decide(State(0.45, now=2.0))
+        self.assertEqual(action, 'grow_be')
+        self.assertAlmostEqual(rate, 1 + 0.2 + 0.5 * 0.4)
+        # the integral term offsets the shrink after a positive history
+        action, rate = p.decide(State(0.05, now=4.0))
+        self.assertEqual(action, 'shrink_be')
+        self.assertAlmostEqual(rate, 1 - 0.2 + 0.5 * 0.0)
+        # no growth above the load threshold
+        self.assertEqual(p.decide(State(0.25, cpu_usage=70.0, now=6.0))[0], 'none')
+        self.assertEqual(p.decide(State(-0.6, now=8.0)), ('disable_be', None))
+        self.assertEqual(p.integral, 0.0)
+
+    def test_predictive(self):
+        p = pl.MakePolicy(Params(policy='predictive', pi_target_slack=0.25, period=1))
+        # a falling trend resets BE before slack crosses the threshold
+        p.decide(State(0.4, now=0.0))
+        p.decide(State(0.2, now=1.0))
+        self.assertEqual(p.decide(State(0.0, now=2.0)), ('reset_be', None))
+        # with a learned sensitivity, it aims predicted slack at the target
+        p = pl.MakePolicy(Params(policy='predictive', pi_target_slack=0.25, period=1))
+        p.decide(State(0.5, be_quota=100000, now=0.0))
+        p.decide(State(0.3, be_quota=200000, now=1.0))
+        p.history = p.history[-1:]
+        self.assertLess(p.gain(), 0)
+        action, rate = p.decide(State(0.35, be_quota=200000, now=2.0))
+        self.assertEqual(action, 'grow_be')
+        action, rate = p.decide(State(0.2, be_quota=200000, now=3.0))
+        self.assertEqual(action, 'shrink_be')
+        self.assertLess(rate, 1.0)
+
+    def test_interference(self):
+        for name in ['heracles', 'pi', 'predictive']:
+            p = pl.MakePolicy(Params(policy=name))
+            state = State(0.5)
+            state['interference'] = {'cpu': 0.35, 'io': 0.0, 'hp_throttled': 0.1}
+            action, rate = p.decide(state)
+            self.assertEqual(action, 'shrink_be')
+            self.assertAlmostEqual(rate, 1 - 3.0 * (0.35 - 0.25))
+            # slack losses still take precedence
+            state['slack'] = -0.2
+            self.assertEqual(p.decide(state), ('reset_be', None))
+        self.assertEqual(pl.MakePolicy(Params()).interferenceRate({'cpu': 0.1}), None)
+
+    def test_unknown(self):
+        self.assertRaises(Exception, pl.MakePolicy, Params(policy='bang-bang'))
+
+if __name__ == '__main__':
+        unittest.main()
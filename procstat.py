@@ -0,0 +1,112 @@
+"""
+CPU utilization sampler based on /proc/stat
+
+Current assumptions:
+ - /proc/stat is the host's view (privileged pod or controller on the node)
+ - cpu lines are at the top of /proc/stat, before intr/ctxt
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import os
+
+class ProcStat(object):
+  """This class samples node and per-core CPU load from /proc/stat.
+
+     The file is opened once and kept open. Every sample seeks back to the
+     start and rereads it, which makes the kernel regenerate the contents
+     without a new open or a fork on the host.
+  """
+  def __init__(self, path='/proc/stat', chunk=32768):
+    self.path = path
+    self.chunk = chunk
+    self.fd = None
+    # previous (total, idle) jiffies per cpu line
+    self.prev = {}
+    self.load = 0.0
+    self.core_load = []
+
+
+  def open(self):
+    """ Opens the stats file, if not already open
+    """
+    if self.fd is None:
+      self.fd = os.open(self.path, os.O_RDONLY)
+
+
+  def close(self):
+    """ Closes the stats file
+    """
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+
+
+  def readRaw(self):
+    """ Rereads the cpu lines from the start of the file
+    """
+    self.open()
+    os.lseek(self.fd, 0, os.SEEK_SET)
+    text = ''
+    while 1:
+      data = os.read(self.fd, self.chunk)
+      text += data
+      # all cpu lines are at the top, stop once we are past them
+      if not data or '\nintr' in text or '\nctxt' in text:
+        break
+    return text
+
+
+  @staticmethod
+  def parse(text):
+    """ Parses /proc/stat text into {cpu name: (total, idle)}
+        Example format to parse.
+          cpu  2255 34 2290 22625563 6290 127 456 0 0 0
+          cpu0 1132 34 1441 11311718 3675 127 438 0 0 0
+          cpu1 1123 0 849 11313845 2614 0 18 0 0 0
+          intr 114930548 113199788 3 0 5 263 0 4 [... lots more numbers ...]
+    """
+    times = {}
+    for line in text.split('\n'):
+      if not line.startswith('cpu'):
+        if times:
+          break
+        continue
+      fields = line.split()
+      values = [float(i) for i in fields[1:]] + [0.0] * (10 - len(fields[1:]))
+      user, nice, system, idle, iowait, irq, softirq, steal = values[:8]
+      idle_time = idle + iowait
+      busy_time = user + nice + system + irq + softirq + steal
+      times[fields[0]] = (idle_time + busy_time, idle_time)
+    if 'cpu' not in times:
+      raise Exception('Cannot parse /proc/stat')
+    return times
+
+
+  def busy(self, name, total, idle):
+    """ Busy percentage (0-100.0) of a cpu line since the previous sample
+    """
+    prev_total, prev_idle = self.prev.get(name, (0.0, 0.0))
+    delta_total = total - prev_total
+    if delta_total <= 0:
+      return 0.0
+    load = ((delta_total - (idle - prev_idle)) / delta_total) * 100
+    if load < 0.0:
+      load = 0.0
+    if load > 100.0:
+      load = 100.0
+    return load
+
+
+  def sample(self):
+    """ Returns node CPU load and a list of per-core loads (0-100.0)
+    """
+    times = self.parse(self.readRaw())
+    cores = sorted([_ for _ in times if _ != 'cpu'], key=lambda name: int(name[3:]))
+    self.load = self.busy('cpu', *times['cpu'])
+    self.core_load = [self.busy(_, *times[_]) for _ in cores]
+    self.prev = times
+    return self.load, self.core_load
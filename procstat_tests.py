@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+import procstat as ps
+
+STAT = """cpu  %d 0 %d %d 0 0 0 0 0 0
+cpu0 %d 0 %d %d 0 0 0 0 0 0
+cpu1 %d 0 %d %d 0 0 0 0 0 0
+intr 114930548 113199788 3 0 5 263 0 4
+ctxt 1990473
+"""
+
+class TestProcStatMethods(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'stat')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, core0, core1):
+        # core = (user, system, idle)
+        node = [a + b for a, b in zip(core0, core1)]
+        with open(self.path, 'w') as _:
+            _.write(STAT % tuple(node + list(core0) + list(core1)))
+
+    def test_parse(self):
+        times = ps.ProcStat.parse(STAT % (3, 1, 4, 1, 1, 2, 2, 0, 2))
+        self.assertEqual(times, {'cpu': (8.0, 4.0), 'cpu0': (4.0, 2.0), 'cpu1': (4.0, 2.0)})
+        self.assertRaises(Exception, ps.ProcStat.parse, 'intr 1 2 3\n')
+
+    def test_sample(self):
+        self.write((100, 0, 100), (100, 0, 100))
+        sampler = ps.ProcStat(self.path)
+        sampler.sample()
+        # core 0 fully busy, core 1 idle; the open file is reread in place
+        self.write((200, 0, 100), (100, 0, 200))
+        load, cores = sampler.sample()
+        self.assertEqual(load, 50.0)
+        self.assertEqual(cores, [100.0, 0.0])
+        # no time elapsed
+        load, cores = sampler.sample()
+        self.assertEqual(load, 0.0)
+        sampler.close()
+
+if __name__ == '__main__':
+        unittest.main()
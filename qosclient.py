@@ -0,0 +1,182 @@
+"""
+QoS data store client
+
+Current assumptions:
+ - The QoS data store speaks HTTP/1.1 with keep-alive
+ - Switch and metrics are small JSON documents ({"error": ..., "data": ...})
+ - For the fast path, /v1/apps/metrics?wait=N holds the request until the
+   metrics change or N seconds pass
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+from io import BytesIO
+import pycurl
+
+class QosClient(object):
+  """This class fetches the controller switch and the app metrics from the QoS data store.
+
+     Both documents are fetched concurrently, once per cycle, on persistent
+     connections with connect and read deadlines. The parsed results are
+     cached until the next refresh, so every consumer in the cycle shares one
+     fetch and one JSON parse.
+
+     Useful documents and examples:
+      - libcurl multi interface
+        https://curl.haxx.se/libcurl/c/libcurl-multi.html
+  """
+  def __init__(self, url='qos-data-store:7781', connect_timeout_ms=500, timeout_ms=1000):
+    self.url = url
+    self.connect_timeout_ms = connect_timeout_ms
+    self.timeout_ms = timeout_ms
+    # the multi handle keeps the connection (and DNS) cache across cycles
+    self.multi = pycurl.CurlMulti()
+    self.handles = {}
+    for name, path in [('switch', '/v1/switch'), ('metrics', '/v1/apps/metrics')]:
+      _ = pycurl.Curl()
+      _.setopt(_.URL, url + path)
+      _.setopt(_.CONNECTTIMEOUT_MS, connect_timeout_ms)
+      _.setopt(_.TIMEOUT_MS, timeout_ms)
+      _.setopt(_.NOSIGNAL, 1)
+      _.setopt(_.DNS_CACHE_TIMEOUT, 300)
+      self.handles[name] = _
+    # cached results of the last refresh, None if not available
+    self.switch = None
+    self.metrics = None
+    # long-poll connection, see watch()
+    self.watcher = None
+
+
+  def close(self):
+    """ Closes all connections
+    """
+    for _ in self.handles.values():
+      _.close()
+    self.multi.close()
+    if self.watcher is not None:
+      self.watcher.close()
+
+
+  def fetch(self):
+    """ Fetches all documents concurrently, returns {name: body} for the successful ones
+    """
+    bodies = {}
+    for name, _ in self.handles.items():
+      bodies[name] = BytesIO()
+      _.setopt(_.WRITEFUNCTION, bodies[name].write)
+      self.multi.add_handle(_)
+
+    # drive the transfers until all of them complete or time out
+    num_active = len(self.handles)
+    while num_active:
+      ret, num_active = self.multi.perform()
+      if ret == pycurl.E_CALL_MULTI_PERFORM:
+        continue
+      if num_active:
+        self.multi.select(self.timeout_ms / 1000.0)
+
+    # collect results
+    failed = set()
+    while 1:
+      num_queued, _, errors = self.multi.info_read()
+      for handle, errno, errmsg in errors:
+        failed.add(handle)
+        print "QoS:WARNING: Problem accessing QoS data store: (%d) %s" % (errno, errmsg)
+      if not num_queued:
+        break
+    results = {}
+    for name, _ in self.handles.items():
+      self.multi.remove_handle(_)
+      if _ in failed:
+        continue
+      code = _.getinfo(pycurl.RESPONSE_CODE)
+      if code != 200:
+        print "QoS:WARNING: QoS data store returned %d for %s" % (code, name)
+        continue
+      results[name] = bodies[name].getvalue()
+    return results
+
+
+  def refresh(self):
+    """ Refreshes the cached switch and metrics
+    """
+    self.switch = None
+    self.metrics = None
+    for name, body in self.fetch().items():
+      try:
+        output = json.loads(body)
+      except ValueError as e:
+        print "QoS:WARNING: Cannot parse %s from QoS data store: %s" % (name, e)
+        continue
+      if not isinstance(output, dict) or ('data' not in output and not output.get('error')):
+        print "QoS:WARNING: Unexpected %s from QoS data store: %s" % (name, body[:100])
+      elif output.get('error'):
+        print "QoS:WARNING: Problem accessing QoS data store: " + str(output.get('data'))
+      elif name == 'switch':
+        self.switch = output['data']
+      else:
+        self.metrics = output['data']
+
+
+  def enabled(self, default):
+    """ Returns the controller switch, or default if it is not available
+    """
+    if self.switch is None:
+      return default
+    return self.switch
+
+
+  def slack(self, name):
+    """ Returns SLO slack and latency of an app, (0.0, 0.0) if not available
+    """
+    metrics = self.metrics
+    if metrics is None:
+      return 0.0, 0.0
+    if name not in metrics:
+      print "QoS:WARNING: QoS datastore does not track workload", name
+      return 0.0, 0.0
+    return AppSlack(metrics, name)
+
+
+  def watch(self, wait_s):
+    """ Long-polls the app metrics: the QoS data store holds the request until
+        the metrics change or wait_s expires. Uses its own connection, so it
+        can run in a separate thread from refresh().
+        Returns the metrics, None on failure
+    """
+    if self.watcher is None:
+      self.watcher = pycurl.Curl()
+      self.watcher.setopt(pycurl.URL, self.url + '/v1/apps/metrics?wait=%d' % wait_s)
+      self.watcher.setopt(pycurl.CONNECTTIMEOUT_MS, self.connect_timeout_ms)
+      self.watcher.setopt(pycurl.TIMEOUT_MS, wait_s * 1000 + self.timeout_ms)
+      self.watcher.setopt(pycurl.NOSIGNAL, 1)
+    data = BytesIO()
+    self.watcher.setopt(pycurl.WRITEFUNCTION, data.write)
+    try:
+      self.watcher.perform()
+      code = self.watcher.getinfo(pycurl.RESPONSE_CODE)
+      if code != 200:
+        print "QoS:WARNING: QoS data store returned %d for metrics watch" % code
+        return None
+      output = json.loads(data.getvalue())
+    except (ValueError, pycurl.error) as e:
+      print "QoS:WARNING: Problem watching QoS data store metrics:", e
+      return None
+    if not isinstance(output, dict) or output.get('error'):
+      return None
+    return output.get('data')
+
+
+def AppSlack(metrics, name):
+  """ Extracts SLO slack and latency of an app from the metrics payload
+      (0.0, 0.0) if the app does not report slack
+  """
+  if name not in metrics or 'metrics' not in metrics[name] or \
+     'slack' not in metrics[name]['metrics']:
+    return 0.0, 0.0
+  app = metrics[name]['metrics']
+  return float(app['slack']), float(app.get('latency', 0.0))
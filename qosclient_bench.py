@@ -0,0 +1,73 @@
+"""
+Benchmark for the QoS data store client
+
+Compares the latency of fetching the switch and the app metrics with a fresh
+curl handle per request, done sequentially, against QosClient.refresh(), using
+a local QoS data store stand-in.
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import json
+import time
+import argparse
+from io import BytesIO
+import pycurl
+import qosclient
+import fake_qosds
+
+def FetchFresh(url):
+  """ The per-cycle fetch pattern used before QosClient
+  """
+  for path in ['/v1/switch', '/v1/apps/metrics']:
+    _ = pycurl.Curl()
+    data = BytesIO()
+    _.setopt(_.URL, url + path)
+    _.setopt(_.WRITEFUNCTION, data.write)
+    _.perform()
+    json.loads(data.getvalue())
+
+
+def Measure(func, iterations):
+  """ Returns sorted latencies of func in ms
+  """
+  times = []
+  for _ in range(iterations):
+    start = time.time()
+    func()
+    times.append(1000 * (time.time() - start))
+  times.sort()
+  return times
+
+
+def Report(name, times):
+  print "  %-12s mean %.2f ms, p50 %.2f ms, p99 %.2f ms" \
+        % (name, sum(times) / len(times), times[len(times) / 2], times[int(len(times) * 0.99)])
+
+
+def __init__():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("-i", "--iterations", type=int, default=200, help="fetches to time")
+  parser.add_argument("-d", "--delay", type=float, default=0.005, help="server delay per request (s)")
+  parser.add_argument("-a", "--apps", type=int, default=50, help="apps in the metrics payload")
+  args = parser.parse_args()
+
+  store = fake_qosds.FakeQosDataStore(delay=args.delay)
+  for i in range(args.apps):
+    store.setSlack('app%d' % i, 0.5, 10.0)
+  store.start()
+  try:
+    client = qosclient.QosClient(store.url)
+    print "QoS data store fetch, %d iterations, %.1f ms server delay" \
+          % (args.iterations, 1000 * args.delay)
+    Report('fresh', Measure(lambda: FetchFresh(store.url), args.iterations))
+    Report('QosClient', Measure(client.refresh, args.iterations))
+    assert client.slack('app0') == (0.5, 10.0)
+    client.close()
+  finally:
+    store.stop()
+
+__init__()
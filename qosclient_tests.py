@@ -0,0 +1,57 @@
+import unittest
+import qosclient
+import fake_qosds
+
+class TestQosclientMethods(unittest.TestCase):
+    def setUp(self):
+        self.qosds = fake_qosds.FakeQosDataStore()
+        self.qosds.start()
+        self.client = qosclient.QosClient(self.qosds.url, 500, 1000)
+
+    def tearDown(self):
+        self.client.close()
+        self.qosds.stop()
+
+    def test_refresh(self):
+        self.qosds.setSlack('app', 0.3, 12.5)
+        self.client.refresh()
+        self.assertTrue(self.client.enabled(False))
+        self.assertEqual(self.client.slack('app'), (0.3, 12.5))
+        self.assertEqual(self.client.slack('other'), (0.0, 0.0))
+        self.qosds.enabled = False
+        self.client.refresh()
+        self.assertFalse(self.client.enabled(True))
+
+    def test_refresh_error(self):
+        self.qosds.setSlack('app', 0.3)
+        self.qosds.documents['/v1/switch'] = {'error': True, 'data': 'switch not set'}
+        self.qosds.documents['/v1/apps/metrics'] = {'error': True, 'data': 'no metrics'}
+        self.client.refresh()
+        self.assertEqual(self.client.enabled('default'), 'default')
+        self.assertEqual(self.client.slack('app'), (0.0, 0.0))
+
+    def test_refresh_malformed(self):
+        for switch, metrics in [({}, {'error': False}), ('[1]', 'not json'), ('null', '{"data": {}}')]:
+            self.qosds.documents['/v1/switch'] = switch
+            self.qosds.documents['/v1/apps/metrics'] = metrics
+            self.client.refresh()
+            self.assertEqual(self.client.enabled('default'), 'default')
+        # only the metrics document was well formed
+        self.assertEqual(self.client.metrics, {})
+
+    def test_refresh_down(self):
+        self.qosds.stop()
+        self.client.refresh()
+        self.assertEqual(self.client.enabled('default'), 'default')
+        self.assertEqual(self.client.slack('app'), (0.0, 0.0))
+
+    def test_watch(self):
+        self.qosds.setSlack('app', -0.2)
+        self.assertEqual(self.client.watch(0), {'app': {'metrics': {'slack': -0.2, 'latency': 0.0}}})
+        self.qosds.documents['/v1/apps/metrics'] = '[]'
+        self.assertEqual(self.client.watch(0), None)
+        self.qosds.documents['/v1/apps/metrics'] = {'error': True, 'data': 'no metrics'}
+        self.assertEqual(self.client.watch(0), None)
+
+if __name__ == '__main__':
+    unittest.main()
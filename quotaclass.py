@@ -0,0 +1,85 @@
+"""
+CPU quota utilities class
+
+Current assumptions:
+ - CPU controller is enabled in cgroups (v1 or v2, cgroupfs driver)
+ - Container cgroups follow the kubelet layout kubepods/<qos>/pod<uid>/<cid>
+ - In aggregate mode, BE containers inherit the quota of a parent cgroup
+   (-1 in their own cgroups), since cgroup v1 rejects child quotas above the parent's
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import docker
+
+class QuotaClass(object):
+  """This class sets CFS bandwidth limits by writing directly into container cgroups.
+
+     Docker is only used as a fallback, when the cgroup of a container cannot
+     be written. Each docker update is a blocking REST call to dockerd, while a
+     cgroup write is one or two small file writes.
+
+     Useful documents and examples:
+      - CFS bandwidth control
+        https://www.kernel.org/doc/Documentation/scheduler/sched-bwc.txt
+  """
+  def __init__(self, cgroup):
+    self.cgroup = cgroup
+    self.direct = cgroup.exists('kubepods')
+    if not self.direct:
+      print 'Quota:WARNING: CPU cgroup not configured for K8S, using docker for quota'
+
+
+  def setQuota(self, cont_key, cont, quota, period=None):
+    """ Sets the CFS quota (and optionally the period) of a container
+        returns True if the cgroup was written directly
+    """
+    if self.direct:
+      try:
+        self.cgroup.setCpuQuota(cont_key, quota, period)
+        return True
+      except EnvironmentError as e:
+        print 'Quota:WARNING: Cannot write cgroup of %s, using docker: %s' % (cont_key, e)
+    # fallback to docker
+    if period:
+      cont.docker.update(cpu_period=period)
+    cont.docker.update(cpu_quota=quota)
+    return False
+
+
+  def getQuota(self, cont_key, cont):
+    """ Returns the CFS (quota, period) of a container, quota is -1 or 0 for no limit
+    """
+    if self.direct:
+      try:
+        return self.cgroup.cpuQuota(cont_key)
+      except (EnvironmentError, ValueError) as e:
+        print 'Quota:WARNING: Cannot read cgroup of %s, using docker: %s' % (cont_key, e)
+    # fallback to docker
+    cont.docker.reload()
+    return cont.docker.attrs['HostConfig']['CpuQuota'], cont.docker.attrs['HostConfig']['CpuPeriod']
+
+
+  def setGroupQuota(self, group_key, quota, period=None):
+    """ Sets the CFS quota (and optionally the period) of a parent cgroup, e.g. kubepods/besteffort
+        raises EnvironmentError if the cgroup cannot be written; there is no docker fallback
+    """
+    self.cgroup.setCpuQuota(group_key, quota, period)
+
+
+  def clearTree(self, group_key):
+    """ Removes the quota of a parent cgroup and of all the cgroups below it
+        returns the number of cgroups cleared
+    """
+    self.setGroupQuota(group_key, -1)
+    cleared = 1
+    for key in self.cgroup.descendants(group_key):
+      try:
+        self.cgroup.setCpuQuota(key, -1)
+        cleared += 1
+      except EnvironmentError as e:
+        print 'Quota:WARNING: Cannot clear quota of %s: %s' % (key, e)
+    return cleared
@@ -1,5 +1,5 @@
 """
-Simple reader writer lock based on the Python Cookbook
+Reader writer locks, the simple one based on the Python Cookbook
 
 """
 
@@ -7,6 +7,7 @@ __author__ = "Christos Kozyrakis"
 __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
+import time
 import threading
 
 class ReadWriteLock(object):
@@ -39,3 +40,175 @@ class ReadWriteLock(object):
 
   def release_write(self):
     self._read_ready.release()
+
+
+class Histogram(object):
+  """ Counts of durations in fixed buckets (ms), plus count, sum and max
+  """
+  bounds = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.buckets = [0] * (len(self.bounds) + 1)
+    self.count = 0
+    self.sum_ms = 0.0
+    self.max_ms = 0.0
+
+  def observe(self, seconds):
+    ms = 1000.0 * seconds
+    i = 0
+    while i < len(self.bounds) and ms > self.bounds[i]:
+      i += 1
+    self.buckets[i] += 1
+    self.count += 1
+    self.sum_ms += ms
+    self.max_ms = max(self.max_ms, ms)
+
+  def fields(self, prefix):
+    """ Returns the histogram as metric fields, with cumulative buckets
+    """
+    fields = {prefix + '.count': self.count, prefix + '.sum_ms': self.sum_ms, \
+              prefix + '.max_ms': self.max_ms}
+    total = 0
+    for bound, n in zip(self.bounds + ['inf'], self.buckets):
+      total += n
+      fields[prefix + '.le_%sms' % bound] = total
+    return fields
+
+
+# all instrumented locks, for metrics
+locks = []
+
+class WriterPreferringLock(object):
+  """ A reader writer lock where a waiting writer blocks new readers, so a steady
+      stream of readers cannot starve writers. Acquires take an optional timeout
+      (seconds) and return False if it expires.
+
+      A thread that holds the lock for reading may acquire it again for reading,
+      even while a writer waits; nested reads are released in reverse order.
+      The write lock is not reentrant, and a reader cannot upgrade to a writer.
+
+      Wait and hold times of readers and writers are recorded in histograms,
+      reported by Stats() since its last call. Timeouts and durations use clock,
+      which should be monotonic, e.g. settings.Monotonic.
+  """
+  def __init__(self, name, clock=time.time):
+    self.name = name
+    self.clock = clock
+    self._cond = threading.Condition(threading.Lock())
+    self._readers = 0
+    self._writer = False
+    self._waiting_writers = 0
+    # acquire times of the read holds, per thread, and of the write hold
+    self._held = threading.local()
+    self._write_start = None
+    self.hist = dict([(_, Histogram()) for _ in ['read_wait', 'read_hold', 'write_wait', 'write_hold']])
+    self.timeouts = 0
+    locks.append(self)
+
+  def _wait(self, blocked, timeout):
+    """ Waits until blocked() is false, with the condition held
+    """
+    deadline = None if timeout is None else self.clock() + timeout
+    while blocked():
+      if deadline is None:
+        self._cond.wait()
+        continue
+      remaining = deadline - self.clock()
+      if remaining <= 0:
+        return False
+      self._cond.wait(remaining)
+    return True
+
+  def _reads(self):
+    """ Acquire times of the read holds of the calling thread
+    """
+    if not hasattr(self._held, 'reads'):
+      self._held.reads = []
+    return self._held.reads
+
+  def acquire_read(self, timeout=None):
+    reads = self._reads()
+    start = self.clock()
+    self._cond.acquire()
+    try:
+      # a nested read must not wait for writers, they wait for the outer read
+      if reads:
+        blocked = lambda: self._writer
+      else:
+        blocked = lambda: self._writer or self._waiting_writers > 0
+      if not self._wait(blocked, timeout):
+        self.timeouts += 1
+        return False
+      self._readers += 1
+      now = self.clock()
+      self.hist['read_wait'].observe(now - start)
+    finally:
+      self._cond.release()
+    reads.append(now)
+    return True
+
+  def release_read(self):
+    held = self.clock() - self._reads().pop()
+    self._cond.acquire()
+    try:
+      self._readers -= 1
+      self.hist['read_hold'].observe(held)
+      if not self._readers:
+        self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+  def acquire_write(self, timeout=None):
+    start = self.clock()
+    self._cond.acquire()
+    try:
+      self._waiting_writers += 1
+      acquired = self._wait(lambda: self._writer or self._readers > 0, timeout)
+      self._waiting_writers -= 1
+      if not acquired:
+        self.timeouts += 1
+        # readers held back by this writer may go
+        self._cond.notifyAll()
+        return False
+      self._writer = True
+      self._write_start = self.clock()
+      self.hist['write_wait'].observe(self._write_start - start)
+    finally:
+      self._cond.release()
+    return True
+
+  def release_write(self):
+    held = self.clock() - self._write_start
+    self._cond.acquire()
+    try:
+      self._writer = False
+      self.hist['write_hold'].observe(held)
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+  def stats(self):
+    """ Returns the histograms and timeouts as metric fields and resets them
+    """
+    self._cond.acquire()
+    try:
+      fields = {self.name + '.timeouts': self.timeouts}
+      for kind, hist in self.hist.items():
+        fields.update(hist.fields(self.name + '.' + kind))
+        hist.reset()
+      self.timeouts = 0
+    finally:
+      self._cond.release()
+    return fields
+
+
+def Stats():
+  """ Metric fields of all instrumented locks, since the last call
+  """
+  fields = {}
+  for _ in locks:
+    fields.update(_.stats())
+  return fields
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+import rwlock
+
+class TestRwlockMethods(unittest.TestCase):
+    def test_writer_preferred(self):
+        lock = rwlock.WriterPreferringLock('test')
+        self.assertTrue(lock.acquire_read())
+        writer = threading.Thread(target=lock.acquire_write)
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(0.001)
+        # a waiting writer holds back new readers
+        reads = []
+        reader = threading.Thread(target=lambda: reads.append(lock.acquire_read(timeout=0.01)))
+        reader.start()
+        reader.join()
+        self.assertEqual(reads, [False])
+        lock.release_read()
+        writer.join()
+        self.assertTrue(lock._writer)
+        lock.release_write()
+        self.assertTrue(lock.acquire_read(timeout=0.01))
+        lock.release_read()
+
+    def test_write_timeout(self):
+        lock = rwlock.WriterPreferringLock('test')
+        self.assertTrue(lock.acquire_read())
+        self.assertFalse(lock.acquire_write(timeout=0.01))
+        # readers are not held back by a writer that gave up
+        self.assertTrue(lock.acquire_read(timeout=0.01))
+        lock.release_read()
+        lock.release_read()
+        self.assertTrue(lock.acquire_write(timeout=0.01))
+        lock.release_write()
+
+    def test_stats(self):
+        lock = rwlock.WriterPreferringLock('test')
+        lock.acquire_write()
+        lock.release_write()
+        lock.acquire_write()
+        self.assertFalse(lock.acquire_read(timeout=0.02))
+        lock.release_write()
+        stats = lock.stats()
+        self.assertEqual(stats['test.write_wait.count'], 2)
+        self.assertEqual(stats['test.write_hold.le_5ms'], 1)
+        self.assertEqual(stats['test.write_hold.le_infms'], 2)
+        self.assertTrue(stats['test.write_hold.max_ms'] >= 20)
+        self.assertEqual(stats['test.read_wait.count'], 0)
+        self.assertEqual(stats['test.timeouts'], 1)
+        # stats are reset by every report
+        self.assertEqual(lock.stats()['test.write_wait.count'], 0)
+        self.assertTrue('test.timeouts' in rwlock.Stats())
+
+    def test_nested_read(self):
+        now = [0.0]
+        lock = rwlock.WriterPreferringLock('test', clock=lambda: now[0])
+        self.assertTrue(lock.acquire_read())
+        writer = threading.Thread(target=lock.acquire_write)
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(0.001)
+        # the thread holding a read is not held back by the waiting writer
+        now[0] = 1.0
+        self.assertTrue(lock.acquire_read(timeout=0.01))
+        now[0] = 1.5
+        lock.release_read()
+        now[0] = 3.0
+        lock.release_read()
+        writer.join()
+        lock.release_write()
+        # each hold is timed from its own acquire
+        hist = lock.hist['read_hold']
+        self.assertEqual((hist.count, hist.sum_ms, hist.max_ms), (2, 3500.0, 3000.0))
+
+    def test_clock(self):
+        now = [0.0]
+        def clock():
+            now[0] += 1.0
+            return now[0]
+        lock = rwlock.WriterPreferringLock('test', clock=clock)
+        lock.acquire_write()
+        # the timeout expires on the lock clock, after one short wait
+        self.assertFalse(lock.acquire_read(timeout=1.05))
+        lock.release_write()
+        self.assertEqual(lock.stats()['test.timeouts'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
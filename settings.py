@@ -7,12 +7,19 @@ __author__ = "Christos Kozyrakis"
 __email__ = "christos@hyperpilot.io"
 __copyright__ = "Copyright 2017, HyperPilot Inc"
 
-import sys
+import time
+import copy
+import ctypes
+import threading
+import socket
+import Queue
 import docker
 from kubernetes import watch
-import rwlock
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
 import store
-import command_client as cc
+import procstat
+import rwlock
 
 class Container(object):
   """ A class for tracking active containers
@@ -25,6 +32,10 @@ class Container(object):
     self.period = 0
     self.quota = 0
     self.cpu_percent = 0
+    self.nr_periods = 0
+    self.nr_throttled = 0
+    self.throttled_time = 0
+    self.iops = 0
 
   def __repr__(self):
     return "<Container:%s pod:%s>" %(self.docker_name)
@@ -41,33 +52,204 @@ class Pod(object):
     self.uid = ''
     self.qosclass = ''
     self.wclass = ''
+    self.priority = 0
     self.ipaddress = ''
+    self.net_mbps = 0
     self.container_ids = set()
     self.containers = {}
 
+  def cgroup_root(self):
+    """ Relative cgroup path of the pod, as laid out by the kubelet
+    """
+    if self.qosclass == 'guaranteed':
+      return 'kubepods/pod' + self.uid
+    return 'kubepods/' + self.qosclass + '/pod' + self.uid
+
+  def cgroup_key(self, cid):
+    """ Relative cgroup path of a container of the pod
+    """
+    return self.cgroup_root() + '/' + cid
+
+  def copy(self):
+    """ Copy of the pod with its own container set, sharing the Container objects
+    """
+    pod = copy.copy(self)
+    pod.container_ids = set(self.container_ids)
+    pod.containers = dict(self.containers)
+    return pod
+
+
+class PodSnapshot(object):
+  """ An immutable view of the active pods, published by ActivePods on every change
+      Controllers read st.active.snapshot once per cycle, with no locking; the
+      pods and indexes of a snapshot never change after it is published.
+      The Container objects are shared, so controller state (quota, usage)
+      carries over to later snapshots.
+  """
+  def __init__(self):
+    # {pod key: Pod}
+    self.pods = {}
+    # indexes: {wclass: {pod key: Pod}}, {ip: {pod key: Pod}}
+    self.by_class = {'BE': {}, 'HP': {}}
+    self.by_ip = {}
+    # {cgroup key: (pod, container)} of all containers
+    self.containers = {}
+    self.be_keys = frozenset()
+    self.hp_keys = frozenset()
+    self.be_ips = frozenset()
+
+  @property
+  def be_pods(self):
+    return self.by_class['BE'].values()
+
+  @property
+  def hp_pods(self):
+    return self.by_class['HP'].values()
+
+  def be_containers(self):
+    """ (pod, container) of all BE containers
+    """
+    return [(pod, cont) for pod in self.be_pods for _, cont in pod.containers.items()]
+
+  def replace(self, key, pod):
+    """ Returns a new snapshot with the pod of key replaced by pod, or removed if pod is None
+        only the index entries of that pod are updated
+    """
+    snap = PodSnapshot()
+    snap.pods = dict(self.pods)
+    snap.by_class = dict([(k, dict(v)) for k, v in self.by_class.items()])
+    snap.by_ip = dict(self.by_ip)
+    snap.containers = dict(self.containers)
+    be_keys = set(self.be_keys)
+    hp_keys = set(self.hp_keys)
+    be_ips = set(self.be_ips)
+    old = snap.pods.pop(key, None)
+    ips = set()
+    if old is not None:
+      del snap.by_class[old.wclass][key]
+      snap.by_ip[old.ipaddress] = dict(snap.by_ip[old.ipaddress])
+      del snap.by_ip[old.ipaddress][key]
+      ips.add(old.ipaddress)
+      for cid in old.container_ids:
+        ckey = old.cgroup_key(cid)
+        del snap.containers[ckey]
+        be_keys.discard(ckey)
+        hp_keys.discard(ckey)
+    if pod is not None:
+      snap.pods[key] = pod
+      snap.by_class[pod.wclass][key] = pod
+      snap.by_ip[pod.ipaddress] = dict(snap.by_ip.get(pod.ipaddress, {}))
+      snap.by_ip[pod.ipaddress][key] = pod
+      ips.add(pod.ipaddress)
+      for cid, cont in pod.containers.items():
+        ckey = pod.cgroup_key(cid)
+        snap.containers[ckey] = (pod, cont)
+        (be_keys if pod.wclass == 'BE' else hp_keys).add(ckey)
+    # an IP can be shared by several pods, e.g. with host networking
+    for ip in ips:
+      if not snap.by_ip[ip]:
+        del snap.by_ip[ip]
+      if ip and [_ for _ in snap.by_ip.get(ip, {}).values() if _.wclass == 'BE']:
+        be_ips.add(ip)
+      else:
+        be_ips.discard(ip)
+    snap.be_keys = frozenset(be_keys)
+    snap.hp_keys = frozenset(hp_keys)
+    snap.be_ips = frozenset(be_ips)
+    return snap
+
+
+class ContainerCache(object):
+  """ A cache of docker containers, keyed by container id
+      Missing containers are resolved with a single filtered list call, instead
+      of one inspect per container.
+  """
+  def __init__(self):
+    self.containers = {}
+    self.lock = rwlock.WriterPreferringLock('container_cache', Monotonic)
+
+  def resolve(self, cids):
+    """ Returns {cid: docker container} for the given ids; unknown ids are left out
+    """
+    self.lock.acquire_read()
+    missing = [_ for _ in cids if _ not in self.containers]
+    self.lock.release_read()
+    found = {}
+    if missing:
+      try:
+        for summary in node.denv.api.containers(all=True, filters={'id': missing}):
+          # the list summary has Names instead of Name
+          summary['Name'] = summary['Names'][0] if summary.get('Names') else None
+          found[summary['Id']] = node.denv.containers.prepare_model(summary)
+      except docker.errors.APIError as e:
+        print "K8SWatch:WARNING: Cannot list containers: %s" %(e)
+    self.lock.acquire_write()
+    self.containers.update(found)
+    resolved = dict([(_, self.containers[_]) for _ in cids if _ in self.containers])
+    self.lock.release_write()
+    return resolved
+
+  def forget(self, cids):
+    """ Drops containers that are gone
+    """
+    self.lock.acquire_write()
+    for _ in cids:
+      self.containers.pop(_, None)
+    self.lock.release_write()
+
 
 class ActivePods(object):
   """ A class for tracking active pods
+      Pods are copied on write: every change publishes a new PodSnapshot, so
+      readers never see a pod or a pod set half-updated. Subscribers also get
+      the containers added and removed by every change, as it happens.
   """
   def __init__(self):
     self.pods = {}
-    self.lock = rwlock.ReadWriteLock()
+    self.snapshot = PodSnapshot()
     self.hp_pods = 0
     self.be_pods = 0
+    # queues of subscribed controllers
+    self.subscribers = []
+    # latest MODIFIED event per pod, waiting for ContainerResolver
+    self.pending = {}
+    self.pending_cv = threading.Condition()
+    # serializes pod updates of the watch and the resolver threads
+    self.update_lock = rwlock.WriterPreferringLock('active_pods', Monotonic)
+
+  def subscribe(self):
+    """ Returns a queue that receives (added, removed) on every change of the active pods,
+        lists of the (cgroup key, pod, container) added and removed
+    """
+    deltas = Queue.Queue()
+    self.subscribers.append(deltas)
+    return deltas
+
+  def publish(self, key, pod):
+    """ Replaces the pod of key (removes it if pod is None), publishes the new
+        snapshot and pushes the container changes to the subscribers
+        callers hold update_lock
+    """
+    old = self.pods.get(key)
+    snapshot = self.snapshot.replace(key, pod)
+    self.pods = snapshot.pods
+    self.hp_pods = len(snapshot.by_class['HP'])
+    self.be_pods = len(snapshot.by_class['BE'])
+    self.snapshot = snapshot
+    old_conts = old.containers if old is not None else {}
+    new_conts = pod.containers if pod is not None else {}
+    added = [(pod.cgroup_key(cid), pod, c) for cid, c in new_conts.items() if cid not in old_conts]
+    removed = [(old.cgroup_key(cid), old, c) for cid, c in old_conts.items() if cid not in new_conts]
+    if added or removed:
+      for _ in self.subscribers:
+        _.put((added, removed))
 
   def delete_pod(self, key):
     """ Stop tracking pod
     """
     pod = self.pods[key]
-    if pod.wclass == 'BE':
-      self.be_pods -= 1
-    else:
-      self.hp_pods -= 1
-    self.lock.acquire_write()
-    pod.containers.clear()
-    pod.container_ids.clear()
-    self.pods.pop(key)
-    self.lock.release_write()
+    self.publish(key, None)
+    container_cache.forget(pod.container_ids)
     if verbose:
       print "K8SWatch: DELETED pod %s" %(key)
 
@@ -83,29 +265,19 @@ class ActivePods(object):
     pod.ipaddress = k8s_object.status.pod_ip
     pod.qosclass = k8s_object.status.qos_class.lower()
     pod.wclass = ExtractWClass(k8s_object)
+    pod.priority = ExtractPriority(k8s_object)
     if pod.wclass == 'BE' and pod.qosclass != 'besteffort':
       print "K8SWatch:WARNING: Pod %s is not BestEffort in K8S" %(key)
-    if pod.wclass == 'BE':
-      self.be_pods += 1
-    else:
-      self.hp_pods += 1
-    self.lock.acquire_write()
-    self.pods[key] = pod
-    self.lock.release_write()
+    self.publish(key, pod)
     if verbose:
       print "K8SWatch: ADDED pod %s (%s, %s)" %(key, pod.qosclass, pod.wclass)
 
-  def modify_pod(self, k8s_object, key, min_quota):
-    """ Modify tracked pod
+  def modify_pod(self, k8s_object, key, min_quota, resolved):
+    """ Modify tracked pod, resolved is {cid: docker container} of its new containers
     """
-    pod = self.pods[key]
+    pod = self.pods[key].copy()
     # set with containers in event
-    new_cont = set()
-    for cont in k8s_object.status.container_statuses:
-      if not cont.container_id:
-        continue
-      cid = cont.container_id[len('docker://'):]
-      new_cont.add(cid)
+    new_cont = ContainerIds(k8s_object)
     added_cont = new_cont.difference(pod.container_ids)
     deleted_cont = pod.container_ids.difference(new_cont)
     # process all added containers
@@ -113,32 +285,45 @@ class ActivePods(object):
       c = Container()
       c.docker_id = _
       c.ipaddress = k8s_object.status.pod_ip
-      try:
-        c.docker = node.denv.containers.get(_)
-      except (docker.errors.NotFound, docker.errors.APIError):
+      if _ not in resolved:
         print "K8SWatch:WARNING: Cannot find containers %s for pod %s" %(_, key)
         continue
+      c.docker = resolved[_]
       c.docker_name = c.docker.name
-      c.quota = c.docker.attrs['HostConfig']['CpuQuota']
-      c.period = c.docker.attrs['HostConfig']['CpuPeriod']
+      try:
+        c.quota, c.period = node.quotactl.getQuota(pod.cgroup_key(_), c)
+      except (docker.errors.NotFound, docker.errors.APIError) as e:
+        print "K8SWatch:WARNING: Cannot get quota for container %s: %s" %(_, e)
+        continue
+      # in aggregate mode, BE containers under the BE cgroup run without their own quota
+      if enabled and pod.wclass == 'BE' and node.be_group and \
+         pod.cgroup_root().startswith(node.be_group + '/'):
+        if c.quota > 0:
+          try:
+            node.quotactl.setQuota(pod.cgroup_key(_), c, -1)
+          except docker.errors.APIError as e:
+            print "K8SWatch:WARNING: Cannot clear quota for container %s: %s" %(_, e)
+        c.quota = -1
       # if the controller is enabled, set min quota for BE pods
-      if enabled and pod.wclass == 'BE':
+      elif enabled and pod.wclass == 'BE':
+        period = None
         if c.period != 100000:
-          c.period = 100000
-          c.docker.update(cpu_period=100000)
-        if c.quota != min_quota:
+          c.period = period = 100000
+        if c.quota != min_quota or period:
           c.quota = min_quota
-          c.docker.update(cpu_quota=c.quota)
-      self.lock.acquire_write()
+          try:
+            node.quotactl.setQuota(pod.cgroup_key(_), c, c.quota, period)
+          except docker.errors.APIError as e:
+            print "K8SWatch:WARNING: Cannot set quota for container %s: %s" %(_, e)
       pod.container_ids.add(_)
       pod.containers[_] = c
-      self.lock.release_write()
     # process all deleted containers
-    self.lock.acquire_write()
     for _ in deleted_cont:
       pod.containers.pop(_)
       pod.container_ids.remove(_)
-    self.lock.release_write()
+    if pod.container_ids != self.pods[key].container_ids:
+      self.publish(key, pod)
+    container_cache.forget(deleted_cont)
     if verbose:
       print "K8SWatch:UPDATED pod %s (%s, %s)" %(key, pod.qosclass, pod.wclass)
 
@@ -146,48 +331,42 @@ class ActivePods(object):
 class NodeInfo(object):
   """ A class for tracking node stats
   """
-  def __init__(self, ctlloc):
+  def __init__(self):
     # config
     self.cpu = 0
     self.name = ''
     self.qos_app = ''
     self.kenv = None
     self.denv = None
-    self.cc = cc.CommandClient(ctlloc)
+    self.cgroup = None
+    self.quotactl = None
+    self.cpuacct = None
+    self.victims = None
+    self.be_label = None
+    self.evictor = None
+    self.policy = None
+    self.allocator = None
+    self.interference = None
+    # parent cgroup of BE pods in aggregate quota mode, None in per-container mode
+    self.be_group = None
     # stats
     self.hp_cpu_percent = 0
     self.be_cpu_percent = 0
     self.be_quota = 0
     self.cpuload = 0
+    self.core_load = []
     # temp
-    self.PrevTotal = 0
-    self.PrevIdle = 0
+    self.procstat = None
 
   def GetCpuLoad(self):
-    """ Return CPU load (0-100.0)
+    """ Return CPU load (0-100.0); per-core loads are kept in core_load
     """
-    # Read /proc/stat
-    out, err = self.cc.run_command('cat /proc/stat')
-    if err:
+    if self.procstat is None:
+      self.procstat = procstat.ProcStat(get_param('procfs', None, '/proc') + '/stat')
+    try:
+      self.cpuload, self.core_load = self.procstat.sample()
+    except EnvironmentError:
       raise Exception('Cannot access /proc/stat')
-    # extract fields for overall CPU
-    lines = out.split('\n')
-    cpu_line = lines[0].split()
-    if cpu_line[0] != 'cpu':
-      raise Exception('Cannot parse /proc/stat')
-    cpu_line = [cpu_line[0]]+[float(i) for i in cpu_line[1:]]#type casting
-    cpu_id, user, nice, system, idle, iowait, irq, softrig, steal, guest, guest_nice = cpu_line
-    Idle = idle + iowait
-    NonIdle = user + nice + system + irq + softrig + steal
-    Total = Idle + NonIdle
-    # calculate CPU load
-    self.cpuload = (((Total-self.PrevTotal)-(Idle-self.PrevIdle)) / (Total-self.PrevTotal))*100
-    if self.cpuload < 0.0:
-      self.cpuload = 0.0
-    if self.cpuload > 100.0:
-      self.cpuload = 100.0
-    self.PrevTotal = Total
-    self.PrevIdle = Idle
     return self.cpuload
 
 
@@ -199,9 +378,48 @@ def ExtractWClass(item):
       return 'BE'
     else:
       return 'HP'
-  except (KeyError, NameError):
+  except (KeyError, NameError, TypeError):
     return 'HP'
 
+class Timespec(ctypes.Structure):
+  """ struct timespec for clock_gettime
+  """
+  _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+try:
+  clock_gettime = ctypes.CDLL('librt.so.1', use_errno=True).clock_gettime
+except (OSError, AttributeError):
+  clock_gettime = None
+
+def Monotonic():
+  """ Returns seconds from a monotonic clock, immune to wall clock changes
+      falls back to the wall clock if clock_gettime is not available
+  """
+  if clock_gettime is None:
+    return time.time()
+  ts = Timespec()
+  if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+    return time.time()
+  return ts.tv_sec + ts.tv_nsec * 1E-9
+
+def ContainerIds(item):
+  """ Extracts the ids of the started containers from V1Pod object
+  """
+  cids = set()
+  for cont in item.status.container_statuses or []:
+    if cont.container_id:
+      cids.add(cont.container_id[len('docker://'):])
+  return cids
+
+def ExtractPriority(item):
+  """ Extracts the BE priority label from V1Pod object, lower priority pods are penalized first
+  """
+  try:
+    return int(item.metadata.labels['hyperpilot.io/be-priority'])
+  except (KeyError, NameError, TypeError, ValueError):
+    return 0
+
 # globals
 # controller parameters
 verbose = False
@@ -221,71 +439,229 @@ def get_param(name, section=None, default=None):
   return default
 # all active containers and pods
 active = ActivePods()
+container_cache = ContainerCache()
 # node info
-node = NodeInfo('in')
+node = NodeInfo()
 # stats writer
 stats_writer = store.InfluxWriter()
+# QoS data store client
+qosds = None
+# set to start the next quota cycle right away
+wakeup = threading.Event()
 
-def K8SWatch():
-  """ Maintains the list of active containers.
+def SleepOnDeltas(deltas, timeout, handle=None):
+  """ Sleeps for timeout seconds, calling handle(added, removed) for the changes
+      of the active pods pushed to deltas meanwhile; changes are dropped without handle
+      Changes already queued are handled together, e.g. a burst of new pods.
   """
-  w = watch.Watch()
-  selector = ''
-  timeout = 100000
-  min_quota = int(node.cpu * 100000 * params["quota_controller"]['min_be_quota'])
-
-  # infinite loop listening to K8S pod events
-  for event in w.stream(node.kenv.list_pod_for_all_namespaces,\
-                        timeout_seconds=timeout, label_selector=selector):
-    k8s_object = event['object']
-    pod_key = k8s_object.metadata.namespace + '/' + k8s_object.metadata.name
-    modify_event = (event['type'] == 'MODIFIED')
-    add_event = (event['type'] == 'ADDED')
-    delete_event = (event['type'] == 'DELETED') or (k8s_object.status.phase == 'Succeeded') \
-                   or (k8s_object.status.phase == 'Failed')
-
-    # check if this the QoS app and needs to be tracked
+  deadline = Monotonic() + timeout
+  while 1:
+    remaining = deadline - Monotonic()
+    if remaining <= 0:
+      return
+    try:
+      added, removed = deltas.get(timeout=remaining)
+    except Queue.Empty:
+      return
+    added = list(added)
+    removed = list(removed)
     try:
-      if k8s_object.metadata.labels['hyperpilot.io/qos'] == 'true':
-        if add_event or modify_event:
-          node.qos_app = k8s_object.status.container_statuses[0].name
-          if verbose:
-            print "K8SWatch: Found QoS workload %s" %node.qos_app
-        elif delete_event:
-          if verbose:
-            print "K8SWatch: Deleting QoS workload %s" %pod_key
-          node.qos_app = ''
-    except (KeyError, NameError, TypeError):
+      while 1:
+        more_added, more_removed = deltas.get_nowait()
+        added.extend(more_added)
+        removed.extend(more_removed)
+    except Queue.Empty:
       pass
+    if handle is not None:
+      handle(added, removed)
 
-    # skip all events for pods for on different/unspecified nodes
-    if not k8s_object.spec.node_name == node.name:
-      continue
-    if verbose:
-      print "K8SWatch: Watcher (%d): %s %s" % (len(active.pods), event['type'], pod_key)
-
-    # type of event and processing needed
-    tracked_pod = (pod_key in active.pods)
-    has_containers = (k8s_object.status.container_statuses) and \
-                     len(k8s_object.status.container_statuses) and \
-                     (k8s_object.status.container_statuses[0].container_id)
-    add_pod = (add_event or modify_event) and  (not tracked_pod) and has_containers
-    modify_pod = (add_event or modify_event) and has_containers
-    delete_pod = delete_event and tracked_pod
-    if not(add_pod or modify_pod or delete_pod):
-      continue
 
-    # add new pod
-    if add_pod:
-      active.add_pod(k8s_object, pod_key)
-    # modify pod
-    if modify_pod:
-      active.modify_pod(k8s_object, pod_key, min_quota)
+def ListWatch(name, func, handle, resync, **selectors):
+  """ Lists pods, then watches them from the resourceVersion of the list, forever
+      handle(event_type, k8s_object) is called for every event, resync(k8s_objects)
+      after every list. When a watch ends, it resumes from the last resourceVersion
+      it saw; only a 410 Gone (resourceVersion too old) causes a relist.
+      Errors of handle and resync are logged and skipped, they do not end the watch.
+  """
+  w = watch.Watch()
+  timeout = get_param('watch_timeout', None, 300)
+  resource_version = None
+  backoff = 1
+  while 1:
+    try:
+      if resource_version is None:
+        pods = func(**selectors)
+        resource_version = pods.metadata.resource_version
+        try:
+          resync(pods.items)
+        except Exception as e:
+          print "%s:WARNING: Cannot resync pods: %s: %s" % (name, type(e).__name__, e)
+        if verbose:
+          print "%s: Listed %d pods at resourceVersion %s" % (name, len(pods.items), resource_version)
+      for event in w.stream(func, resource_version=resource_version, \
+                            timeout_seconds=timeout, **selectors):
+        if event['type'] == 'ERROR':
+          status = event['raw_object']
+          if status.get('code') == 410:
+            print "%s:WARNING: resourceVersion %s expired, relisting" % (name, resource_version)
+            resource_version = None
+            break
+          raise ApiException(status=status.get('code'), reason=status.get('message'))
+        resource_version = event['raw_object']['metadata']['resourceVersion']
+        try:
+          handle(event['type'], event['object'])
+        except Exception as e:
+          print "%s:WARNING: Cannot handle %s event: %s: %s" % (name, event['type'], type(e).__name__, e)
+      backoff = 1
+    except ApiException as e:
+      if e.status == 410:
+        print "%s:WARNING: resourceVersion %s expired, relisting" % (name, resource_version)
+        resource_version = None
+        continue
+      print "%s:WARNING: Pod watch failed, retrying in %d s: %s" % (name, backoff, e)
+      time.sleep(backoff)
+      backoff = min(2 * backoff, 30)
+    except (HTTPError, socket.error, ValueError) as e:
+      print "%s:WARNING: Pod watch failed, retrying in %d s: %s" % (name, backoff, e)
+      time.sleep(backoff)
+      backoff = min(2 * backoff, 30)
+
+
+def PodEvent(event_type, k8s_object):
+  """ Applies a pod event of the local node to the active pods
+      Pods are added and deleted right away; containers are resolved by
+      ContainerResolver, which only sees the latest event of each pod.
+  """
+  pod_key = k8s_object.metadata.namespace + '/' + k8s_object.metadata.name
+  modify_event = (event_type == 'MODIFIED')
+  add_event = (event_type == 'ADDED')
+  delete_event = (event_type == 'DELETED') or (k8s_object.status.phase == 'Succeeded') \
+                 or (k8s_object.status.phase == 'Failed')
+  if verbose:
+    print "K8SWatch: Watcher (%d): %s %s" % (len(active.pods), event_type, pod_key)
+
+  # type of event and processing needed
+  tracked_pod = (pod_key in active.pods)
+  has_containers = (k8s_object.status.container_statuses) and \
+                   len(k8s_object.status.container_statuses) and \
+                   (k8s_object.status.container_statuses[0].container_id)
+  # a pod recreated with the same name is a new pod
+  replaced_pod = tracked_pod and (active.pods[pod_key].uid != k8s_object.metadata.uid)
+  add_pod = (add_event or modify_event) and (not tracked_pod or replaced_pod) and has_containers \
+            and not delete_event
+  modify_pod = (add_event or modify_event) and has_containers
+  delete_pod = (delete_event or replaced_pod) and tracked_pod
+
+  active.update_lock.acquire_write()
+  try:
     # remove a pod
     if delete_pod:
+      active.pending_cv.acquire()
+      active.pending.pop(pod_key, None)
+      active.pending_cv.release()
       active.delete_pod(pod_key)
+    # add new pod
+    if add_pod:
+      active.add_pod(k8s_object, pod_key)
+  finally:
+    active.update_lock.release_write()
+  # modify pod, replacing any event of the pod still pending
+  if modify_pod and not delete_event:
+    active.pending_cv.acquire()
+    active.pending[pod_key] = k8s_object
+    active.pending_cv.notify()
+    active.pending_cv.release()
+
+
+def ContainerResolver():
+  """ Resolves the containers of modified pods off the watch thread
+      Events are collected for resolve_delay seconds, then the new containers
+      of all pods are resolved with one docker call and the pods are updated.
+  """
+  min_quota = int(node.cpu * 100000 * params["quota_controller"]['min_be_quota'])
+  delay = get_param('resolve_delay', None, 0.5)
+  while 1:
+    active.pending_cv.acquire()
+    while not active.pending:
+      active.pending_cv.wait()
+    active.pending_cv.release()
+    # let the rest of a burst arrive
+    time.sleep(delay)
+    ResolvePending(min_quota)
+
+
+def ResolvePending(min_quota):
+  """ Resolves the new containers of all pending pods with one docker call,
+      then applies the latest event of each pod
+  """
+  active.pending_cv.acquire()
+  pending = active.pending
+  active.pending = {}
+  active.pending_cv.release()
+
+  cids = set()
+  for k8s_object in pending.values():
+    cids.update(ContainerIds(k8s_object))
+  resolved = container_cache.resolve(cids)
+  if verbose:
+    print "K8SWatch: Resolved %d containers of %d pods" % (len(resolved), len(pending))
+  for pod_key, k8s_object in pending.items():
+    active.update_lock.acquire_write()
+    try:
+      # skip pods deleted or replaced since the event
+      pod = active.pods.get(pod_key)
+      if pod is not None and pod.uid == k8s_object.metadata.uid:
+        active.modify_pod(k8s_object, pod_key, min_quota, resolved)
+    finally:
+      active.update_lock.release_write()
 
 
-  #not watching K8S anymore
-  print "K8SWatch:ERROR: cannot watch K8S pods stream anynore, terminating"
-  sys.exit(-1)
+def K8SWatch():
+  """ Maintains the list of active containers, watching only the pods of the local node
+  """
+  def resync(k8s_objects):
+    # pods deleted while we were not watching
+    listed = set()
+    for k8s_object in k8s_objects:
+      listed.add(k8s_object.metadata.namespace + '/' + k8s_object.metadata.name)
+      PodEvent('ADDED', k8s_object)
+    active.update_lock.acquire_write()
+    try:
+      for key in set(active.pods.keys()).difference(listed):
+        active.pending_cv.acquire()
+        active.pending.pop(key, None)
+        active.pending_cv.release()
+        active.delete_pod(key)
+    finally:
+      active.update_lock.release_write()
+
+  ListWatch('K8SWatch', node.kenv.list_pod_for_all_namespaces, PodEvent, resync, \
+            field_selector='spec.nodeName=' + node.name)
+
+
+def QosEvent(event_type, k8s_object):
+  """ Tracks the QoS app from the events of its pod
+  """
+  pod_key = k8s_object.metadata.namespace + '/' + k8s_object.metadata.name
+  delete_event = (event_type == 'DELETED') or (k8s_object.status.phase == 'Succeeded') \
+                 or (k8s_object.status.phase == 'Failed')
+  if delete_event:
+    if verbose:
+      print "K8SWatch: Deleting QoS workload %s" %pod_key
+    node.qos_app = ''
+  elif k8s_object.status.container_statuses:
+    node.qos_app = k8s_object.status.container_statuses[0].name
+    if verbose:
+      print "K8SWatch: Found QoS workload %s" %node.qos_app
+
+
+def QosWatch():
+  """ Tracks the QoS app, watching only pods labeled hyperpilot.io/qos=true in the cluster
+  """
+  def resync(k8s_objects):
+    node.qos_app = ''
+    for k8s_object in k8s_objects:
+      QosEvent('ADDED', k8s_object)
+
+  ListWatch('QosWatch', node.kenv.list_pod_for_all_namespaces, QosEvent, resync, \
+            label_selector='hyperpilot.io/qos=true')
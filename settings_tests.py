@@ -0,0 +1,296 @@
+import Queue
+import unittest
+import docker
+from testutil import Obj, MakePod, K8SPod
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+import settings as st
+
+def Rebuild(pods):
+    """ The indexes of a snapshot, built from scratch
+    """
+    snap = st.PodSnapshot()
+    for key, pod in pods.items():
+        snap = snap.replace(key, pod)
+    return snap
+
+class Stop(BaseException):
+    """ Ends ListWatch, which retries on any Exception
+    """
+
+def Event(event_type, rv, obj=None):
+    return {'type': event_type, 'object': obj, 'raw_object': {'metadata': {'resourceVersion': rv}}}
+
+class FakeWatch(object):
+    """ Plays a script of streams, each a list of events or an exception to raise
+    """
+    script = []
+    versions = []
+
+    def stream(self, func, resource_version=None, **kwargs):
+        FakeWatch.versions.append(resource_version)
+        if not FakeWatch.script:
+            raise Stop()
+        stream = FakeWatch.script.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        for event in stream:
+            yield event
+
+class FakeTime(object):
+    def __init__(self):
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+class FakeDockerApi(object):
+    """ Lists containers, as summaries with Names instead of Name
+    """
+    def __init__(self):
+        self.calls = []
+
+    def containers(self, all=False, filters=None):
+        self.calls.append(sorted(filters['id']))
+        return [{'Id': _, 'Names': ['/k8s_' + _]} for _ in filters['id'] if not _.startswith('gone')]
+
+class FakeQuota(object):
+    def getQuota(self, key, cont):
+        return -1, 100000
+
+class TestSettingsMethods(unittest.TestCase):
+    def setUp(self):
+        self.watch = st.watch
+        self.time = st.time
+        self.active = st.active
+        self.container_cache = st.container_cache
+        self.node = st.node
+        st.watch = Obj(Watch=FakeWatch)
+        st.time = FakeTime()
+        st.active = st.ActivePods()
+        st.container_cache = st.ContainerCache()
+        st.node = st.NodeInfo()
+        # a real client, only its API calls are faked
+        st.node.denv = docker.DockerClient(base_url='unix:///nonexistent')
+        st.node.denv.api.containers = FakeDockerApi().containers
+        st.node.quotactl = FakeQuota()
+
+    def tearDown(self):
+        st.watch = self.watch
+        st.time = self.time
+        st.active = self.active
+        st.container_cache = self.container_cache
+        st.node = self.node
+
+    def assertIndexes(self, snap):
+        full = Rebuild(snap.pods)
+        self.assertEqual(snap.by_class, full.by_class)
+        self.assertEqual(snap.by_ip, full.by_ip)
+        self.assertEqual(snap.containers, full.containers)
+        self.assertEqual(snap.be_keys, full.be_keys)
+        self.assertEqual(snap.hp_keys, full.hp_keys)
+        self.assertEqual(snap.be_ips, full.be_ips)
+
+    def test_snapshot_replace(self):
+        empty = st.PodSnapshot()
+        be = MakePod('be', 'BE', ['c1'])
+        snap = empty.replace('default/be', be)
+        # snapshots are never changed
+        self.assertEqual(empty.pods, {})
+        self.assertEqual(snap.be_ips, frozenset(['10.0.0.1']))
+        self.assertEqual(snap.be_keys, frozenset(['kubepods/besteffort/podbe/c1']))
+        self.assertEqual(snap.be_containers(), [(be, be.containers['c1'])])
+        # an HP pod on the same IP, e.g. with host networking
+        hp = MakePod('hp', 'HP', ['c2'])
+        snap = snap.replace('default/hp', hp)
+        self.assertEqual(set(snap.by_ip['10.0.0.1'].keys()), set(['default/be', 'default/hp']))
+        self.assertEqual(snap.hp_keys, frozenset(['kubepods/burstable/podhp/c2']))
+        self.assertIndexes(snap)
+        # container change
+        changed = be.copy()
+        changed.container_ids = set(['c3'])
+        changed.containers = {'c3': st.Container()}
+        old = snap
+        snap = snap.replace('default/be', changed)
+        self.assertEqual(snap.be_keys, frozenset(['kubepods/besteffort/podbe/c3']))
+        self.assertTrue('kubepods/besteffort/podbe/c1' in old.containers)
+        self.assertIndexes(snap)
+        # the shared IP is no longer a BE IP once the BE pod is gone
+        snap = snap.replace('default/be', None)
+        self.assertEqual(snap.be_ips, frozenset())
+        self.assertEqual(snap.by_ip.keys(), ['10.0.0.1'])
+        self.assertIndexes(snap)
+        # emptied IPs are dropped
+        snap = snap.replace('default/hp', None)
+        self.assertEqual(snap.by_ip, {})
+        self.assertEqual(snap.containers, {})
+        self.assertIndexes(snap)
+
+    def test_deltas(self):
+        active = st.ActivePods()
+        deltas = active.subscribe()
+        pod = MakePod('be', 'BE', ['c1', 'c2'])
+        active.publish('default/be', pod)
+        added, removed = deltas.get_nowait()
+        self.assertEqual(sorted([(k, c.docker_id) for k, _, c in added]),
+                         [('kubepods/besteffort/podbe/c1', 'c1'), ('kubepods/besteffort/podbe/c2', 'c2')])
+        self.assertEqual(removed, [])
+        self.assertEqual(active.be_pods, 1)
+        # only the containers that changed
+        changed = pod.copy()
+        changed.containers.pop('c1')
+        changed.container_ids.remove('c1')
+        changed.containers['c3'] = st.Container()
+        changed.container_ids.add('c3')
+        active.publish('default/be', changed)
+        added, removed = deltas.get_nowait()
+        self.assertEqual([k for k, _, _ in added], ['kubepods/besteffort/podbe/c3'])
+        self.assertEqual([(k, p) for k, p, _ in removed], [('kubepods/besteffort/podbe/c1', pod)])
+        # no container change, no delta
+        active.publish('default/be', changed.copy())
+        self.assertRaises(Queue.Empty, deltas.get_nowait)
+        active.publish('default/be', None)
+        added, removed = deltas.get_nowait()
+        self.assertEqual(added, [])
+        self.assertEqual(len(removed), 2)
+        self.assertEqual(active.be_pods, 0)
+
+    def test_sleep_on_deltas(self):
+        deltas = Queue.Queue()
+        calls = []
+        handle = lambda added, removed: calls.append((added, removed))
+        # queued changes are handled together
+        deltas.put((['a'], []))
+        deltas.put((['b'], ['c']))
+        st.SleepOnDeltas(deltas, 0.05, handle)
+        self.assertEqual(calls, [(['a', 'b'], ['c'])])
+        # without handle they are dropped
+        deltas.put((['d'], []))
+        st.SleepOnDeltas(deltas, 0.01)
+        self.assertTrue(deltas.empty())
+        self.assertEqual(len(calls), 1)
+
+    def test_list_watch(self):
+        lists = ['1', '10']
+        def func(**selectors):
+            self.assertEqual(selectors, {'field_selector': 'spec.nodeName=node-1'})
+            return Obj(metadata=Obj(resource_version=lists.pop(0)), items=[])
+        handled = []
+        def handle(event_type, obj):
+            if obj is None:
+                raise TypeError('bad pod')
+            handled.append((event_type, obj))
+        resyncs = []
+        FakeWatch.versions = []
+        FakeWatch.script = [
+            # resumes from the last resourceVersion when a watch ends
+            [Event('ADDED', '2', 'a'), Event('MODIFIED', '3', 'a')],
+            # retries with backoff on errors
+            ApiException(status=500, reason='Internal Server Error'),
+            HTTPError('connection reset'),
+            # relists on 410 Gone
+            [{'type': 'ERROR', 'object': None, 'raw_object': {'code': 410, 'message': 'too old resource version'}}],
+            # errors of handle skip the event only
+            [Event('ADDED', '11', None), Event('ADDED', '12', 'b')]]
+        self.assertRaises(Stop, st.ListWatch, 'Test', func, handle, resyncs.append, \
+                          field_selector='spec.nodeName=node-1')
+        self.assertEqual(FakeWatch.versions, ['1', '3', '3', '3', '10', '12'])
+        self.assertEqual(lists, [])
+        self.assertEqual(len(resyncs), 2)
+        self.assertEqual(handled, [('ADDED', 'a'), ('MODIFIED', 'a'), ('ADDED', 'b')])
+        self.assertEqual(st.time.sleeps, [1, 2])
+
+    def test_list_watch_gone(self):
+        # a 410 raised by the watch relists too, without backoff
+        lists = []
+        def func(**selectors):
+            lists.append(1)
+            return Obj(metadata=Obj(resource_version=str(len(lists))), items=[])
+        FakeWatch.versions = []
+        FakeWatch.script = [ApiException(status=410, reason='Gone')]
+        self.assertRaises(Stop, st.ListWatch, 'Test', func, None, lambda items: None)
+        self.assertEqual(FakeWatch.versions, ['1', '2'])
+        self.assertEqual(st.time.sleeps, [])
+
+    def test_container_cache(self):
+        api = FakeDockerApi()
+        st.node.denv.api.containers = api.containers
+        resolved = st.container_cache.resolve(['c1', 'c2', 'gone'])
+        self.assertEqual(api.calls, [['c1', 'c2', 'gone']])
+        self.assertEqual(sorted(resolved.keys()), ['c1', 'c2'])
+        self.assertEqual(resolved['c1'].name, 'k8s_c1')
+        self.assertEqual(resolved['c1'].id, 'c1')
+        # cached containers are not listed again
+        resolved = st.container_cache.resolve(['c1', 'c3'])
+        self.assertEqual(api.calls[1:], [['c3']])
+        self.assertEqual(sorted(resolved.keys()), ['c1', 'c3'])
+        st.container_cache.forget(['c1'])
+        st.container_cache.resolve(['c1'])
+        self.assertEqual(api.calls[2:], [['c1']])
+
+    def test_resolve_pending(self):
+        api = FakeDockerApi()
+        st.node.denv.api.containers = api.containers
+        st.PodEvent('ADDED', K8SPod('a', 'uid-a', ['a1']))
+        st.PodEvent('ADDED', K8SPod('b', 'uid-b', ['b1']))
+        # only the latest event of each pod is kept
+        st.PodEvent('MODIFIED', K8SPod('a', 'uid-a', ['a1', 'a2']))
+        st.PodEvent('MODIFIED', K8SPod('b', 'uid-b', ['b1', 'b2']))
+        self.assertEqual(len(st.active.pending), 2)
+        self.assertEqual(st.ContainerIds(st.active.pending['default/a']), set(['a1', 'a2']))
+        # pod b is recreated before its event is resolved
+        st.PodEvent('MODIFIED', K8SPod('c', 'uid-c', ['c1']))
+        st.active.pending['default/b'] = K8SPod('b', 'uid-old', ['b1', 'b2'])
+        st.ResolvePending(1000)
+        # one docker call for all pods
+        self.assertEqual(api.calls, [['a1', 'a2', 'b1', 'b2', 'c1']])
+        self.assertEqual(st.active.pending, {})
+        self.assertEqual(st.active.pods['default/a'].container_ids, set(['a1', 'a2']))
+        self.assertEqual(st.active.pods['default/a'].containers['a2'].docker_name, 'k8s_a2')
+        self.assertEqual(st.active.pods['default/b'].container_ids, set())
+        self.assertEqual(st.active.pods['default/c'].container_ids, set(['c1']))
+
+    def test_pod_replaced(self):
+        st.PodEvent('ADDED', K8SPod('a', 'uid-a', ['a1']))
+        st.ResolvePending(1000)
+        self.assertEqual(st.active.pods['default/a'].container_ids, set(['a1']))
+        # the same name with a new uid is a new pod
+        st.PodEvent('MODIFIED', K8SPod('a', 'uid-new', ['a2']))
+        self.assertEqual(st.active.pods['default/a'].uid, 'uid-new')
+        self.assertEqual(st.active.pods['default/a'].container_ids, set())
+        st.ResolvePending(1000)
+        self.assertEqual(st.active.pods['default/a'].container_ids, set(['a2']))
+        st.PodEvent('DELETED', K8SPod('a', 'uid-new', ['a2']))
+        self.assertEqual(st.active.pods, {})
+
+    def test_pod_completed(self):
+        done = K8SPod('a', 'uid-a', ['a1'], phase='Succeeded')
+        # completed pods are not tracked, from an event or a list
+        st.PodEvent('ADDED', done)
+        self.assertEqual(st.active.pods, {})
+        self.assertEqual(st.active.pending, {})
+        st.node.name = 'node-1'
+        st.node.kenv = Obj(list_pod_for_all_namespaces=lambda **selectors: \
+                           Obj(metadata=Obj(resource_version='1'), items=[done, K8SPod('b', 'uid-b', ['b1'])]))
+        FakeWatch.script = []
+        self.assertRaises(Stop, st.K8SWatch)
+        self.assertEqual(st.active.pods.keys(), ['default/b'])
+        self.assertEqual(st.active.be_pods, 1)
+        self.assertEqual(st.active.snapshot.be_ips, frozenset(['10.0.0.1']))
+        # a tracked pod that completes is deleted
+        st.PodEvent('MODIFIED', K8SPod('b', 'uid-b', ['b1']))
+        st.PodEvent('MODIFIED', K8SPod('b', 'uid-b', ['b1'], phase='Failed'))
+        self.assertEqual(st.active.pods, {})
+        self.assertEqual(st.active.pending, {})
+        self.assertEqual(st.active.snapshot.be_ips, set())
+
+    def test_pod_event_error(self):
+        # a failed update does not keep the pods write locked
+        bad = K8SPod('a', 'uid-a', ['a1'])
+        bad.status.qos_class = None
+        self.assertRaises(AttributeError, st.PodEvent, 'ADDED', bad)
+        self.assertTrue(st.active.update_lock.acquire_write(timeout=0.1))
+        st.active.update_lock.release_write()
+
+if __name__ == '__main__':
+    unittest.main()
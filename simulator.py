@@ -0,0 +1,269 @@
+"""
+Trace-driven offline simulator for the controllers
+
+Replays recorded traces through the quota policy and the net and blkio limit
+calculations, with fake actuators and no sleeping, and reports:
+ - convergence time: time until the BE quota stays within 5% of its final value
+ - SLO violation seconds: time with simulated slack below 0
+ - BE CPU-seconds granted: integral of the aggregate BE quota, in cores
+ - oscillations: number of grow/shrink direction changes
+
+Traces are CSV (with a header) or JSONL files with one record per cycle, using
+the field names of the cpu_quota, net and blkio measurements written by the
+controllers (slack, latency, cpu_usage, be_quota, be_pods, hp_egress_bw,
+hp_ingress_bw, hp_rd_iops, hp_wr_iops, ...). An optional time field, in
+seconds or HH:MM:SS, gives the time of each record; otherwise records are one
+quota period apart.
+
+Current assumptions:
+ - Slack and CPU load respond linearly to BE quota beyond the recorded one
+   (--interference, --be-utilization). Without a recorded be_quota, the
+   trace is replayed open-loop.
+ - Disabled BE pods come back --restart seconds after BE is enabled again
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import csv
+import json
+import time
+import argparse
+import itertools
+
+# hyperpilot imports
+import policy
+import netclass
+import blkioclass
+
+def ReadTrace(path):
+  """ Reads a CSV or JSONL trace into a list of dicts with numeric values
+  """
+  records = []
+  with open(path) as _:
+    if path.endswith('.jsonl') or path.endswith('.json'):
+      rows = [json.loads(line) for line in _ if line.strip()]
+    else:
+      rows = list(csv.DictReader(_))
+  for row in rows:
+    record = {}
+    for key, value in row.items():
+      try:
+        record[key] = float(value)
+      except (TypeError, ValueError):
+        record[key] = value
+    records.append(record)
+  return records
+
+
+def TraceTimes(records, period):
+  """ Returns the time of each record in seconds from the start of the trace
+  """
+  times = []
+  for i, record in enumerate(records):
+    t = record.get('time')
+    if isinstance(t, basestring) and t.count(':') == 2:
+      h, m, s = t.split(':')
+      t = int(h) * 3600 + int(m) * 60 + float(s)
+    if not isinstance(t, float):
+      t = i * period
+    # wrap around midnight for HH:MM:SS times
+    while times and t < times[-1]:
+      t += 24 * 3600
+    times.append(t)
+  return [_ - times[0] for _ in times]
+
+
+class FakeQuota(object):
+  """Fake quota actuator, tracks BE containers and their quotas the way maincontrol does.
+     In aggregate quota mode, a single quota covers all BE pods.
+  """
+  def __init__(self, cpu, params, be_pods, restart_s):
+    self.capacity = cpu * 100000
+    self.min_quota = int(self.capacity * params['min_be_quota'])
+    self.max_quota = int(self.capacity * params['max_be_quota'])
+    self.groups = 1 if params.get('quota_mode') == 'aggregate' else be_pods
+    self.restart_s = restart_s
+    self.quotas = [self.min_quota] * self.groups
+    self.return_at = None
+
+
+  def tick(self, now):
+    """ Brings disabled BE pods back once they are rescheduled
+    """
+    if self.return_at is not None and now >= self.return_at:
+      self.quotas = [self.min_quota] * self.groups
+      self.return_at = None
+
+
+  def apply(self, action, rate, now):
+    if action == "disable_be":
+      self.quotas = []
+    elif action == "enable_be" and not self.quotas and self.return_at is None:
+      self.return_at = now + self.restart_s
+    elif action == "reset_be":
+      self.quotas = [self.min_quota] * len(self.quotas)
+    elif action in ["grow_be", "shrink_be"]:
+      self.quotas = [min(max(int(rate * q), self.min_quota), self.max_quota) for q in self.quotas]
+
+
+  def share(self):
+    """ Aggregate BE quota as a share of the node
+    """
+    return sum(self.quotas) / float(self.capacity)
+
+
+def Simulate(records, times, params, args):
+  """ Runs one replay, returns the metrics
+  """
+  qc = params['quota_controller']
+  netst = params['net_controller']
+  blkst = params['blkio_controller']
+  quota_policy = policy.MakePolicy(qc)
+  be_pods = int(records[0].get('be_pods', args.be_pods)) or args.be_pods
+  quota = FakeQuota(args.cpu, qc, be_pods, args.restart)
+
+  violation_s = 0.0
+  be_cpu_s = 0.0
+  oscillations = 0
+  last_direction = None
+  shares = []
+  net_mbit = [0.0, 0.0]
+  blkio_iops = [0.0, 0.0]
+  for i, record in enumerate(records):
+    now = times[i]
+    dt = (times[i + 1] - now) if i + 1 < len(times) else qc['period']
+    quota.tick(now)
+    share = quota.share()
+
+    # plant model: extra BE quota beyond the recorded one costs slack and adds load
+    delta = 0.0
+    if 'be_quota' in record:
+      delta = share - record['be_quota'] / float(quota.capacity)
+    slack = record.get('slack', 0.0) - args.interference * delta
+    cpu_usage = min(max(record.get('cpu_usage', 0.0) + 100 * args.be_utilization * delta, 0.0), 100.0)
+
+    state = {
+        "slack": slack,
+        "cpu_usage": cpu_usage,
+        "be_pods": be_pods if quota.quotas else 0,
+        "be_quota": sum(quota.quotas),
+        "now": now
+    }
+    action, rate = quota_policy.decide(state)
+    quota.apply(action, rate, now)
+    if action in ["grow_be", "shrink_be"]:
+      if last_direction is not None and action != last_direction:
+        oscillations += 1
+      last_direction = action
+
+    if slack < 0:
+      violation_s += dt
+    be_cpu_s += quota.share() * args.cpu * dt
+    shares.append((now, quota.share()))
+
+    # net and blkio limits for the recorded HP usage
+    if 'hp_egress_bw' in record:
+      net_mbit[0] += dt * netclass.NetClass.beBwLimit(netst['max_bw_mbps'], record['hp_egress_bw'], \
+                                                      netst['default_limit_mbps'])
+    if 'hp_ingress_bw' in record:
+      net_mbit[1] += dt * netclass.NetClass.beBwLimit(netst['max_bw_mbps'], record['hp_ingress_bw'], \
+                                                      netst['default_limit_mbps'])
+    if 'hp_rd_iops' in record:
+      blkio_iops[0] += dt * blkioclass.BlkioClass.beIopsLimit(blkst['max_rd_iops'], record['hp_rd_iops'])
+    if 'hp_wr_iops' in record:
+      blkio_iops[1] += dt * blkioclass.BlkioClass.beIopsLimit(blkst['max_wr_iops'], record['hp_wr_iops'])
+
+    if args.speed > 0:
+      time.sleep(dt / args.speed)
+
+  # convergence: last time the BE quota was outside 5% of its final value
+  final = shares[-1][1]
+  convergence_s = 0.0
+  for now, share in shares:
+    if abs(share - final) > 0.05 * max(final, 1E-9):
+      convergence_s = now
+  duration = max(times[-1] + qc['period'], 1E-9)
+  return {
+      "convergence_s": convergence_s,
+      "slo_violation_s": violation_s,
+      "be_cpu_s": be_cpu_s,
+      "oscillations": oscillations,
+      "be_egress_limit": net_mbit[0] / duration,
+      "be_ingress_limit": net_mbit[1] / duration,
+      "be_rd_limit": blkio_iops[0] / duration,
+      "be_wr_limit": blkio_iops[1] / duration,
+  }
+
+
+def Floats(text):
+  return [float(_) for _ in text.split(',')]
+
+
+def ParseArgs():
+  """ parse arguments
+  """
+  parser = argparse.ArgumentParser(description="Replays traces through the controllers' decision logic")
+  parser.add_argument("traces", nargs='+', help="trace files (.csv or .jsonl)")
+  parser.add_argument("-c", "--config", type=str, default="config.json", help="configuration file (JSON)")
+  parser.add_argument("--policy", type=str, default=None, help="comma separated quota policies to sweep")
+  parser.add_argument("--growth", type=Floats, default=None, help="comma separated BE_growth_ratio values to sweep")
+  parser.add_argument("--shrink", type=Floats, default=None, help="comma separated BE_shrink_ratio values to sweep")
+  parser.add_argument("--quota-mode", type=str, default=None, help="comma separated quota modes to sweep")
+  parser.add_argument("--cpu", type=int, default=8, help="node cores")
+  parser.add_argument("--be-pods", type=int, default=4, help="BE pods, if the trace does not record them")
+  parser.add_argument("--interference", type=float, default=1.0,
+                      help="slack lost per node worth of BE quota beyond the recorded one")
+  parser.add_argument("--be-utilization", type=float, default=1.0, help="share of their quota BE pods use")
+  parser.add_argument("--restart", type=float, default=30.0, help="seconds for BE pods to return after enable")
+  parser.add_argument("--speed", type=float, default=0.0, help="replay speed-up, 0 for no sleeping")
+  parser.add_argument("-o", "--out", type=str, default=None, help="write results as CSV")
+  return parser.parse_args()
+
+
+COLUMNS = ["trace", "policy", "quota_mode", "BE_growth_ratio", "BE_shrink_ratio", "convergence_s", "slo_violation_s", \
+           "be_cpu_s", "oscillations", "be_egress_limit", "be_ingress_limit", "be_rd_limit", "be_wr_limit"]
+
+def __init__():
+  args = ParseArgs()
+  with open(args.config) as _:
+    params = json.load(_)
+  qc = params['quota_controller']
+  policies = args.policy.split(',') if args.policy else [qc.get('policy', 'heracles')]
+  growths = args.growth or [qc['BE_growth_ratio']]
+  shrinks = args.shrink or [qc['BE_shrink_ratio']]
+  modes = args.quota_mode.split(',') if args.quota_mode else [qc.get('quota_mode', 'container')]
+
+  results = []
+  for path in args.traces:
+    records = ReadTrace(path)
+    if not records:
+      print "Sim:WARNING: Empty trace %s" % path
+      continue
+    times = TraceTimes(records, qc['period'])
+    for name, mode, growth, shrink in itertools.product(policies, modes, growths, shrinks):
+      run = json.loads(json.dumps(params))
+      run['quota_controller'].update({'policy': name, 'quota_mode': mode, \
+                                      'BE_growth_ratio': growth, 'BE_shrink_ratio': shrink})
+      result = Simulate(records, times, run, args)
+      result.update({"trace": path, "policy": name, "quota_mode": mode, \
+                     "BE_growth_ratio": growth, "BE_shrink_ratio": shrink})
+      results.append(result)
+
+  print "%-20s %-10s %-9s %6s %6s %10s %10s %10s %5s" \
+        % ("trace", "policy", "mode", "growth", "shrink", "converge_s", "violate_s", "be_cpu_s", "osc")
+  for _ in results:
+    print "%-20s %-10s %-9s %6.2f %6.2f %10.1f %10.1f %10.1f %5d" \
+          % (_["trace"][-20:], _["policy"], _["quota_mode"], _["BE_growth_ratio"], _["BE_shrink_ratio"], \
+             _["convergence_s"], _["slo_violation_s"], _["be_cpu_s"], _["oscillations"])
+  if args.out:
+    with open(args.out, 'w') as _:
+      writer = csv.DictWriter(_, COLUMNS)
+      writer.writeheader()
+      for result in results:
+        writer.writerow(result)
+
+if __name__ == '__main__':
+  __init__()
@@ -0,0 +1,45 @@
+import json
+import unittest
+import simulator as sim
+
+def Params():
+    with open('config.json') as _:
+        return json.load(_)
+
+class Args(object):
+    cpu = 8
+    be_pods = 2
+    interference = 1.0
+    be_utilization = 1.0
+    restart = 4.0
+    speed = 0.0
+
+class TestSimulatorMethods(unittest.TestCase):
+    def test_times(self):
+        records = [{'time': '23:59:58'}, {'time': '23:59:59'}, {'time': '00:00:01'}]
+        self.assertEqual(sim.TraceTimes(records, 2.0), [0.0, 1.0, 3.0])
+        self.assertEqual(sim.TraceTimes([{}, {}, {}], 2.0), [0.0, 2.0, 4.0])
+
+    def test_fake_quota(self):
+        q = sim.FakeQuota(8, Params()['quota_controller'], 2, 4.0)
+        q.apply('grow_be', 2.0, 0.0)
+        self.assertEqual(q.quotas, [2 * q.min_quota] * 2)
+        q.apply('disable_be', None, 2.0)
+        self.assertEqual(q.share(), 0.0)
+        q.apply('enable_be', None, 4.0)
+        q.tick(6.0)
+        self.assertEqual(q.quotas, [])
+        q.tick(8.0)
+        self.assertEqual(q.quotas, [q.min_quota] * 2)
+
+    def test_simulate(self):
+        # slack stays high, so the heracles ladder only grows BE quota
+        records = [{'slack': 0.9, 'cpu_usage': 10.0} for _ in range(50)]
+        times = sim.TraceTimes(records, 2.0)
+        result = sim.Simulate(records, times, Params(), Args())
+        self.assertEqual(result['oscillations'], 0)
+        self.assertEqual(result['slo_violation_s'], 0.0)
+        self.assertGreater(result['be_cpu_s'], 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,3 +22,19 @@ class InfluxWriter(object):
             }])
         except InfluxDBClientError as e:
             print("Store:ERROR: Error writing to influx: " + str(e))
+
+    def write_tagged(self, time, hostname, controller, points):
+        """ Writes [(tags, data)] points of a measurement in one request,
+            e.g. one per pod, so names are tag values rather than field keys
+        """
+        if not points:
+            return
+        try:
+            self.client.write_points([{
+                "time": time,
+                "tags": dict(tags, hostname=hostname),
+                "measurement": controller,
+                "fields": data,
+            } for tags, data in points])
+        except InfluxDBClientError as e:
+            print("Store:ERROR: Error writing to influx: " + str(e))
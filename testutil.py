@@ -0,0 +1,38 @@
+""" Fixtures shared by the unit tests of the controller modules
+    Import before settings: settings opens the InfluxDB writer on import.
+"""
+import sys
+import types
+store = types.ModuleType('store')
+store.InfluxWriter = object
+sys.modules['store'] = store
+import settings as st
+
+class Obj(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def MakePod(name, wclass, cids, quota=0, ip='10.0.0.1', uid=None):
+    """ An active pod with its containers, as built by the K8S watch
+    """
+    pod = st.Pod()
+    pod.name = name
+    pod.namespace = 'default'
+    pod.uid = uid or name
+    pod.qosclass = 'besteffort' if wclass == 'BE' else 'burstable'
+    pod.wclass = wclass
+    pod.ipaddress = ip
+    for cid in cids:
+        cont = st.Container()
+        cont.docker_id = cid
+        cont.quota = quota
+        pod.container_ids.add(cid)
+        pod.containers[cid] = cont
+    return pod
+
+def K8SPod(name, uid, cids, wclass='BE', phase='Running'):
+    """ A pod of the K8S API, with the fields the K8S watch reads
+    """
+    return Obj(metadata=Obj(name=name, namespace='default', uid=uid, labels={'hyperpilot.io/wclass': wclass}),
+               status=Obj(phase=phase, pod_ip='10.0.0.1', qos_class='BestEffort',
+                          container_statuses=[Obj(container_id='docker://' + _) for _ in cids]))
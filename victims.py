@@ -0,0 +1,105 @@
+"""
+BE victim selection
+
+Current assumptions:
+ - Usage is tracked per container (cpu_percent, iops) and per pod (net_mbps)
+ - net_mbps is only measured with per pod net classes (net_controller
+   per_pod_classes), otherwise it is 0 and network usage does not rank pods
+ - Lower hyperpilot.io/be-priority values are penalized first
+
+"""
+
+__author__ = "Christos Kozyrakis"
+__email__ = "christos@hyperpilot.io"
+__copyright__ = "Copyright 2017, HyperPilot Inc"
+
+import time
+
+RESOURCES = ['cpu', 'io', 'net']
+
+def PodUsage(pod):
+  """ Returns {resource: usage} of a pod
+  """
+  usage = {'cpu': 0.0, 'io': 0.0, 'net': float(pod.net_mbps)}
+  for _, cont in pod.containers.items():
+    usage['cpu'] += cont.cpu_percent
+    usage['io'] += cont.iops
+  return usage
+
+
+class VictimSelector(object):
+  """This class ranks BE pods by how much they interfere and picks the fewest offenders.
+
+     A pod's score is its weighted share of the BE usage of each resource, so
+     the scores of all BE pods add up to 1. Pods are ranked by priority first
+     (lowest first), then by score (heaviest first), and victims are taken
+     from the top until their scores cover the share of BE usage to remove.
+
+     Eviction times come from clock, in seconds; it should be monotonic.
+  """
+  def __init__(self, weights=None, evict_share=0.5, grace_s=4.0, escalation_s=20.0, clock=time.time):
+    self.weights = weights or {'cpu': 1.0, 'io': 0.5, 'net': 0.5}
+    self.evict_share = evict_share
+    self.grace_s = grace_s
+    self.escalation_s = escalation_s
+    self.clock = clock
+    self.last_eviction = None
+
+
+  def rank(self, pods):
+    """ Returns [(pod, score)] of BE pods, first victim first
+    """
+    usage = [(_, PodUsage(_)) for _ in pods]
+    totals = {}
+    for r in RESOURCES:
+      totals[r] = sum([u[r] for _, u in usage])
+    weight = sum([self.weights.get(r, 0.0) for r in RESOURCES if totals[r] > 0])
+
+    ranked = []
+    for pod, u in usage:
+      score = 0.0
+      if weight > 0:
+        for r in RESOURCES:
+          if totals[r] > 0:
+            score += self.weights.get(r, 0.0) * u[r] / totals[r]
+        score /= weight
+      ranked.append((pod, score))
+    ranked.sort(key=lambda _: (_[0].priority, -_[1]))
+    return ranked
+
+
+  def select(self, pods, share):
+    """ Returns the fewest top ranked pods that cover share (0-1.0) of BE usage
+        at least one pod if there are any
+    """
+    victims = []
+    covered = 0.0
+    for pod, score in self.rank(pods):
+      if victims and covered >= share:
+        break
+      victims.append(pod)
+      covered += score
+    return victims
+
+
+  def evict(self, pods):
+    """ Returns the pods to evict when slack is lost, and records the eviction
+    """
+    self.last_eviction = self.clock()
+    return self.select(pods, self.evict_share)
+
+
+  def onSlackLoss(self):
+    """ Picks the response to a disable-level slack loss:
+        "evict" the top victims, "wait" for a recent eviction to take effect,
+        or "disable" all BE if slack is still lost after grace_s from a
+        selective eviction (but within escalation_s of it)
+    """
+    if self.last_eviction is None:
+      return "evict"
+    elapsed = self.clock() - self.last_eviction
+    if elapsed < self.grace_s:
+      return "wait"
+    if elapsed < self.escalation_s:
+      return "disable"
+    return "evict"
@@ -0,0 +1,53 @@
+import unittest
+import victims as vs
+
+class Cont(object):
+    def __init__(self, cpu, iops):
+        self.cpu_percent = cpu
+        self.iops = iops
+
+class Pod(object):
+    def __init__(self, name, cpu, iops=0, net=0, priority=0):
+        self.name = name
+        self.priority = priority
+        self.net_mbps = net
+        self.containers = {name: Cont(cpu, iops)}
+
+class TestVictimsMethods(unittest.TestCase):
+    def test_rank(self):
+        pods = [Pod('a', 10.0), Pod('b', 60.0), Pod('c', 30.0)]
+        ranked = vs.VictimSelector({'cpu': 1.0}).rank(pods)
+        self.assertEqual([p.name for p, _ in ranked], ['b', 'c', 'a'])
+        self.assertAlmostEqual(sum([s for _, s in ranked]), 1.0)
+        # lower priority goes first, whatever its usage
+        pods[0].priority = -1
+        ranked = vs.VictimSelector({'cpu': 1.0}).rank(pods)
+        self.assertEqual([p.name for p, _ in ranked], ['a', 'b', 'c'])
+
+    def test_select(self):
+        pods = [Pod('a', 10.0, iops=0), Pod('b', 10.0, iops=100), Pod('c', 80.0, iops=0)]
+        selector = vs.VictimSelector({'cpu': 1.0, 'io': 1.0})
+        self.assertEqual([p.name for p in selector.select(pods, 0.3)], ['b'])
+        self.assertEqual([p.name for p in selector.select(pods, 0.6)], ['b', 'c'])
+        self.assertEqual([p.name for p in selector.select(pods, 0.0)], ['b'])
+        self.assertEqual(selector.select([], 0.5), [])
+
+    def test_escalation(self):
+        selector = vs.VictimSelector(grace_s=0.0, escalation_s=60.0)
+        self.assertEqual(selector.onSlackLoss(), 'evict')
+        selector.evict([Pod('a', 1.0)])
+        self.assertEqual(selector.onSlackLoss(), 'disable')
+        selector.grace_s = 60.0
+        self.assertEqual(selector.onSlackLoss(), 'wait')
+
+    def test_escalation_clock(self):
+        now = [100.0]
+        selector = vs.VictimSelector(grace_s=4.0, escalation_s=20.0, clock=lambda: now[0])
+        selector.evict([Pod('a', 1.0)])
+        now[0] += 5.0
+        self.assertEqual(selector.onSlackLoss(), 'disable')
+        now[0] += 20.0
+        self.assertEqual(selector.onSlackLoss(), 'evict')
+
+if __name__ == '__main__':
+        unittest.main()